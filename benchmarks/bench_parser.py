@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Compare the per-line and bulk metrics parsers on synthetic VBoxManage output."""
+
+import argparse
+import os
+import sys
+import timeit
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+from synthetic import synthetic_host
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--vms', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    engines = {
+        "lines": vboxmanagemetrics.parse_metrics_lines,
+        "bulk": vboxmanagemetrics.parse_metrics_bulk,
+    }
+    for vm_count in args.vms:
+        _, vm_info, output = synthetic_host(vm_count)
+        results = {}
+        for name, engine in engines.items():
+            metrics = []
+            engine(output, metrics, vm_info)
+            results[name] = metrics
+            # Best of N runs with a warm series key cache
+            seconds = min(timeit.repeat(lambda: engine(output, [], vm_info),
+                                        number=1, repeat=args.repeat))
+            print(f"{vm_count:>6} VMs  {len(metrics):>7} lines  {name:<5}  {seconds * 1000:9.2f} ms")
+        if results["bulk"] != results["lines"]:
+            sys.exit(f"Parser outputs differ for {vm_count} VMs")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Benchmark the parse and render path on synthetic hosts and flag regressions.
+
+Each run measures per-call latency, line throughput and peak allocations for
+normalize_metric_name, parse_value, process_metric_line and get_metrics() at
+several host sizes. Results are written to a JSON file; when that file already
+exists the new results are compared against it first.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+from synthetic import synthetic_host
+
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.json')
+
+def measure(func, repeat):
+    """Return the best wall time of func over repeat runs and its peak allocation."""
+    func()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def bench_host(vm_count, repeat):
+    """Run every benchmark for one synthetic host size."""
+    _, vm_info, output = synthetic_host(vm_count)
+    lines = output.decode().strip().split('\n')
+    parts = [line.split(None, 2) for line in lines[1:]]
+    metric_names = [metric_name for _, metric_name, _ in parts]
+    values = [value for _, _, value in parts]
+
+    def run_normalize():
+        for metric_name in metric_names:
+            vboxmanagemetrics.normalize_metric_name(metric_name)
+
+    def run_parse_value():
+        for value in values:
+            vboxmanagemetrics.parse_value(value)
+
+    def run_process_metric_line():
+        metrics = []
+        for line in lines:
+            vboxmanagemetrics.process_metric_line(line, metrics, vm_info)
+
+    backend = vboxmanagemetrics.FakeBackend(vm_info, output)
+
+    def run_get_metrics():
+        vboxmanagemetrics.get_metrics()
+
+    def run_get_metrics_cold():
+        vboxmanagemetrics.VM_INVENTORY.invalidate()
+        vboxmanagemetrics.SERIES_KEYS.clear()
+        vboxmanagemetrics.get_metrics()
+
+    cases = {
+        "normalize_metric_name": (run_normalize, len(metric_names)),
+        "parse_value": (run_parse_value, len(values)),
+        "process_metric_line": (run_process_metric_line, len(lines)),
+        "get_metrics": (run_get_metrics, len(lines)),
+        "get_metrics_cold": (run_get_metrics_cold, len(lines)),
+    }
+
+    original_backend = vboxmanagemetrics.BACKEND
+    vboxmanagemetrics.BACKEND = backend
+    vboxmanagemetrics.VM_INVENTORY.invalidate()
+    vboxmanagemetrics.SERIES_KEYS.clear()
+    results = {}
+    try:
+        for name, (func, items) in cases.items():
+            seconds, peak = measure(func, repeat)
+            results[f"{name}[{vm_count}]"] = {
+                "seconds": seconds,
+                "items_per_second": items / seconds if seconds else 0.0,
+                "peak_bytes": peak,
+            }
+    finally:
+        vboxmanagemetrics.BACKEND = original_backend
+    return results
+
+def compare_results(baseline, current, threshold):
+    """Return a message for every benchmark that got slower or bigger than threshold allows."""
+    regressions = []
+    for name, result in current.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for field in ("seconds", "peak_bytes"):
+            if previous[field] and result[field] > previous[field] * (1 + threshold):
+                change = (result[field] / previous[field] - 1) * 100
+                regressions.append(f"{name} {field}: {previous[field]:.6g} -> {result[field]:.6g} (+{change:.0f}%)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vms', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark (best is kept)')
+    parser.add_argument('--results', default=DEFAULT_RESULTS, help='JSON file to compare against and update')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown or allocation growth before a regression is reported')
+    parser.add_argument('--no-save', action='store_true', help='Do not overwrite the results file')
+    args = parser.parse_args()
+
+    current = {}
+    for vm_count in args.vms:
+        for name, result in bench_host(vm_count, args.repeat).items():
+            current[name] = result
+            print(f"{name:<28} {result['seconds'] * 1000:10.3f} ms  "
+                  f"{result['items_per_second']:14,.0f} /s  {result['peak_bytes'] / 1024:10.1f} KiB")
+
+    regressions = []
+    if os.path.exists(args.results):
+        with open(args.results) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_results(baseline, current, args.threshold)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+
+    if not args.no_save:
+        with open(args.results, 'w') as f:
+            json.dump({"python": platform.python_version(), "timestamp": time.time(),
+                       "results": current}, f, indent=2)
+            f.write('\n')
+
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Load-test the running exporter against a fake VBoxManage.
+
+A fake VBoxManage executable serving synthetic output with configurable
+latency is put first on PATH, the real exporter process is started in each
+serving mode, and N concurrent scrapers hit /metrics. Throughput and
+p50/p95/p99 latency are reported per mode so modes can be compared.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from synthetic import synthetic_host
+
+EXPORTER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'vboxmanagemetrics.py'))
+
+# Exporter arguments for each serving mode
+MODES = {
+    "on-demand": [],
+    "stream": ["--stream"],
+    "collector": ["--collect-interval", "5"],
+    "stdlib": ["--server", "stdlib"],
+    "waitress": ["--server", "waitress", "--threads", "16"],
+    "waitress-collector": ["--server", "waitress", "--threads", "16", "--collect-interval", "5"],
+    "gunicorn-collector": ["--server", "gunicorn", "--workers", "4", "--collect-interval", "5"],
+    "gunicorn-shared": ["--server", "gunicorn", "--workers", "4", "--collect-interval", "5",
+                        "--shared-snapshot"],
+}
+
+FAKE_VBOXMANAGE = '''#!{python}
+import os, sys, time
+FIXTURES = {fixtures!r}
+time.sleep(float(os.environ.get("FAKE_VBOXMANAGE_LATENCY", "{latency}")))
+args = sys.argv[1:]
+with open(os.path.join(FIXTURES, "calls.log"), "a") as log:
+    log.write(" ".join(args[:1]) + "\\n")
+if args[:2] == ["metrics", "setup"]:
+    sys.exit(0)
+if args[:1] == ["showvminfo"] and len(args) > 1:
+    with open(os.path.join(FIXTURES, "list-vms.txt")) as f:
+        for line in f:
+            if '"' not in line:
+                continue
+            name, uuid = line.split('"')[1], line.split("{{")[1].split("}}")[0]
+            if args[1] in (name, uuid):
+                print(f'name="{{name}}"\\nUUID="{{uuid}}"\\nVMState="running"\\nostype="Ubuntu_64"\\n'
+                      f'groups="/"\\ncpus=2\\nmemory=2048')
+                sys.exit(0)
+    sys.exit(1)
+path = os.path.join(FIXTURES, "-".join(args[:2]) + ".txt")
+if not os.path.exists(path):
+    sys.exit(1)
+with open(path, "rb") as f:
+    sys.stdout.buffer.write(f.read())
+'''
+
+def write_fake_vboxmanage(directory, vm_count, latency=0.0, seed=0):
+    """Write synthetic fixtures and a VBoxManage script replaying them into directory."""
+    list_output, _, metrics_output = synthetic_host(vm_count, seed)
+    with open(os.path.join(directory, "list-vms.txt"), "wb") as f:
+        f.write(list_output)
+    with open(os.path.join(directory, "metrics-query.txt"), "wb") as f:
+        f.write(metrics_output)
+    path = os.path.join(directory, "VBoxManage")
+    with open(path, "w") as f:
+        f.write(FAKE_VBOXMANAGE.format(python=sys.executable, fixtures=directory, latency=latency))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_exporter(fake_dir, args, port, timeout=30):
+    """Start the exporter with the fake VBoxManage on PATH and wait until /metrics answers."""
+    env = dict(os.environ, PATH=fake_dir + os.pathsep + os.environ.get("PATH", ""))
+    proc = subprocess.Popen([sys.executable, EXPORTER, "--port", str(port), *args], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"exporter exited with status {proc.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+            connection.request("GET", "/metrics")
+            connection.getresponse().read()
+            connection.close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    stop_exporter(proc)
+    raise RuntimeError("exporter did not start in time")
+
+def stop_exporter(proc):
+    proc.terminate()
+    try:
+        proc.wait(5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def run_scrapers(port, concurrency, requests, headers=None, timeout=60):
+    """Run concurrency scrapers each sending requests GET /metrics over a keep-alive connection."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def scrape():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+        mine = []
+        failed = 0
+        for _ in range(requests):
+            start = time.perf_counter()
+            try:
+                connection.request("GET", "/metrics", headers=headers or {})
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+                continue
+            mine.append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=scrape) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+    }
+
+def count_calls(fake_dir):
+    """Number of fake VBoxManage invocations logged so far."""
+    try:
+        with open(os.path.join(fake_dir, "calls.log")) as f:
+            return sum(1 for _ in f)
+    except FileNotFoundError:
+        return 0
+
+def run_mode(fake_dir, mode_args, concurrency, requests, headers=None):
+    """Start the exporter in one mode, load it and stop it again."""
+    port = free_port()
+    calls = count_calls(fake_dir)
+    proc = start_exporter(fake_dir, mode_args, port)
+    try:
+        result = run_scrapers(port, concurrency, requests, headers)
+    finally:
+        stop_exporter(proc)
+    result["vboxmanage_calls"] = count_calls(fake_dir) - calls
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vms', type=int, default=100, help='VMs on the synthetic host')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds every fake VBoxManage call sleeps')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent scrapers')
+    parser.add_argument('--requests', type=int, default=25, help='Requests sent by each scraper')
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=list(MODES))
+    parser.add_argument('--gzip', action='store_true', help='Scrape with Accept-Encoding: gzip')
+    parser.add_argument('--json', metavar='FILE', help='Also write the results to a JSON file')
+    args = parser.parse_args()
+
+    headers = {"Accept-Encoding": "gzip"} if args.gzip else None
+    results = {}
+    with tempfile.TemporaryDirectory() as fake_dir:
+        write_fake_vboxmanage(fake_dir, args.vms, args.latency)
+        print(f"{'mode':<20} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'VBoxManage':>11}")
+        for mode in args.modes:
+            result = run_mode(fake_dir, MODES[mode], args.concurrency, args.requests, headers)
+            results[mode] = result
+            print(f"{mode:<20} {result['throughput']:9.1f} {result['p50'] * 1000:9.1f} "
+                  f"{result['p95'] * 1000:9.1f} {result['p99'] * 1000:9.1f} {result['errors']:7d} "
+                  f"{result['vboxmanage_calls']:11d}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"vms": args.vms, "latency": args.latency, "concurrency": args.concurrency,
+                       "requests": args.requests, "results": results}, f, indent=2)
+            f.write('\n')
+
+if __name__ == '__main__':
+    main()
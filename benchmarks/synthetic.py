@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Generate realistic VBoxManage list vms and metrics query output for benchmarks."""
+
+import random
+import uuid
+
+HOST_METRICS = [
+    ("CPU/Load/User", "{:.2f}%"),
+    ("CPU/Load/Kernel", "{:.2f}%"),
+    ("CPU/Load/Idle", "{:.2f}%"),
+    ("CPU/MHz", "{} MHz"),
+    ("CPU/Cores", "{}"),
+    ("RAM/Usage/Total", "{} kB"),
+    ("RAM/Usage/Used", "{} kB"),
+    ("RAM/Usage/Free", "{} kB"),
+    ("RAM/VMM/Used", "{} kB"),
+    ("RAM/VMM/Free", "{} kB"),
+    ("RAM/VMM/Ballooned", "{} kB"),
+    ("RAM/VMM/Shared", "{} kB"),
+]
+
+HOST_NET_METRICS = [
+    ("LinkSpeed", "{} mbit/s"),
+    ("Load/Rx", "{:.2f}%"),
+    ("Load/Tx", "{:.2f}%"),
+]
+
+HOST_DISK_METRICS = [
+    ("Usage/Total", "{} MB"),
+    ("Load/Util", "{:.2f}%"),
+]
+
+HOST_FS_METRICS = [
+    ("Usage/Total", "{} MB"),
+    ("Usage/Used", "{} MB"),
+    ("Usage/Free", "{} MB"),
+]
+
+VM_METRICS = [
+    ("CPU/Load/User", "{:.2f}%"),
+    ("CPU/Load/Kernel", "{:.2f}%"),
+    ("RAM/Usage/Used", "{} kB"),
+    ("Disk/Usage/Used", "{} MB"),
+    ("Net/Rate/Rx", "{} B/s"),
+    ("Net/Rate/Tx", "{} B/s"),
+    ("Guest/CPU/Load/User", "{:.2f}%"),
+    ("Guest/CPU/Load/Kernel", "{:.2f}%"),
+    ("Guest/CPU/Load/Idle", "{:.2f}%"),
+    ("Guest/RAM/Usage/Total", "{} kB"),
+    ("Guest/RAM/Usage/Free", "{} kB"),
+    ("Guest/RAM/Usage/Balloon", "{} kB"),
+    ("Guest/RAM/Usage/Shared", "{} kB"),
+    ("Guest/RAM/Usage/Cache", "{} kB"),
+    ("Guest/Pagefile/Usage/Total", "{} kB"),
+]
+
+# Aggregates VBoxManage reports next to each sampled metric
+AGGREGATES = ["", ":avg", ":min", ":max"]
+
+def _value(fmt, rng):
+    if "%" in fmt or ".2f" in fmt:
+        return fmt.format(rng.uniform(0, 100))
+    return fmt.format(rng.randint(0, 10 ** 9))
+
+def _line(object_name, metric_name, value):
+    return f"{object_name:<11} {metric_name:<38} {value}"
+
+def vm_names(vm_count):
+    """Return VBoxManage-style names for vm_count VMs."""
+    return [f"cluster{i // 50}_node{i % 50}_{1733564785143 + i}_{85289 + i}" for i in range(vm_count)]
+
+def list_vms_output(vm_count, seed=0):
+    """Build VBoxManage list vms output and the matching name to UUID mapping."""
+    rng = random.Random(seed)
+    vm_info = {name: str(uuid.UUID(int=rng.getrandbits(128))) for name in vm_names(vm_count)}
+    output = ''.join(f'"{name}" {{{vm_uuid}}}\n' for name, vm_uuid in vm_info.items())
+    return output.encode(), vm_info
+
+def metrics_query_output(vm_count, seed=0, interfaces=4, disks=4, filesystems=4):
+    """Build VBoxManage metrics query output for a host running vm_count VMs."""
+    rng = random.Random(seed)
+    lines = [_line("Object", "Metric", "Value")]
+    for metric_name, fmt in HOST_METRICS:
+        for aggregate in AGGREGATES:
+            lines.append(_line("host", metric_name + aggregate, _value(fmt, rng)))
+    for i in range(interfaces):
+        for metric_name, fmt in HOST_NET_METRICS:
+            lines.append(_line("host", f"Net/enp{i}s25/{metric_name}", _value(fmt, rng)))
+    for i in range(disks):
+        for metric_name, fmt in HOST_DISK_METRICS:
+            lines.append(_line("host", f"Disk/sd{chr(97 + i)}/{metric_name}", _value(fmt, rng)))
+    mounts = ["/"] + [f"/mnt/data{i}" for i in range(1, filesystems)]
+    for mount in mounts:
+        for metric_name, fmt in HOST_FS_METRICS:
+            lines.append(_line("host", f"FS/{{{mount}}}/{metric_name}", _value(fmt, rng)))
+    for name in vm_names(vm_count):
+        for metric_name, fmt in VM_METRICS:
+            for aggregate in AGGREGATES:
+                lines.append(_line(name, metric_name + aggregate, _value(fmt, rng)))
+    return ('\n'.join(lines) + '\n').encode()
+
+def synthetic_host(vm_count, seed=0):
+    """Return (list vms output, vm_info, metrics query output) for vm_count VMs."""
+    list_output, vm_info = list_vms_output(vm_count, seed)
+    return list_output, vm_info, metrics_query_output(vm_count, seed)
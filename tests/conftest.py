@@ -7,6 +7,18 @@ import sys
 # Add parent directory to path so we can import the module
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+@pytest.fixture(autouse=True)
+def reset_exporter_state():
+    """Clear caches shared across scrapes so each test starts cold"""
+    import vboxmanagemetrics
+    vboxmanagemetrics.VM_INVENTORY.invalidate()
+    vboxmanagemetrics.SERIES_KEYS.clear()
+    vboxmanagemetrics.LAST_GOOD_SNAPSHOT = None
+    yield
+    vboxmanagemetrics.VM_INVENTORY.invalidate()
+    vboxmanagemetrics.SERIES_KEYS.clear()
+    vboxmanagemetrics.LAST_GOOD_SNAPSHOT = None
+
 @pytest.fixture
 def mock_vbox_list_output():
     """Sample output from VBoxManage list vms command"""
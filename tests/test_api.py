@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import unittest
+import json
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+class TestParsedRecords(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.HOSTNAME = "test-host"
+
+    def test_value_unit(self):
+        """Test naming the unit of raw VBoxManage values"""
+        self.assertEqual(vboxmanagemetrics.value_unit("12.5%"), "percent")
+        self.assertEqual(vboxmanagemetrics.value_unit("10, 20 kB"), "bytes")
+        self.assertEqual(vboxmanagemetrics.value_unit("1000 mbit/s"), "megabits_per_second")
+        self.assertEqual(vboxmanagemetrics.value_unit("512 B/s"), "bytes_per_second")
+        self.assertEqual(vboxmanagemetrics.value_unit("42"), "")
+
+    def test_parsers_keep_records(self):
+        """Test that both parser engines keep one structured record per parsed line"""
+        output = b"host CPU/Load/User 1.5%\nvm1 RAM/Usage/Used 2048 kB\nhost CPU/Load/Kernel 1.0%, 2.0%\n"
+        for parse in (vboxmanagemetrics.parse_metrics_bulk, vboxmanagemetrics.parse_metrics_lines):
+            vboxmanagemetrics.SERIES_KEYS.clear()
+            records = []
+            parse(output, [], {"vm1": "uuid1"}, records=records)
+            self.assertEqual(records, [
+                (("host", "vbox_host_cpu_load_user", {"host": "test-host"}, "percent"), 1.5),
+                (("vm1", "vbox_guest_ram_usage_used", {"host": "test-host", "vm": "vm1", "vm_uuid": "uuid1"},
+                  "bytes"), 2048 * 1024),
+                (("host", "vbox_host_cpu_load_kernel", {"host": "test-host"}, "percent"), 2.0),
+            ])
+
+class TestApiMetrics(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.app.testing = True
+        self.app = vboxmanagemetrics.app.test_client()
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.backend = vboxmanagemetrics.FakeBackend(vm_info={"vm1": "uuid1", "vm2": "uuid2"})
+        self.original_backend = vboxmanagemetrics.BACKEND
+        vboxmanagemetrics.BACKEND = self.backend
+
+    def tearDown(self):
+        vboxmanagemetrics.BACKEND = self.original_backend
+        vboxmanagemetrics.COLLECTOR = None
+
+    def test_columnar_records(self):
+        """Test that /api/metrics returns the parsed series as columns"""
+        response = self.app.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/json')
+        data = json.loads(response.data)
+
+        self.assertEqual(len(data["object"]), len(data["metric"]))
+        self.assertEqual(len(data["value"]), len(data["unit"]))
+        self.assertNotIn("vbox_info", data["metric"])
+        self.assertFalse(any(name.startswith("vbox_exporter_") for name in data["metric"]))
+        index = data["metric"].index("vbox_guest_ram_usage_used", data["object"].index("vm2"))
+        self.assertEqual(data["object"][index], "vm2")
+        self.assertEqual(data["labels"][index], {"host": "test-host", "vm": "vm2", "vm_uuid": "uuid2"})
+        self.assertEqual(data["value"][index], 2048000 * 1024)
+        self.assertEqual(data["unit"][index], "bytes")
+        host = data["metric"].index("vbox_host_cpu_load_user")
+        self.assertEqual((data["object"][host], data["value"][host], data["unit"][host]),
+                         ("host", 1.56, "percent"))
+
+    def test_object_filter(self):
+        """Test filtering /api/metrics by VM name, UUID or host"""
+        by_name = json.loads(self.app.get('/api/metrics?vm=vm1').data)
+        by_uuid = json.loads(self.app.get('/api/metrics?vm=uuid1').data)
+        both = json.loads(self.app.get('/api/metrics?vm=vm1,host').data)
+
+        self.assertEqual(set(by_name["object"]), {"vm1"})
+        self.assertEqual(by_uuid["metric"], by_name["metric"])
+        self.assertEqual(set(both["object"]), {"vm1", "host"})
+
+    def test_served_from_collector_snapshot(self):
+        """Test that the JSON is built once per collection and never re-runs VBoxManage"""
+        collector = vboxmanagemetrics.MetricsCollector(interval=60)
+        collector.refresh()
+        vboxmanagemetrics.COLLECTOR = collector
+        queries = self.backend.calls["query"]
+
+        first = self.app.get('/api/metrics')
+        second = self.app.get('/api/metrics')
+
+        self.assertEqual(self.backend.calls["query"], queries)
+        self.assertEqual(first.data, second.data)
+        self.assertIs(collector.get_snapshot().api_body, collector.get_snapshot().api_body)
+        self.assertIn("X-Metrics-Age", first.headers)
+
+    def test_snapshot_serves_parser_records(self):
+        """Test that the JSON comes from the parser's records, not from the exposition text"""
+        records = [(("vm1", "vbox_guest_cpu_load_user", {"host": "h", "vm": 'a "b"'}, "percent"), 5.0)]
+        snapshot = vboxmanagemetrics.MetricsSnapshot("# unrelated text\n", timestamp=100, records=records)
+        with vboxmanagemetrics.app.app_context():
+            data = json.loads(snapshot.api_body)
+        self.assertEqual(data, {"timestamp": 100, "object": ["vm1"], "metric": ["vbox_guest_cpu_load_user"],
+                                "labels": [{"host": "h", "vm": 'a "b"'}], "value": [5.0], "unit": ["percent"]})
+
+    def test_shared_snapshot_carries_json(self):
+        """Test that workers reading the shared buffer serve the collector's JSON and can filter it"""
+        shared = vboxmanagemetrics.SharedSnapshot(1024 * 1024)
+        snapshot = vboxmanagemetrics.collect_full_snapshot()
+        self.assertTrue(shared.write(snapshot))
+
+        worker_view = shared.read()
+        self.assertIsNone(worker_view.records)
+        self.assertEqual(worker_view.api_json(), snapshot.api_body)
+        self.assertEqual(worker_view.api_json(["uuid2"]), snapshot.api_json(["vm2"]))
+
+    def test_failed_collection(self):
+        """Test that a failed collection is reported as an error"""
+        def fail(objects, metrics):
+            raise vboxmanagemetrics.CollectionError("boom")
+        self.backend.query_metrics = fail
+        response = self.app.get('/api/metrics')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("error", json.loads(response.data))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch, MagicMock
+import threading
+import types
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+class TestFakeBackend(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.app.testing = True
+        self.app = vboxmanagemetrics.app.test_client()
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.backend = vboxmanagemetrics.FakeBackend(
+            vm_info={"vm1": "uuid1"},
+            metrics_output="host CPU/Load/User 1.5%\nvm1 CPU/Load/User 5.0%\n")
+        self.original_backend = vboxmanagemetrics.BACKEND
+        vboxmanagemetrics.BACKEND = self.backend
+
+    def tearDown(self):
+        vboxmanagemetrics.BACKEND = self.original_backend
+
+    @patch('subprocess.check_output')
+    def test_get_metrics_without_vboxmanage(self, mock_check_output):
+        """Test that the fake backend drives a full collection without subprocesses"""
+        metrics = vboxmanagemetrics.get_metrics()
+
+        mock_check_output.assert_not_called()
+        self.assertIn('vbox_host_cpu_load_user{host="test-host"} 1.5', metrics)
+        self.assertIn('vbox_guest_cpu_load_user{host="test-host",vm="vm1",vm_uuid="uuid1"} 5.0', metrics)
+        self.assertEqual(self.backend.calls["list"], 1)
+        self.assertEqual(self.backend.calls["query"], 1)
+
+    def test_stream_uses_backend(self):
+        """Test that streaming works for backends without a process to read"""
+        vboxmanagemetrics.STREAM = True
+        try:
+            response = self.app.get('/metrics')
+        finally:
+            vboxmanagemetrics.STREAM = False
+
+        self.assertIn('vm="vm1",vm_uuid="uuid1"', response.data.decode())
+
+    def test_default_data(self):
+        """Test that a default fake backend produces VM and host series"""
+        vboxmanagemetrics.BACKEND = vboxmanagemetrics.FakeBackend()
+        metrics = vboxmanagemetrics.get_metrics()
+
+        self.assertIn('vbox_host_fs_usage_free', metrics)
+        self.assertIn('vm="fake_vm2"', metrics)
+
+    def test_lazy_lookup_uses_backend(self):
+        """Test that unknown VMs are resolved through the backend"""
+        vboxmanagemetrics.get_metrics()
+        self.backend.vm_info["vm2"] = "uuid2"
+        self.backend.metrics_output += b"vm2 CPU/Load/User 6.0%\n"
+
+        metrics = vboxmanagemetrics.get_metrics()
+
+        self.assertEqual(self.backend.calls["lookup"], 1)
+        self.assertIn('vm="vm2",vm_uuid="uuid2"', metrics)
+
+class TestVirtualBoxApiBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.machine = MagicMock()
+        self.machine.name = "vm1"
+        self.machine.id = "uuid1"
+        self.vbox = MagicMock()
+        self.perf = self.vbox.performanceCollector
+
+        def query_metrics_data(names, objects):
+            if objects[0] is self.machine:
+                return ([500, 700], ["CPU/Load/User"], [self.machine], ["%"], [100], [0], [0], [2])
+            return ([2048], ["RAM/Usage/Used"], [self.vbox.host], ["kB"], [1], [0], [0], [1])
+
+        self.perf.queryMetricsData.side_effect = query_metrics_data
+        manager = MagicMock()
+        manager.getVirtualBox.return_value = self.vbox
+        manager.getArray.return_value = [self.machine]
+        self.vboxapi = types.ModuleType("vboxapi")
+        self.vboxapi.VirtualBoxManager = MagicMock(return_value=manager)
+
+    def test_query_renders_all_samples(self):
+        """Test that PerformanceCollector samples are rendered in VBoxManage format"""
+        with patch.dict(sys.modules, {"vboxapi": self.vboxapi}):
+            backend = vboxmanagemetrics.VirtualBoxApiBackend()
+
+        self.perf.setupMetrics.assert_not_called()
+        self.assertEqual(backend.list_vms(), {"vm1": "uuid1"})
+        output = backend.query_metrics().decode()
+        self.assertIn("host RAM/Usage/Used 2048.0kB", output)
+        self.assertIn("vm1 CPU/Load/User 5.0%, 7.0%", output)
+
+    def test_api_errors_become_collection_errors(self):
+        """Test that API failures are reported like failed VBoxManage commands"""
+        with patch.dict(sys.modules, {"vboxapi": self.vboxapi}):
+            backend = vboxmanagemetrics.VirtualBoxApiBackend()
+        self.perf.queryMetricsData.side_effect = RuntimeError("VBoxSVC gone")
+
+        with self.assertRaises(vboxmanagemetrics.CollectionError):
+            backend.query_metrics()
+
+    def test_calls_run_on_one_thread(self):
+        """Test that the session is created and used on a single dedicated thread"""
+        threads = set()
+
+        def record_thread(*args):
+            threads.add(threading.get_ident())
+            return [self.machine]
+
+        self.vboxapi.VirtualBoxManager.return_value.getArray.side_effect = record_thread
+        self.vboxapi.VirtualBoxManager.side_effect = lambda *args: (
+            threads.add(threading.get_ident()) or self.vboxapi.VirtualBoxManager.return_value)
+        with patch.dict(sys.modules, {"vboxapi": self.vboxapi}):
+            backend = vboxmanagemetrics.VirtualBoxApiBackend()
+        callers = [threading.Thread(target=backend.list_vms) for _ in range(4)]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+        backend.query_metrics()
+
+        self.assertEqual(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_missing_bindings(self):
+        """Test that a missing vboxapi module raises a clear error"""
+        with patch.dict(sys.modules, {"vboxapi": None}):
+            with self.assertRaises(vboxmanagemetrics.CollectionError):
+                vboxmanagemetrics.VirtualBoxApiBackend()
+
+if __name__ == '__main__':
+    unittest.main()
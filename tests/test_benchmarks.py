@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import unittest
+import sys
+import os
+
+# Add parent and benchmarks directories to path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+import vboxmanagemetrics
+import synthetic
+import bench_suite
+import loadtest
+import subprocess
+import tempfile
+
+class TestSyntheticHost(unittest.TestCase):
+
+    def test_list_output_matches_inventory(self):
+        """Test that generated list vms output parses back to the same inventory"""
+        list_output, vm_info, _ = synthetic.synthetic_host(25)
+        self.assertEqual(len(vm_info), 25)
+        self.assertEqual(vboxmanagemetrics.parse_vm_list(list_output.decode()), vm_info)
+
+    def test_metrics_output_parses_completely(self):
+        """Test that every generated metrics line produces a series"""
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        _, vm_info, output = synthetic.synthetic_host(10)
+        metrics = []
+        vboxmanagemetrics.parse_metrics_lines(output, metrics, vm_info)
+
+        self.assertEqual(len(metrics), output.count(b'\n') - 1)
+        self.assertTrue(any('interface="enp0s25"' in line for line in metrics))
+        self.assertTrue(any('disk="sda"' in line for line in metrics))
+        self.assertTrue(any('vbox_host_fs_' in line for line in metrics))
+
+    def test_output_is_deterministic(self):
+        """Test that the same seed always produces the same output"""
+        self.assertEqual(synthetic.synthetic_host(5, seed=3), synthetic.synthetic_host(5, seed=3))
+
+class TestRegressionCheck(unittest.TestCase):
+
+    def test_compare_results(self):
+        """Test that only changes beyond the threshold are reported"""
+        baseline = {"get_metrics[10]": {"seconds": 1.0, "peak_bytes": 1000},
+                    "parse_value[10]": {"seconds": 1.0, "peak_bytes": 1000}}
+        current = {"get_metrics[10]": {"seconds": 1.5, "peak_bytes": 1000},
+                   "parse_value[10]": {"seconds": 1.1, "peak_bytes": 900},
+                   "get_metrics[100]": {"seconds": 9.0, "peak_bytes": 9000}}
+
+        regressions = bench_suite.compare_results(baseline, current, 0.25)
+
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("get_metrics[10] seconds"))
+
+class TestLoadTest(unittest.TestCase):
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 0.50), 50)
+        self.assertEqual(loadtest.percentile(values, 0.99), 99)
+        self.assertEqual(loadtest.percentile([], 0.5), 0.0)
+
+    def test_fake_vboxmanage_replays_fixtures(self):
+        """Test that the fake VBoxManage answers like the real one"""
+        with tempfile.TemporaryDirectory() as fake_dir:
+            path = loadtest.write_fake_vboxmanage(fake_dir, 3, latency=0)
+            list_output, vm_info, metrics_output = synthetic.synthetic_host(3)
+            name, uuid = next(iter(vm_info.items()))
+
+            self.assertEqual(subprocess.check_output([path, "list", "vms"]), list_output)
+            self.assertEqual(subprocess.check_output([path, "metrics", "query", "*"]), metrics_output)
+            info = subprocess.check_output([path, "showvminfo", name, "--machinereadable"]).decode()
+            self.assertIn(f'UUID="{uuid}"', info)
+            self.assertNotEqual(subprocess.call([path, "snapshot", name]), 0)
+
+    def test_scrapes_real_server(self):
+        """Test a short end-to-end load run against the exporter process"""
+        with tempfile.TemporaryDirectory() as fake_dir:
+            loadtest.write_fake_vboxmanage(fake_dir, 5, latency=0)
+            result = loadtest.run_mode(fake_dir, loadtest.MODES["stdlib"], concurrency=2, requests=3)
+
+        self.assertEqual(result["errors"], 0)
+        self.assertEqual(result["requests"], 6)
+        self.assertGreater(result["throughput"], 0)
+        self.assertLessEqual(result["p50"], result["p99"])
+        self.assertGreater(result["vboxmanage_calls"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import threading
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+class TestSingleFlight(unittest.TestCase):
+
+    def run_concurrently(self, flight, func, count):
+        results = [None] * count
+        errors = [None] * count
+
+        def worker(i):
+            try:
+                results[i] = flight.do(func)
+            except Exception as e:
+                errors[i] = e
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test that callers arriving during a call wait for its result"""
+        flight = vboxmanagemetrics.SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def collect():
+            calls.append(1)
+            started.set()
+            release.wait(2)
+            return "shared result"
+
+        leader, results, _ = self.run_concurrently(flight, collect, 1)
+        started.wait(2)
+        followers, follower_results, _ = self.run_concurrently(flight, collect, 4)
+        while flight.coalesced < 4:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in leader + followers:
+            thread.join(2)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results + follower_results, ["shared result"] * 5)
+        self.assertEqual(flight.executions, 1)
+        self.assertEqual(flight.coalesced, 4)
+
+    def test_errors_are_shared(self):
+        """Test that waiting callers see the leader's exception"""
+        flight = vboxmanagemetrics.SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def collect():
+            started.set()
+            release.wait(2)
+            raise RuntimeError("collection failed")
+
+        leader, _, leader_errors = self.run_concurrently(flight, collect, 1)
+        started.wait(2)
+        followers, _, follower_errors = self.run_concurrently(flight, collect, 2)
+        while flight.coalesced < 2:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in leader + followers:
+            thread.join(2)
+
+        for error in leader_errors + follower_errors:
+            self.assertIsInstance(error, RuntimeError)
+
+    def test_sequential_calls_run_separately(self):
+        """Test that calls after a completed flight start a new execution"""
+        flight = vboxmanagemetrics.SingleFlight()
+        self.assertEqual(flight.do(lambda: 1), 1)
+        self.assertEqual(flight.do(lambda: 2), 2)
+        self.assertEqual(flight.executions, 2)
+        self.assertEqual(flight.coalesced, 0)
+
+    @patch('subprocess.check_output')
+    def test_counters_in_metrics_output(self, mock_check_output):
+        """Test that coalescing counters are exported with the metrics"""
+        mock_check_output.return_value = b""
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        with patch('vboxmanagemetrics.SCRAPE_FLIGHT', vboxmanagemetrics.SingleFlight()):
+            metrics = vboxmanagemetrics.collect_snapshot().text
+
+        self.assertIn('vbox_exporter_collections_total{host="test-host"} 1', metrics)
+        self.assertIn('vbox_exporter_scrapes_coalesced_total{host="test-host"} 0', metrics)
+
+if __name__ == '__main__':
+    unittest.main()
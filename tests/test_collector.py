@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import time
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+class TestMetricsCollector(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.app.testing = True
+        self.app = vboxmanagemetrics.app.test_client()
+        vboxmanagemetrics.HOSTNAME = "test-host"
+
+    def tearDown(self):
+        if vboxmanagemetrics.COLLECTOR is not None:
+            vboxmanagemetrics.COLLECTOR.stop()
+        vboxmanagemetrics.COLLECTOR = None
+
+    @patch('vboxmanagemetrics.get_metrics')
+    def test_refresh_builds_snapshot(self, mock_get_metrics):
+        """Test that refresh stores the rendered text with its timestamp"""
+        mock_get_metrics.return_value = 'vbox_info{hostname="test-host"} 1\n'
+        collector = vboxmanagemetrics.MetricsCollector(60)
+
+        snapshot = collector.refresh()
+
+        self.assertIs(collector.snapshot, snapshot)
+        self.assertTrue(snapshot.text.startswith('vbox_info{hostname="test-host"} 1\n'))
+        self.assertIn('vbox_exporter_snapshot_timestamp_seconds{host="test-host"}', snapshot.text)
+        self.assertEqual(snapshot.body, snapshot.text.encode())
+        self.assertLess(snapshot.age(), 5)
+
+    @patch('vboxmanagemetrics.get_metrics')
+    def test_metrics_route_serves_snapshot(self, mock_get_metrics):
+        """Test that /metrics serves the cached snapshot without recollecting"""
+        mock_get_metrics.return_value = "cached_metrics_data\n"
+        vboxmanagemetrics.COLLECTOR = vboxmanagemetrics.MetricsCollector(60)
+        vboxmanagemetrics.COLLECTOR.refresh()
+
+        first = self.app.get('/metrics')
+        second = self.app.get('/metrics')
+
+        self.assertEqual(mock_get_metrics.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.data.decode().startswith("cached_metrics_data\n"))
+        self.assertEqual(first.data, second.data)
+        self.assertIn('X-Metrics-Age', first.headers)
+        self.assertIn('Age', first.headers)
+
+    @patch('vboxmanagemetrics.get_metrics')
+    def test_metrics_route_collects_when_no_snapshot(self, mock_get_metrics):
+        """Test that the first scrape collects if the worker has not run yet"""
+        mock_get_metrics.return_value = "first_metrics_data\n"
+        vboxmanagemetrics.COLLECTOR = vboxmanagemetrics.MetricsCollector(60)
+
+        response = self.app.get('/metrics')
+
+        self.assertEqual(mock_get_metrics.call_count, 1)
+        self.assertTrue(response.data.decode().startswith("first_metrics_data\n"))
+
+    @patch('vboxmanagemetrics.get_metrics')
+    def test_background_thread_refreshes(self, mock_get_metrics):
+        """Test that the worker thread refreshes the snapshot on its interval"""
+        mock_get_metrics.return_value = "background_metrics_data\n"
+        collector = vboxmanagemetrics.MetricsCollector(0.01)
+        vboxmanagemetrics.COLLECTOR = collector
+        collector.start()
+
+        deadline = time.time() + 2
+        while mock_get_metrics.call_count < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        collector.stop()
+
+        self.assertGreaterEqual(mock_get_metrics.call_count, 2)
+        self.assertIsNotNone(collector.snapshot)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import subprocess
+import threading
 import sys
 import os
 
@@ -102,5 +103,24 @@ class TestCommandExecution(unittest.TestCase):
         # Verify we get an error message
         self.assertTrue(metrics.startswith("# Error fetching VBox metrics"))
 
+    @patch('subprocess.check_output')
+    def test_vboxmanage_commands_run_concurrently(self, mock_check_output):
+        """Test that list vms and metrics query are in flight at the same time"""
+        # Each command waits for the other; a sequential run would break the barrier
+        barrier = threading.Barrier(2, timeout=2)
+
+        def side_effect(cmd, stderr=None):
+            barrier.wait()
+            if cmd[1] == "list":
+                return b'"vm1" {uuid1}'
+            return b"vm1         CPU/Load/User         5.0%\n"
+
+        mock_check_output.side_effect = side_effect
+
+        metrics = vboxmanagemetrics.get_metrics()
+
+        self.assertEqual(mock_check_output.call_count, 2)
+        self.assertIn('vm_uuid="uuid1"', metrics)
+
 if __name__ == '__main__':
     unittest.main()
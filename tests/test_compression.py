@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import gzip
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+class TestCompressedResponses(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.app.testing = True
+        self.app = vboxmanagemetrics.app.test_client()
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        patcher = patch('vboxmanagemetrics.get_metrics', return_value="snapshot_metrics_data\n" * 100)
+        self.mock_get_metrics = patcher.start()
+        self.addCleanup(patcher.stop)
+        vboxmanagemetrics.COLLECTOR = vboxmanagemetrics.MetricsCollector(60)
+        vboxmanagemetrics.COLLECTOR.refresh()
+
+    def tearDown(self):
+        vboxmanagemetrics.COLLECTOR = None
+
+    def test_gzip_negotiated(self):
+        """Test that clients accepting gzip get a compressed body"""
+        response = self.app.get('/metrics', headers={"Accept-Encoding": "gzip, deflate"})
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.data), vboxmanagemetrics.COLLECTOR.snapshot.body)
+        self.assertLess(len(response.data), len(vboxmanagemetrics.COLLECTOR.snapshot.body))
+
+    def test_identity_without_accept_encoding(self):
+        """Test that clients not accepting gzip get the plain body"""
+        response = self.app.get('/metrics', headers={"Accept-Encoding": "gzip;q=0"})
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, vboxmanagemetrics.COLLECTOR.snapshot.body)
+
+    def test_snapshot_compressed_once(self):
+        """Test that repeated requests reuse the cached compressed bytes"""
+        with patch('gzip.compress', wraps=gzip.compress) as mock_compress:
+            for _ in range(3):
+                self.app.get('/metrics', headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(mock_compress.call_count, 1)
+
+    def test_etag_not_modified(self):
+        """Test that a matching If-None-Match returns 304 with no body"""
+        first = self.app.get('/metrics')
+        etag = first.headers['ETag']
+
+        second = self.app.get('/metrics', headers={"If-None-Match": etag})
+
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.data, b"")
+        self.assertEqual(second.headers['ETag'], etag)
+
+    def test_gzip_has_own_etag(self):
+        """Test that the gzip representation has its own ETag and either tag revalidates"""
+        identity = self.app.get('/metrics').headers['ETag']
+        gzipped = self.app.get('/metrics', headers={"Accept-Encoding": "gzip"}).headers['ETag']
+        self.assertNotEqual(gzipped, identity)
+        self.assertEqual(gzipped, identity[:-1] + '-gzip"')
+
+        response = self.app.get('/metrics', headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], gzipped)
+        response = self.app.get('/metrics', headers={"Accept-Encoding": "gzip", "If-None-Match": identity})
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_snapshot(self):
+        """Test that a new snapshot gets a new ETag and a full response"""
+        etag = self.app.get('/metrics').headers['ETag']
+        self.mock_get_metrics.return_value = "new_metrics_data\n"
+        vboxmanagemetrics.COLLECTOR.refresh()
+
+        response = self.app.get('/metrics', headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_inline_mode_supports_gzip(self):
+        """Test that per-scrape collection is also compressed on request"""
+        vboxmanagemetrics.COLLECTOR = None
+
+        response = self.app.get('/metrics', headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(gzip.decompress(response.data).decode(), "snapshot_metrics_data\n" * 100)
+        self.assertIn('ETag', response.headers)
+
+if __name__ == '__main__':
+    unittest.main()
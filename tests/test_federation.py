@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import subprocess
+import tempfile
+import time
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+FIXTURES = {
+    "vbox1": {
+        "list-vms.txt": b'"web" {uuid-web}\n',
+        "metrics-query.txt": (b"Object Metric Value\n"
+                              b"host CPU/Load/User 1.5%\n"
+                              b"web CPU/Load/User 5.0%\n"),
+    },
+    "vbox2": {
+        "list-vms.txt": b'"web" {uuid-other}\n',
+        "metrics-query.txt": (b"Object Metric Value\n"
+                              b"host CPU/Load/User 2.5%\n"
+                              b"web CPU/Load/User 7.0%\n"),
+    },
+}
+
+class TestFederation(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.app.testing = True
+        self.app = vboxmanagemetrics.app.test_client()
+        vboxmanagemetrics.HOSTNAME = "exporter-host"
+        self.fixture_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.fixture_dir.cleanup)
+        for host, files in FIXTURES.items():
+            os.mkdir(os.path.join(self.fixture_dir.name, host))
+            for name, content in files.items():
+                with open(os.path.join(self.fixture_dir.name, host, name), "wb") as f:
+                    f.write(content)
+        vboxmanagemetrics.TARGETS[:] = [self.target(host) for host in ("vbox1", "vbox2")]
+        self.addCleanup(vboxmanagemetrics.TARGETS.clear)
+
+    def target(self, host):
+        runner = vboxmanagemetrics.ReplayRunner(os.path.join(self.fixture_dir.name, host))
+        return vboxmanagemetrics.FederationTarget(host, runner)
+
+    @patch('subprocess.check_output')
+    def test_targets_merged_with_host_labels(self, mock_check_output):
+        """Test that each target's series carry its own host label"""
+        metrics = vboxmanagemetrics.get_metrics()
+
+        mock_check_output.assert_not_called()
+        self.assertIn('vbox_info{hostname="vbox1"} 1', metrics)
+        self.assertIn('vbox_info{hostname="vbox2"} 1', metrics)
+        self.assertIn('vbox_host_cpu_load_user{host="vbox1"} 1.5', metrics)
+        self.assertIn('vbox_host_cpu_load_user{host="vbox2"} 2.5', metrics)
+        self.assertIn('vbox_guest_cpu_load_user{host="vbox1",vm="web",vm_uuid="uuid-web"} 5.0', metrics)
+        self.assertIn('vbox_guest_cpu_load_user{host="vbox2",vm="web",vm_uuid="uuid-other"} 7.0', metrics)
+        self.assertIn('vbox_exporter_target_up{host="vbox1"} 1', metrics)
+
+    def test_failing_target_does_not_break_others(self):
+        """Test that a target without output is reported down while others are served"""
+        vboxmanagemetrics.TARGETS.append(self.target("missing"))
+        response = self.app.get('/metrics')
+        text = response.data.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# Error fetching VBox metrics from missing:', text)
+        self.assertIn('vbox_exporter_target_up{host="missing"} 0', text)
+        self.assertIn('vbox_host_cpu_load_user{host="vbox2"} 2.5', text)
+
+    def test_slow_target_bounded_by_its_timeout(self):
+        """Test that a host whose commands each finish in time is still cut off as a whole"""
+        class SlowRunner(vboxmanagemetrics.ReplayRunner):
+            timeout = 0.2
+
+            def execute(self, args, timeout=None):
+                time.sleep(0.15)
+                return super().execute(args, timeout)
+
+        slow = vboxmanagemetrics.FederationTarget("slow", SlowRunner(os.path.join(self.fixture_dir.name, "vbox1")))
+        vboxmanagemetrics.TARGETS.append(slow)
+
+        start = time.perf_counter()
+        metrics = vboxmanagemetrics.get_metrics()
+
+        self.assertLess(time.perf_counter() - start, 0.29)
+        self.assertIn('# Error fetching VBox metrics from slow: collection timed out after 0.2s', metrics)
+        self.assertIn('vbox_exporter_target_up{host="slow"} 0', metrics)
+        self.assertIn('vbox_exporter_target_up{host="vbox1"} 1', metrics)
+
+    def test_federation_ignores_stream_mode(self):
+        """Test that --stream falls back to buffered collection for targets"""
+        vboxmanagemetrics.STREAM = True
+        try:
+            text = self.app.get('/metrics').data.decode()
+        finally:
+            vboxmanagemetrics.STREAM = False
+        self.assertIn('vbox_host_cpu_load_user{host="vbox1"} 1.5', text)
+
+class TestSshRunner(unittest.TestCase):
+
+    @patch('subprocess.check_output', return_value=b"output")
+    def test_command_reuses_master_connection(self, mock_check_output):
+        """Test that commands run through a persistent multiplexed connection with a timeout"""
+        runner = vboxmanagemetrics.SshRunner("vbox1", timeout=3, control_dir="/run/test",
+                                             options=["-o", "User=vbox"])
+        self.assertEqual(runner.run("list", "vms"), b"output")
+
+        cmd = mock_check_output.call_args[0][0]
+        self.assertEqual(cmd[0], "ssh")
+        self.assertIn("ControlMaster=auto", cmd)
+        self.assertIn("ControlPath=/run/test/vboxmetrics-%C", cmd)
+        self.assertEqual(cmd[-5:], ["User=vbox", "vbox1", "VBoxManage", "list", "vms"])
+        self.assertEqual(mock_check_output.call_args[1]["timeout"], 3)
+
+    @patch('subprocess.check_output', side_effect=subprocess.TimeoutExpired(["ssh"], 3))
+    def test_timeout_becomes_collection_error(self, mock_check_output):
+        """Test that a hung remote command surfaces as a collection error"""
+        runner = vboxmanagemetrics.SshRunner("vbox1", timeout=3)
+        with self.assertRaises(vboxmanagemetrics.CollectionError):
+            runner.run("metrics", "query", "*")
+
+    def test_arguments_quoted_for_remote_shell(self):
+        """Test that arguments reach the remote shell as single words"""
+        runner = vboxmanagemetrics.SshRunner("vbox1")
+        cmd = runner.command(["metrics", "query", "vm1;touch /tmp/pwned", "CPU/Load/*"])
+        self.assertEqual(cmd[-4:], ["metrics", "query", "'vm1;touch /tmp/pwned'", "'CPU/Load/*'"])
+
+if __name__ == '__main__':
+    unittest.main()
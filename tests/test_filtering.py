@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+QUERY_OUTPUTS = {
+    "*": (b"Object Metric Value\n"
+          b"host CPU/Load/User 1.5%\n"
+          b"web1 CPU/Load/User 5.0%\n"
+          b"web2 RAM/Usage/Used 1024kB\n"
+          b"db1 CPU/Load/User:avg 7.0%\n"),
+    "web1": b"Object Metric Value\nweb1 CPU/Load/User 5.0%\n",
+    "db1": b"Object Metric Value\ndb1 CPU/Load/User 7.0%\n",
+}
+
+class TestMetricsFiltering(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.app.testing = True
+        self.app = vboxmanagemetrics.app.test_client()
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.commands = []
+        patcher = patch('subprocess.check_output', side_effect=self.side_effect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        vboxmanagemetrics.METRICS_FILTER = vboxmanagemetrics.MetricsFilter()
+
+    def side_effect(self, cmd, stderr=None):
+        self.commands.append(cmd)
+        if cmd[1] == "list":
+            return b'"web1" {uuid1}\n"web2" {uuid2}\n"db1" {uuid3}'
+        return QUERY_OUTPUTS[cmd[3]]
+
+    def query_commands(self):
+        return sorted(cmd[3:] for cmd in self.commands if cmd[1] == "metrics")
+
+    def test_default_queries_everything(self):
+        """Test that without a filter the query covers every object"""
+        vboxmanagemetrics.get_metrics()
+        self.assertEqual(self.query_commands(), [["*"]])
+
+    def test_objects_and_metrics_pushed_down(self):
+        """Test that include lists become metrics query arguments"""
+        metrics_filter = vboxmanagemetrics.MetricsFilter(["web1", "db1"], ["CPU/Load/*", "RAM/Usage/Used"])
+
+        metrics = vboxmanagemetrics.get_metrics(metrics_filter)
+
+        self.assertEqual(self.query_commands(), [["db1", "CPU/Load/*,RAM/Usage/Used"],
+                                                 ["web1", "CPU/Load/*,RAM/Usage/Used"]])
+        self.assertIn('vm="web1"', metrics)
+        self.assertIn('vm="db1"', metrics)
+
+    def test_excludes_applied_to_output(self):
+        """Test that excluded objects and metrics never reach the parser"""
+        metrics_filter = vboxmanagemetrics.MetricsFilter(exclude_objects=["web*"],
+                                                         exclude_metrics=["CPU/Load/User"])
+
+        metrics = vboxmanagemetrics.get_metrics(metrics_filter)
+
+        self.assertNotIn('vm="web1"', metrics)
+        self.assertNotIn('vm="web2"', metrics)
+        self.assertNotIn('cpu_load_user', metrics)
+
+    def test_object_globs_filtered_after_query(self):
+        """Test that object globs query everything and keep only matching objects"""
+        metrics = vboxmanagemetrics.get_metrics(vboxmanagemetrics.MetricsFilter(["web*"]))
+
+        self.assertEqual(self.query_commands(), [["*"]])
+        self.assertIn('vm="web1"', metrics)
+        self.assertIn('vm="web2"', metrics)
+        self.assertNotIn('vm="db1"', metrics)
+        self.assertNotIn('vbox_host_', metrics)
+
+    def test_query_parameters(self):
+        """Test that /metrics?vm=...&metric=... narrows the VBoxManage query"""
+        response = self.app.get('/metrics?vm=web1&metric=CPU/Load/User')
+
+        self.assertEqual(self.query_commands(), [["web1", "CPU/Load/User"]])
+        self.assertIn('vbox_guest_cpu_load_user{host="test-host",vm="web1",vm_uuid="uuid1"} 5.0',
+                      response.data.decode())
+
+    def test_query_parameters_cannot_bypass_excludes(self):
+        """Test that configured excludes still apply to narrowed requests"""
+        vboxmanagemetrics.METRICS_FILTER = vboxmanagemetrics.MetricsFilter(exclude_objects=["web1"])
+
+        response = self.app.get('/metrics?vm=web1,db1')
+
+        self.assertNotIn('vm="web1"', response.data.decode())
+        self.assertIn('vm="db1"', response.data.decode())
+
+    def test_query_parameters_limited_to_includes(self):
+        """Test that requests cannot widen the configured include list"""
+        vboxmanagemetrics.METRICS_FILTER = vboxmanagemetrics.MetricsFilter(["db*"])
+
+        response = self.app.get('/metrics?vm=web1')
+
+        self.assertNotIn('vm="web1"', response.data.decode())
+
+    def test_unsafe_query_parameters_rejected(self):
+        """Test that options and shell metacharacters never reach VBoxManage"""
+        for query in ('vm=x;touch%20/tmp/pwned', 'vm=-h', 'metric=CPU$(id)', 'vm=a%60b%60'):
+            response = self.app.get(f'/metrics?{query}')
+            self.assertEqual(response.status_code, 400, query)
+        self.assertEqual(self.commands, [])
+
+    def test_stream_honours_filter(self):
+        """Test that streamed scrapes apply the same filter"""
+        metrics_filter = vboxmanagemetrics.MetricsFilter(exclude_objects=["web*"])
+        backend = vboxmanagemetrics.FakeBackend({"web1": "uuid1", "db1": "uuid3"}, QUERY_OUTPUTS["*"])
+
+        with patch('vboxmanagemetrics.BACKEND', backend):
+            streamed = ''.join(vboxmanagemetrics.stream_metrics(metrics_filter))
+
+        self.assertNotIn('vm="web1"', streamed)
+        self.assertIn('vm="db1"', streamed)
+
+if __name__ == '__main__':
+    unittest.main()
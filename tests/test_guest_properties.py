@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import subprocess
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+ENUMERATE_OUTPUT_6 = b'''Name: /VirtualBox/GuestInfo/OS/Product, value: Linux, timestamp: 1700000000000000000, flags: <NULL>
+Name: /VirtualBox/GuestAdd/Version, value: 6.1.50, timestamp: 1700000000000000000, flags: <NULL>
+'''
+
+ENUMERATE_OUTPUT_7 = b'''/VirtualBox/GuestInfo/OS/Product = 'Linux' @ 2024-01-01T00:00:00.000000000Z
+/VirtualBox/GuestInfo/OS/LoggedInUsers = '2' @ 2024-01-01T00:00:00.000000000Z, TRANSIENT, RDONLYGUEST
+/VirtualBox/GuestInfo/Net/0/Name = 'eth 0, "lab"' @ 2024-01-01T00:00:00.000000000Z
+'''
+
+class TestParseGuestProperties(unittest.TestCase):
+
+    def test_parses_both_output_formats(self):
+        """Test parsing guestproperty enumerate output from VirtualBox 6 and 7"""
+        self.assertEqual(vboxmanagemetrics.parse_guest_properties(ENUMERATE_OUTPUT_6.decode()), {
+            "/VirtualBox/GuestInfo/OS/Product": "Linux", "/VirtualBox/GuestAdd/Version": "6.1.50"})
+        self.assertEqual(vboxmanagemetrics.parse_guest_properties(ENUMERATE_OUTPUT_7.decode()), {
+            "/VirtualBox/GuestInfo/OS/Product": "Linux", "/VirtualBox/GuestInfo/OS/LoggedInUsers": "2",
+            "/VirtualBox/GuestInfo/Net/0/Name": 'eth 0, "lab"'})
+
+    @patch('subprocess.check_output', return_value=ENUMERATE_OUTPUT_7)
+    def test_cli_backend_runs_enumerate(self, mock_check_output):
+        """Test that the CLI backend reads guest properties from guestproperty enumerate"""
+        properties = vboxmanagemetrics.CliBackend().guest_properties("uuid1")
+        self.assertEqual(properties["/VirtualBox/GuestInfo/OS/LoggedInUsers"], "2")
+        self.assertEqual(mock_check_output.call_args[0][0],
+                         ["VBoxManage", "guestproperty", "enumerate", "uuid1"])
+
+    @patch('vboxmanagemetrics.check_output_group', side_effect=subprocess.TimeoutExpired("VBoxManage", 2))
+    def test_per_call_timeout_overrides_runner(self, mock_group):
+        """Test that a per-call timeout applies even when the runner has none"""
+        with self.assertRaises(vboxmanagemetrics.CollectionError):
+            vboxmanagemetrics.CliBackend().guest_properties("uuid1", timeout=2)
+        self.assertEqual(mock_group.call_args[0][1], 2)
+
+    def test_label_values_are_escaped(self):
+        """Test that guest-controlled label values cannot break the exposition format"""
+        self.assertEqual(vboxmanagemetrics.escape_label_value('a\\b"c\nd'), 'a\\\\b\\"c\\nd')
+
+class TestGuestPropertyCache(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.backend = vboxmanagemetrics.FakeBackend(vm_info={"vm1": "uuid1", "vm2": "uuid2"})
+        self.original_backend = vboxmanagemetrics.BACKEND
+        vboxmanagemetrics.BACKEND = self.backend
+        vboxmanagemetrics.GUEST_PROPERTIES = vboxmanagemetrics.GuestPropertyCache(ttl=600, timeout=5)
+
+    def tearDown(self):
+        vboxmanagemetrics.BACKEND = self.original_backend
+        vboxmanagemetrics.GUEST_PROPERTIES = None
+
+    def wait_for_refresh(self):
+        vboxmanagemetrics.GUEST_PROPERTIES._refresh_thread.join(5)
+
+    def test_first_scrape_refreshes_in_background(self):
+        """Test that scrapes read the cache and a stale cache is refreshed once in the background"""
+        metrics = vboxmanagemetrics.get_metrics()
+        self.assertNotIn("vbox_guest_os_info", metrics)
+        self.wait_for_refresh()
+
+        metrics = vboxmanagemetrics.get_metrics()
+        vboxmanagemetrics.get_metrics()
+        self.assertIn('vbox_guest_os_info{host="test-host",vm="vm1",vm_uuid="uuid1",'
+                      'product="Linux",release="6.1.0-18-amd64",version=""} 1', metrics)
+        self.assertIn('vbox_guest_additions_info{host="test-host",vm="vm2",vm_uuid="uuid2",version="7.0.14"} 1',
+                      metrics)
+        self.assertIn('vbox_guest_logged_in_users{host="test-host",vm="vm1",vm_uuid="uuid1"} 1', metrics)
+        self.assertIn('vbox_guest_net_interfaces{host="test-host",vm="vm1",vm_uuid="uuid1"} 1', metrics)
+        self.assertIn('vbox_guest_net_info{host="test-host",vm="vm1",vm_uuid="uuid1",interface="0",'
+                      'ip="10.0.2.15",mac="080027AABBCC",status="Up"} 1', metrics)
+        self.assertEqual(self.backend.calls["guestproperty"], 2)
+
+    def test_narrowed_scrape_refreshes_every_vm(self):
+        """Test that a refresh started by a ?vm= scrape still covers the VMs of full scrapes"""
+        metrics_filter = vboxmanagemetrics.METRICS_FILTER.narrow(["vm1"])
+        vboxmanagemetrics.get_metrics(metrics_filter)
+        self.wait_for_refresh()
+
+        narrowed = vboxmanagemetrics.get_metrics(metrics_filter)
+        full = vboxmanagemetrics.get_metrics()
+        self.assertNotIn('vbox_guest_logged_in_users{host="test-host",vm="vm2"', narrowed)
+        self.assertIn('vbox_guest_logged_in_users{host="test-host",vm="vm1"', full)
+        self.assertIn('vbox_guest_logged_in_users{host="test-host",vm="vm2"', full)
+        self.assertEqual(self.backend.calls["guestproperty"], 2)
+
+    def test_only_running_vms_are_enumerated(self):
+        """Test that powered-off VMs are not queried"""
+        with patch.object(self.backend, 'list_running_vms', return_value={"vm2": "uuid2"}):
+            vboxmanagemetrics.GUEST_PROPERTIES.refresh({"vm1": "uuid1", "vm2": "uuid2"})
+        self.assertEqual(self.backend.calls["guestproperty"], 1)
+        self.assertEqual(list(vboxmanagemetrics.GUEST_PROPERTIES.get({"vm1": "uuid1", "vm2": "uuid2"})), ["vm2"])
+
+    def test_failed_vm_keeps_previous_properties(self):
+        """Test that a VM whose enumeration fails keeps the values from the last refresh"""
+        cache = vboxmanagemetrics.GUEST_PROPERTIES
+        vm_info = {"vm1": "uuid1", "vm2": "uuid2"}
+        cache.refresh(vm_info)
+
+        def flaky(vm, timeout=None):
+            if vm == "uuid1":
+                raise vboxmanagemetrics.CollectionError("timed out")
+            return {"/VirtualBox/GuestAdd/Version": "7.1.0"}
+
+        with patch.object(self.backend, 'guest_properties', side_effect=flaky):
+            cache.refresh(vm_info)
+        properties = cache.get(vm_info)
+        self.assertEqual(properties["vm1"]["/VirtualBox/GuestAdd/Version"], "7.0.14")
+        self.assertEqual(properties["vm2"], {"/VirtualBox/GuestAdd/Version": "7.1.0"})
+
+    def test_guest_interface_count_is_bounded(self):
+        """Test that a guest-written interface count cannot inflate the number of series"""
+        properties = {"/VirtualBox/GuestInfo/Net/Count": "200000",
+                      "/VirtualBox/GuestInfo/Net/0/MAC": "080027AABBCC",
+                      "/VirtualBox/GuestInfo/Net/70/MAC": "080027DDEEFF"}
+        with patch.object(self.backend, 'guest_properties', return_value=properties):
+            vboxmanagemetrics.GUEST_PROPERTIES.refresh({"vm1": "uuid1"})
+        metrics = vboxmanagemetrics.get_guest_property_metrics({"vm1": "uuid1"}, vboxmanagemetrics.MetricsFilter())
+        self.assertEqual([line for line in metrics if line.startswith("vbox_guest_net_info")], [
+            'vbox_guest_net_info{host="test-host",vm="vm1",vm_uuid="uuid1",interface="0",'
+            'ip="",mac="080027AABBCC",status=""} 1'])
+
+    def test_filter_excludes_vms(self):
+        """Test that guest series respect the VM filter"""
+        vboxmanagemetrics.GUEST_PROPERTIES.refresh({"vm1": "uuid1", "vm2": "uuid2"})
+        metrics = vboxmanagemetrics.get_metrics(vboxmanagemetrics.MetricsFilter(exclude_objects=["vm2"]))
+        self.assertIn('vbox_guest_additions_info{host="test-host",vm="vm1"', metrics)
+        self.assertNotIn('vm="vm2",vm_uuid="uuid2",version="7.0.14"', metrics)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import unittest
+import math
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+class TestSeriesHistory(unittest.TestCase):
+
+    def test_ring_keeps_most_recent_window(self):
+        """Test that only the last capacity values are kept, oldest first"""
+        history = vboxmanagemetrics.SeriesHistory(capacity=3)
+        for i in range(5):
+            history.record(f'vbox_host_cpu{{host="h"}} {i}\n', timestamp=100 + i)
+
+        timestamps, series = history.window()
+        self.assertEqual(timestamps, [102, 103, 104])
+        self.assertEqual(series, {'vbox_host_cpu{host="h"}': [2.0, 3.0, 4.0]})
+
+        timestamps, series = history.window(samples=2)
+        self.assertEqual(timestamps, [103, 104])
+        self.assertEqual(series['vbox_host_cpu{host="h"}'], [3.0, 4.0])
+
+    def test_vanished_series_evicted_after_window(self):
+        """Test that missing samples are NaN and the slot is reused after a full window"""
+        history = vboxmanagemetrics.SeriesHistory(capacity=2, max_series=1)
+        history.record('gone{vm="a"} 1\n', timestamp=1)
+        history.record('', timestamp=2)
+
+        _, series = history.window()
+        self.assertTrue(math.isnan(series['gone{vm="a"}'][1]))
+
+        history.record('new{vm="b"} 5\n', timestamp=3)
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history.dropped, 0)
+        _, series = history.window()
+        self.assertEqual(list(series), ['new{vm="b"}'])
+        self.assertTrue(math.isnan(series['new{vm="b"}'][0]))
+        self.assertEqual(series['new{vm="b"}'][1], 5.0)
+
+    def test_max_series_bounds_memory(self):
+        """Test that series beyond max_series are dropped rather than stored"""
+        history = vboxmanagemetrics.SeriesHistory(capacity=4, max_series=2)
+        history.record('a 1\nb 2\nc 3\n', timestamp=1)
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history.dropped, 1)
+        self.assertEqual(len(history._values), 2 * 4)
+
+    def test_parse_skips_comments_and_self_metrics(self):
+        """Test which exposition lines are recorded"""
+        values = vboxmanagemetrics.SeriesHistory.parse_exposition(
+            '# Error\nvbox_exporter_collections_total{host="h"} 3\n'
+            'vbox_guest_cpu{vm="My VM"} 2.5\nvbox_guest_cpu{vm="x"} 0.5 1000\nvbox_guest_cpu{vm="x"} 1.0 2000\n')
+        self.assertEqual(values, {'vbox_guest_cpu{vm="My VM"}': 2.5, 'vbox_guest_cpu{vm="x"}': 1.0})
+
+class TestHistoryEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.app.testing = True
+        self.app = vboxmanagemetrics.app.test_client()
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.backend = vboxmanagemetrics.FakeBackend(
+            vm_info={"vm1": "uuid1"},
+            metrics_output="host Net/eth0/Load/Rx 10%\nvm1 CPU/Load/User 5.0%\n")
+        self.original_backend = vboxmanagemetrics.BACKEND
+        vboxmanagemetrics.BACKEND = self.backend
+        vboxmanagemetrics.HISTORY = vboxmanagemetrics.SeriesHistory(capacity=5)
+
+    def tearDown(self):
+        vboxmanagemetrics.BACKEND = self.original_backend
+        vboxmanagemetrics.HISTORY = None
+
+    def test_history_disabled(self):
+        """Test that the endpoint is not found without --history"""
+        vboxmanagemetrics.HISTORY = None
+        self.assertEqual(self.app.get('/metrics/history').status_code, 404)
+
+    def test_scrapes_recorded_with_rate(self):
+        """Test that scrapes feed the history and the endpoint reports delta and rate"""
+        for value in (b"10%", b"30%"):
+            self.backend.metrics_output = b"host Net/eth0/Load/Rx " + value + b"\nvm1 CPU/Load/User 5.0%\n"
+            self.app.get('/metrics')
+
+        data = self.app.get('/metrics/history?name=vbox_host_*&samples=3').get_json()
+
+        self.assertEqual(len(data["timestamps"]), 2)
+        self.assertEqual(len(data["series"]), 1)
+        entry = data["series"][0]
+        self.assertEqual(entry["series"], 'vbox_host_net_eth0_load_rx{host="test-host",interface="eth0"}')
+        self.assertEqual(entry["values"], [10.0, 30.0])
+        self.assertEqual(entry["delta"], 20.0)
+
+    def test_bad_samples_parameter(self):
+        """Test that a non-numeric window size is rejected"""
+        self.assertEqual(self.app.get('/metrics/history?samples=x').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch, MagicMock
+import subprocess
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+class TestExporterInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.stats = vboxmanagemetrics.ExporterStats()
+        patcher = patch('vboxmanagemetrics.STATS', self.stats)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.metrics_output = (
+            b"Object      Metric                Value\n"
+            b"host        CPU/Load/User         1.5%\n"
+            b"host        CPU/Load/Kernel       NaN\n"
+            b"vm1         CPU/Load/User         5.0%\n"
+        )
+
+    def side_effect(self, cmd, stderr=None):
+        if cmd[1] == "list":
+            return b'"vm1" {uuid1}'
+        return self.metrics_output
+
+    @patch('subprocess.check_output')
+    def test_collection_is_instrumented(self, mock_check_output):
+        """Test that a collection records stage timings and line counts"""
+        mock_check_output.side_effect = self.side_effect
+
+        vboxmanagemetrics.get_metrics()
+
+        for command in ("list", "metrics"):
+            histogram = self.stats.histogram("vbox_exporter_subprocess_duration_seconds", command=command)
+            self.assertEqual(histogram.count, 1)
+        for name in ("parse", "render", "scrape"):
+            self.assertEqual(self.stats.histogram(f"vbox_exporter_{name}_duration_seconds").count, 1)
+        self.assertEqual(self.stats.counter("vbox_exporter_lines_parsed_total"), 2)
+        # Only the NaN line is dropped; the header is not a data line
+        self.assertEqual(self.stats.counter("vbox_exporter_lines_dropped_total"), 1)
+        self.assertEqual(self.stats.counter("vbox_exporter_cache_misses_total", cache="inventory"), 1)
+
+    @patch('subprocess.check_output')
+    def test_cache_hits_are_counted(self, mock_check_output):
+        """Test that a second scrape counts inventory and series key cache hits"""
+        mock_check_output.side_effect = self.side_effect
+
+        vboxmanagemetrics.get_metrics()
+        vboxmanagemetrics.get_metrics()
+
+        self.assertEqual(self.stats.counter("vbox_exporter_cache_hits_total", cache="inventory"), 1)
+        self.assertEqual(self.stats.counter("vbox_exporter_cache_hits_total", cache="series_keys"), 2)
+        self.assertEqual(self.stats.counter("vbox_exporter_cache_misses_total", cache="series_keys"), 2)
+
+    @patch('subprocess.check_output')
+    def test_multi_sample_lines_counted_once(self, mock_check_output):
+        """Test that lines producing several series still count as one parsed line"""
+        mock_check_output.side_effect = self.side_effect
+        self.metrics_output += b"vm1         RAM/Usage/Used        1, 2, 3 kB\n"
+        self.addCleanup(setattr, vboxmanagemetrics, "SAMPLE_MODE", vboxmanagemetrics.SAMPLE_MODE)
+        vboxmanagemetrics.SAMPLE_MODE = "rollup"
+
+        for parser in ("bulk", "lines"):
+            with patch('vboxmanagemetrics.PARSER', parser):
+                vboxmanagemetrics.SERIES_KEYS.clear()
+                vboxmanagemetrics.get_metrics()
+
+        self.assertEqual(self.stats.counter("vbox_exporter_lines_parsed_total"), 6)
+        self.assertEqual(self.stats.counter("vbox_exporter_lines_dropped_total"), 2)
+        self.assertEqual(self.stats.counter("vbox_exporter_cache_misses_total", cache="series_keys"), 6)
+
+    @patch('subprocess.check_output')
+    def test_clean_collection_drops_no_lines(self, mock_check_output):
+        """Test that headers and separators of per-object queries are not counted as dropped"""
+        def side_effect(cmd, stderr=None):
+            if cmd[1] == "list":
+                return b'"vm1" {uuid1}'
+            return (b"Object          Metric                Values\n"
+                    b"--------------- --------------------- ------\n"
+                    b"%s        CPU/Load/User         1.5%%\n" % cmd[3].encode())
+
+        mock_check_output.side_effect = side_effect
+        metrics_filter = vboxmanagemetrics.MetricsFilter(objects=["host", "vm1"])
+
+        vboxmanagemetrics.get_metrics(metrics_filter)
+
+        self.assertEqual(self.stats.counter("vbox_exporter_lines_parsed_total"), 2)
+        self.assertEqual(self.stats.counter("vbox_exporter_lines_dropped_total"), 0)
+
+    @patch('subprocess.check_output')
+    def test_subprocess_failures_are_counted(self, mock_check_output):
+        """Test that failing VBoxManage commands increment the failure counter"""
+        mock_check_output.side_effect = subprocess.CalledProcessError(1, "VBoxManage")
+
+        vboxmanagemetrics.get_metrics()
+
+        self.assertEqual(self.stats.counter("vbox_exporter_subprocess_failures_total", command="metrics"), 1)
+        self.assertEqual(self.stats.histogram("vbox_exporter_scrape_duration_seconds").count, 1)
+
+    @patch('subprocess.check_output')
+    def test_self_metrics_in_output(self, mock_check_output):
+        """Test that histograms are rendered with cumulative buckets"""
+        mock_check_output.side_effect = self.side_effect
+        vboxmanagemetrics.get_metrics()
+
+        metrics = vboxmanagemetrics.get_metrics()
+
+        self.assertIn('vbox_exporter_subprocess_duration_seconds_bucket{host="test-host",command="list",le="+Inf"} 1', metrics)
+        self.assertIn('vbox_exporter_scrape_duration_seconds_count{host="test-host"} 1', metrics)
+        self.assertIn('vbox_exporter_lines_parsed_total{host="test-host"} 4', metrics)
+
+    def test_histogram_buckets(self):
+        """Test that observations land in the first bucket whose bound they do not exceed"""
+        histogram = vboxmanagemetrics.Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 5.0):
+            histogram.observe(value)
+
+        lines = histogram.render("test_seconds", 'host="h"')
+
+        self.assertEqual(lines[:3], [
+            'test_seconds_bucket{host="h",le="0.1"} 2',
+            'test_seconds_bucket{host="h",le="1.0"} 3',
+            'test_seconds_bucket{host="h",le="+Inf"} 4',
+        ])
+        self.assertEqual(lines[4], 'test_seconds_count{host="h"} 4')
+
+    @patch('subprocess.check_output')
+    def test_profile_hook(self, mock_check_output):
+        """Test that the profiling hook receives the per-stage breakdown"""
+        mock_check_output.side_effect = self.side_effect
+        hook = MagicMock()
+
+        with patch('vboxmanagemetrics.PROFILE_HOOK', hook):
+            vboxmanagemetrics.get_metrics()
+
+        stages = hook.call_args.args[0]
+        self.assertEqual(set(stages), {"collect", "parse", "render", "total"})
+
+if __name__ == '__main__':
+    unittest.main()
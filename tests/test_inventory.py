@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import subprocess
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+class TestVMInventory(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.list_output = '"vm1" {uuid1}\n"vm2" {uuid2}'
+        self.metrics_output = (
+            "Object      Metric                Value\n"
+            "host        CPU/Load/User         1.5%\n"
+            "vm1         CPU/Load/User         5.0%\n"
+            "vm2         CPU/Load/User         6.0%\n"
+        )
+        self.showvminfo = {"vm3": 'name="vm3"\nUUID="uuid3"\n'}
+
+    def side_effect(self, cmd, stderr=None):
+        if cmd[1] == "list":
+            return self.list_output.encode()
+        elif cmd[1] == "metrics":
+            return self.metrics_output.encode()
+        elif cmd[1] == "showvminfo":
+            if cmd[2] not in self.showvminfo:
+                raise subprocess.CalledProcessError(1, cmd)
+            return self.showvminfo[cmd[2]].encode()
+        return b""
+
+    def commands(self, mock_check_output):
+        return [call.args[0][1] for call in mock_check_output.call_args_list]
+
+    @patch('subprocess.check_output')
+    def test_list_skipped_while_fresh(self, mock_check_output):
+        """Test that a fresh inventory avoids re-running list vms"""
+        mock_check_output.side_effect = self.side_effect
+
+        vboxmanagemetrics.get_metrics()
+        metrics = vboxmanagemetrics.get_metrics()
+
+        self.assertEqual(self.commands(mock_check_output).count("list"), 1)
+        self.assertEqual(self.commands(mock_check_output).count("metrics"), 2)
+        self.assertIn('vm="vm2",vm_uuid="uuid2"', metrics)
+
+    @patch('subprocess.check_output')
+    def test_expired_inventory_relists(self, mock_check_output):
+        """Test that the VM list is fetched again once the TTL expires"""
+        mock_check_output.side_effect = self.side_effect
+        vboxmanagemetrics.VM_INVENTORY.ttl = 0
+
+        try:
+            vboxmanagemetrics.get_metrics()
+            vboxmanagemetrics.get_metrics()
+        finally:
+            vboxmanagemetrics.VM_INVENTORY.ttl = 300
+
+        self.assertEqual(self.commands(mock_check_output).count("list"), 2)
+
+    @patch('subprocess.check_output')
+    def test_unknown_vm_gets_lazy_lookup(self, mock_check_output):
+        """Test that a new VM is resolved with showvminfo instead of a full re-list"""
+        mock_check_output.side_effect = self.side_effect
+        vboxmanagemetrics.get_metrics()
+
+        self.metrics_output += "vm3         CPU/Load/User         7.0%\n"
+        metrics = vboxmanagemetrics.get_metrics()
+        vboxmanagemetrics.get_metrics()
+
+        commands = self.commands(mock_check_output)
+        self.assertEqual(commands.count("list"), 1)
+        self.assertEqual(commands.count("showvminfo"), 1)
+        self.assertIn('vm="vm3",vm_uuid="uuid3"', metrics)
+
+    @patch('subprocess.check_output')
+    def test_failed_lookup_not_repeated(self, mock_check_output):
+        """Test that an object showvminfo cannot resolve is only looked up once per listing"""
+        mock_check_output.side_effect = self.side_effect
+        vboxmanagemetrics.get_metrics()
+
+        self.metrics_output += "ghost       CPU/Load/User         7.0%\n"
+        metrics = vboxmanagemetrics.get_metrics()
+        vboxmanagemetrics.get_metrics()
+
+        self.assertEqual(self.commands(mock_check_output).count("showvminfo"), 1)
+        self.assertIn('vbox_guest_cpu_load_user{host="test-host",vm="ghost"} 7.0', metrics)
+
+    @patch('subprocess.check_output')
+    def test_invalidate_forces_relist(self, mock_check_output):
+        """Test that explicit invalidation triggers a full re-list"""
+        mock_check_output.side_effect = self.side_effect
+
+        vboxmanagemetrics.get_metrics()
+        vboxmanagemetrics.VM_INVENTORY.invalidate()
+        vboxmanagemetrics.get_metrics()
+
+        self.assertEqual(self.commands(mock_check_output).count("list"), 2)
+
+    @patch('subprocess.check_output')
+    def test_lookup_vm_uuid(self, mock_check_output):
+        """Test parsing the UUID out of showvminfo machine-readable output"""
+        mock_check_output.side_effect = self.side_effect
+        self.assertEqual(vboxmanagemetrics.lookup_vm_uuid("vm3"), "uuid3")
+
+if __name__ == '__main__':
+    unittest.main()
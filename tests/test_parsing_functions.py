@@ -4,6 +4,7 @@ import unittest
 import sys
 import os
 import math  # Add this import for is_nan check
+import unittest.mock
 
 # Add parent directory to path so we can import the module
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -76,5 +77,123 @@ class TestParsingFunctions(unittest.TestCase):
         if result is not None:
             self.assertTrue(math.isnan(result))  # If it returns NaN, test that it's actually NaN
 
+class TestSeriesKeyCache(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.cache = vboxmanagemetrics.SeriesKeyCache(max_entries=4)
+
+    def test_key_matches_rendered_key(self):
+        """Test that cached keys match freshly rendered ones"""
+        vm_info = {"vm1": "uuid1"}
+        for object_name, metric_name in [("host", "Net/eth0/Load/Rx"),
+                                         ("host", "FS/{/}/Usage/Free"),
+                                         ("vm1", "CPU/Load/User")]:
+            expected = vboxmanagemetrics.format_series_key(
+                *vboxmanagemetrics.series_name_and_labels(object_name, metric_name, vm_info))
+            self.assertEqual(self.cache.get(object_name, metric_name, vm_info), expected)
+            self.assertEqual(self.cache.get(object_name, metric_name, vm_info), expected)
+        self.assertEqual(len(self.cache), 3)
+
+    def test_hit_skips_rendering(self):
+        """Test that a repeated (object, metric) pair is served from the cache"""
+        self.cache.get("vm1", "CPU/Load/User", {"vm1": "uuid1"})
+        self.assertEqual(self.cache.renders, 1)
+        with unittest.mock.patch('vboxmanagemetrics.series_name_and_labels') as mock_render:
+            self.cache.get("vm1", "CPU/Load/User", {"vm1": "uuid1"})
+        mock_render.assert_not_called()
+        self.assertEqual(self.cache.renders, 1)
+
+    def test_uuid_change_rerenders(self):
+        """Test that a VM recreated with a new UUID gets a new key"""
+        self.cache.get("vm1", "CPU/Load/User", {"vm1": "uuid1"})
+        key = self.cache.get("vm1", "CPU/Load/User", {"vm1": "uuid2"})
+        self.assertIn('vm_uuid="uuid2"', key)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_retain_evicts_deleted_vms(self):
+        """Test that series for VMs missing from the inventory are evicted"""
+        self.cache.get("host", "CPU/Load/User", {})
+        self.cache.get("vm1", "CPU/Load/User", {"vm1": "uuid1"})
+        self.cache.get("vm2", "CPU/Load/User", {"vm2": "uuid2"})
+        self.cache.retain({"vm1": "uuid1"})
+        self.assertEqual(len(self.cache), 2)
+
+    def test_cache_is_bounded(self):
+        """Test that the cache never grows past max_entries"""
+        for i in range(10):
+            self.cache.get(f"vm{i}", "CPU/Load/User", {})
+            self.assertLessEqual(len(self.cache), 4)
+
+class TestBulkParser(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.vm_info = {"vm1": "uuid1", "vm2": "uuid2"}
+
+    def assert_engines_match(self, output):
+        lines_result, bulk_result = [], []
+        vboxmanagemetrics.parse_metrics_lines(output, lines_result, self.vm_info)
+        vboxmanagemetrics.parse_metrics_bulk(output, bulk_result, self.vm_info)
+        self.assertEqual(bulk_result, lines_result)
+        return bulk_result
+
+    def test_bulk_matches_lines_for_fixture(self):
+        """Test that both engines produce identical output for typical query output"""
+        output = (
+            b"Object      Metric                                 Value\n"
+            b"host        CPU/Load/User                          1.56%\n"
+            b"host        RAM/Usage/Total                        263535524 kB\n"
+            b"host        RAM/Usage/Used                         4096kB\n"
+            b"host        Disk/sdc/Usage/Total                   457862 MB\n"
+            b"host        Disk/sda/Usage/Total                   100MB\n"
+            b"host        Net/enp0s25/LinkSpeed                  1000mbit/s\n"
+            b"host        Net/enp0s25/Rate/Rx                    512B/s\n"
+            b"host        CPU/MHz                                3400MHz\n"
+            b"host        FS/{/}/Usage/Free                      3874MB\n"
+            b"vm1         CPU/Load/User                          3.0%\n"
+            b"vm2         RAM/Usage/Used                         2048000\n"
+            b"ghost       CPU/Load/Kernel                        -1.5\n"
+        )
+        result = self.assert_engines_match(output)
+        self.assertIn('vbox_host_ram_usage_used{host="test-host"} 4194304.0', result)
+        self.assertEqual(len(result), 12)
+
+    def test_bulk_matches_lines_for_irregular_lines(self):
+        """Test that unusual lines fall back to the per-line parser"""
+        output = (
+            b"\n   \n"
+            b"Object Metric Value\n"
+            b"host CPU/Load/User NaN\n"
+            b"host CPU/Load/User 1e3\n"
+            b"host CPU/Load/User 5 \n"
+            b"  vm1\tCPU/Load/User\t7%\r\n"
+            b"vm1 CPU/Load/User 2.5% \n"
+            b"vm2 RAM/Usage/Used 1GHz\n"
+            b"short line\n"
+            b"vm\xc3\xa9 CPU/Load/User 4%\n"
+            b"vm2 CPU/Load/User 9%   \n"
+        )
+        self.assert_engines_match(output)
+
+    def test_bulk_memo_follows_inventory_changes(self):
+        """Test that memoized keys are rebuilt when a VM's UUID changes"""
+        output = b"vm1 CPU/Load/User 3%\n"
+        self.assert_engines_match(output)
+        self.vm_info = {"vm1": "uuid9"}
+        result = self.assert_engines_match(output)
+        self.assertIn('vm_uuid="uuid9"', result[0])
+
+    def test_parse_metrics_output_uses_configured_engine(self):
+        """Test that the PARSER setting selects the parsing engine"""
+        original = vboxmanagemetrics.PARSER
+        try:
+            with unittest.mock.patch('vboxmanagemetrics.parse_metrics_lines') as mock_lines:
+                vboxmanagemetrics.PARSER = "lines"
+                vboxmanagemetrics.parse_metrics_output(b"", [], {})
+            mock_lines.assert_called_once()
+        finally:
+            vboxmanagemetrics.PARSER = original
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+class StubReceiver(BaseHTTPRequestHandler):
+    """Pushgateway stand-in that records pushes and answers with queued status codes."""
+    protocol_version = "HTTP/1.1"
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        status = server.statuses.pop(0) if server.statuses else 200
+        server.requests.append((self.path, self.client_address[1], body.decode(), status))
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class TestPushMode(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubReceiver)
+        self.server.requests = []
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.client = vboxmanagemetrics.PushClient(f"http://127.0.0.1:{self.server.server_port}",
+                                                   job="vbox", instance="host 1")
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def snapshot(self, value):
+        return vboxmanagemetrics.MetricsSnapshot(f'vbox_host_cpu_load_user{{host="test-host"}} {value}\n')
+
+    def test_pushes_reuse_connection(self):
+        """Test that queued snapshots are PUT in order over one keep-alive connection"""
+        pusher = vboxmanagemetrics.Pusher(self.client, interval=60)
+        for value in (1, 2, 3):
+            pusher.enqueue(self.snapshot(value))
+
+        self.assertTrue(pusher.deliver())
+
+        requests = self.server.requests
+        self.assertEqual([request[0] for request in requests], ["/metrics/job/vbox/instance/host%201"] * 3)
+        self.assertEqual(len({request[1] for request in requests}), 1)
+        self.assertEqual([request[2].split()[-1] for request in requests], ["1", "2", "3"])
+        self.assertEqual(pusher.pushed, 3)
+        self.assertEqual(len(pusher.queue), 0)
+
+    def test_batch_size_limits_each_delivery(self):
+        """Test that one delivery sends at most batch_size snapshots"""
+        pusher = vboxmanagemetrics.Pusher(self.client, interval=60, batch_size=2)
+        for value in (1, 2, 3):
+            pusher.enqueue(self.snapshot(value))
+        pusher.deliver()
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(len(pusher.queue), 1)
+
+    def test_server_error_keeps_snapshot_for_retry(self):
+        """Test that a failed push stays queued and is delivered on the next attempt"""
+        self.server.statuses = [503]
+        pusher = vboxmanagemetrics.Pusher(self.client, interval=60)
+        pusher.enqueue(self.snapshot(1))
+
+        self.assertFalse(pusher.deliver())
+        self.assertEqual(len(pusher.queue), 1)
+        self.assertEqual(pusher.failures, 1)
+
+        self.assertTrue(pusher.deliver())
+        self.assertEqual(pusher.pushed, 1)
+        self.assertEqual(len(pusher.queue), 0)
+
+    def test_rejected_push_is_dropped(self):
+        """Test that a 4xx response drops the snapshot instead of retrying it"""
+        self.server.statuses = [400]
+        pusher = vboxmanagemetrics.Pusher(self.client, interval=60)
+        pusher.enqueue(self.snapshot(1))
+        pusher.enqueue(self.snapshot(2))
+
+        self.assertTrue(pusher.deliver())
+        self.assertEqual(pusher.dropped, 1)
+        self.assertEqual(pusher.pushed, 1)
+
+    def test_unreachable_receiver(self):
+        """Test that connection errors are retryable failures"""
+        client = vboxmanagemetrics.PushClient("http://127.0.0.1:1", timeout=1)
+        pusher = vboxmanagemetrics.Pusher(client, interval=60)
+        pusher.enqueue(self.snapshot(1))
+        self.assertFalse(pusher.deliver())
+        self.assertEqual(len(pusher.queue), 1)
+
+    def test_bounded_queue_and_backoff(self):
+        """Test that the oldest snapshots are dropped when full and backoff is capped"""
+        pusher = vboxmanagemetrics.Pusher(self.client, interval=60, queue_size=2, max_backoff=4)
+        for value in (1, 2, 3):
+            pusher.enqueue(self.snapshot(value))
+        self.assertEqual(pusher.dropped, 1)
+        self.assertEqual([snapshot.text.split()[-1] for snapshot in pusher.queue], ["2", "3"])
+
+        backoffs = [0]
+        for _ in range(5):
+            backoffs.append(pusher.next_backoff(backoffs[-1]))
+        self.assertEqual(backoffs, [0, 1, 2, 4, 4, 4])
+
+    def test_threads_collect_and_push(self):
+        """Test that the started pusher collects and delivers on its own"""
+        backend = vboxmanagemetrics.FakeBackend(vm_info={"vm1": "uuid1"})
+        original_backend = vboxmanagemetrics.BACKEND
+        vboxmanagemetrics.BACKEND = backend
+        pusher = vboxmanagemetrics.Pusher(self.client, interval=60)
+        try:
+            pusher.start()
+            for _ in range(100):
+                if self.server.requests:
+                    break
+                threading.Event().wait(0.02)
+        finally:
+            pusher.stop()
+            vboxmanagemetrics.BACKEND = original_backend
+        self.assertIn('vbox_guest_cpu_load_user{host="test-host",vm="vm1"', self.server.requests[0][2])
+
+    def test_collector_snapshots_pushed_once(self):
+        """Test that a running collector's snapshots are pushed without extra collections"""
+        collector = vboxmanagemetrics.MetricsCollector(interval=60)
+        with patch.object(vboxmanagemetrics, 'BACKEND', vboxmanagemetrics.FakeBackend()), \
+                patch.object(vboxmanagemetrics, 'COLLECTOR', collector), \
+                patch.object(vboxmanagemetrics.MetricsCollector, 'running', True), \
+                patch('vboxmanagemetrics.collect_snapshot', wraps=vboxmanagemetrics.collect_snapshot) as collect:
+            first = collector.refresh()
+            pusher = vboxmanagemetrics.Pusher(self.client, interval=60)
+            self.assertIs(pusher.next_snapshot(), first)
+            pusher._last = first
+            self.assertIsNone(pusher.next_snapshot())
+            second = collector.refresh()
+            self.assertIs(pusher.next_snapshot(), second)
+        self.assertEqual(collect.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
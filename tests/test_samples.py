@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+VM_INFO = {"vm1": "uuid1"}
+
+class TestMultiSampleMetrics(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.addCleanup(setattr, vboxmanagemetrics, "SAMPLE_MODE", vboxmanagemetrics.SAMPLE_MODE)
+        self.addCleanup(setattr, vboxmanagemetrics, "SAMPLE_PERIOD", vboxmanagemetrics.SAMPLE_PERIOD)
+
+    def process(self, line):
+        metrics = []
+        vboxmanagemetrics.process_metric_line(line, metrics, VM_INFO)
+        return metrics
+
+    def test_parse_samples(self):
+        """Test comma-separated samples with per-sample and trailing units"""
+        self.assertEqual(vboxmanagemetrics.parse_samples("1.00%, 2.50%, 3.00%"), [1.0, 2.5, 3.0])
+        self.assertEqual(vboxmanagemetrics.parse_samples("1, 2, 3 kB"), [1024.0, 2048.0, 3072.0])
+
+    def test_last_mode_exposes_newest_sample(self):
+        """Test that the default mode keeps one series with the latest value"""
+        vboxmanagemetrics.SAMPLE_MODE = "last"
+        metrics = self.process("vm1 CPU/Load/User 1.00%, 2.00%, 3.00%")
+        self.assertEqual(metrics, ['vbox_guest_cpu_load_user{host="test-host",vm="vm1",vm_uuid="uuid1"} 3.0'])
+
+    def test_timestamps_mode_spaces_samples_by_period(self):
+        """Test that samples are written oldest first with millisecond timestamps one period apart"""
+        vboxmanagemetrics.SAMPLE_MODE = "timestamps"
+        vboxmanagemetrics.SAMPLE_PERIOD = 5
+        with patch('time.time', return_value=1000.0):
+            metrics = self.process("host CPU/Load/User 1.00%, 2.00%, 3.00%")
+        self.assertEqual(metrics, [
+            'vbox_host_cpu_load_user{host="test-host"} 1.0 990000',
+            'vbox_host_cpu_load_user{host="test-host"} 2.0 995000',
+            'vbox_host_cpu_load_user{host="test-host"} 3.0 1000000',
+        ])
+
+    def test_rollup_mode_adds_stat_series(self):
+        """Test that rollup mode emits min/max/avg alongside the latest value"""
+        vboxmanagemetrics.SAMPLE_MODE = "rollup"
+        metrics = self.process("host CPU/Load/User 1.00%, 5.00%, 3.00%")
+        self.assertEqual(metrics, [
+            'vbox_host_cpu_load_user{host="test-host"} 3.0',
+            'vbox_host_cpu_load_user{host="test-host",stat="min"} 1.0',
+            'vbox_host_cpu_load_user{host="test-host",stat="max"} 5.0',
+            'vbox_host_cpu_load_user{host="test-host",stat="avg"} 3.0',
+        ])
+
+    def test_bulk_parser_handles_samples(self):
+        """Test that the bulk parser falls back for multi-sample lines"""
+        vboxmanagemetrics.SAMPLE_MODE = "rollup"
+        output = b"Object Metric Value\nhost CPU/Load/User 1.00%, 5.00%\n"
+        bulk, lines = [], []
+        vboxmanagemetrics.parse_metrics_bulk(output, bulk, {})
+        vboxmanagemetrics.parse_metrics_lines(output, lines, {})
+        self.assertEqual(bulk, lines)
+        self.assertEqual(len(bulk), 4)
+
+    @patch('subprocess.check_output')
+    def test_cli_setup_metrics(self, mock_check_output):
+        """Test that metrics setup is issued with period and sample count"""
+        vboxmanagemetrics.CliBackend().setup_metrics(5, 10, metrics=["CPU/Load/User"])
+        mock_check_output.assert_called_once_with(
+            ["VBoxManage", "metrics", "setup", "--period", "5", "--samples", "10", "*", "CPU/Load/User"],
+            stderr=vboxmanagemetrics.subprocess.DEVNULL)
+
+if __name__ == '__main__':
+    unittest.main()
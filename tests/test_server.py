@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+import threading
+import types
+import urllib.request
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+class TestServerModes(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.HOSTNAME = "test-host"
+
+    @patch('vboxmanagemetrics.get_metrics')
+    def test_stdlib_server_serves_app(self, mock_get_metrics):
+        """Test that the standard library server serves the Flask routes"""
+        mock_get_metrics.return_value = "stdlib_metrics_data\n"
+        server = vboxmanagemetrics.make_stdlib_server('127.0.0.1', 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            with urllib.request.urlopen(f"{base_url}/") as response:
+                index = json.loads(response.read())
+            with urllib.request.urlopen(f"{base_url}/metrics") as response:
+                body = response.read().decode()
+                content_type = response.headers['Content-Type']
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(index['hostname'], "test-host")
+        self.assertEqual(body, "stdlib_metrics_data\n")
+        self.assertEqual(content_type, 'text/plain; charset=utf-8')
+
+    def test_waitress_options(self):
+        """Test that waitress is started with the configured thread count"""
+        waitress = types.ModuleType("waitress")
+        waitress.serve = MagicMock()
+        with patch.dict(sys.modules, {"waitress": waitress}):
+            vboxmanagemetrics.run_server('waitress', '0.0.0.0', 9200, threads=16, keepalive=10)
+
+        waitress.serve.assert_called_once_with(vboxmanagemetrics.app, host='0.0.0.0', port=9200,
+                                               threads=16, channel_timeout=10)
+
+    def test_missing_server_package(self):
+        """Test that a missing optional server package raises ImportError"""
+        with patch.dict(sys.modules, {"gunicorn": None, "gunicorn.app": None, "gunicorn.app.base": None}):
+            with self.assertRaises(ImportError):
+                vboxmanagemetrics.run_server('gunicorn', '0.0.0.0', 9200)
+
+    @patch('vboxmanagemetrics.app.run')
+    def test_dev_server_default(self, mock_run):
+        """Test that the development server remains the default"""
+        vboxmanagemetrics.run_server('dev', '0.0.0.0', 9200)
+        mock_run.assert_called_once_with(host='0.0.0.0', port=9200, threaded=True)
+
+if __name__ == '__main__':
+    unittest.main()
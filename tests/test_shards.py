@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import unittest
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+class TestSnapshotShards(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.app.testing = True
+        self.app = vboxmanagemetrics.app.test_client()
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.backend = vboxmanagemetrics.FakeBackend(vm_info={"vm1": "uuid1", "vm2": "uuid2"})
+        self.original_backend = vboxmanagemetrics.BACKEND
+        vboxmanagemetrics.BACKEND = self.backend
+
+    def tearDown(self):
+        vboxmanagemetrics.BACKEND = self.original_backend
+        vboxmanagemetrics.COLLECTOR = None
+
+    def test_shards_partition_snapshot(self):
+        """Test that host and VM shards split the series of one snapshot"""
+        snapshot = vboxmanagemetrics.MetricsSnapshot(
+            'vbox_info{hostname="h"} 1\n'
+            'vbox_host_cpu_load_user{host="h"} 1.5\n'
+            'vbox_guest_cpu_load_user{host="h",vm="vm1",vm_uuid="uuid1"} 5.0\n'
+            'vbox_guest_cpu_load_user{host="h",vm="vm2",vm_uuid="uuid2"} 7.0\n'
+            'vbox_exporter_snapshot_timestamp_seconds{host="h"} 100\n', timestamp=100)
+
+        shards = snapshot.shards
+        self.assertEqual(shards["host"].text,
+                         'vbox_info{hostname="h"} 1\nvbox_host_cpu_load_user{host="h"} 1.5\n'
+                         'vbox_exporter_snapshot_timestamp_seconds{host="h"} 100\n')
+        self.assertEqual(shards["vms"]["vm1"].text,
+                         'vbox_guest_cpu_load_user{host="h",vm="vm1",vm_uuid="uuid1"} 5.0\n'
+                         'vbox_exporter_snapshot_timestamp_seconds{host="h"} 100\n')
+        self.assertIs(shards["vms"]["uuid2"], shards["vms"]["vm2"])
+        self.assertIs(snapshot.shards, shards)
+
+    def test_vm_endpoint_by_name_and_uuid(self):
+        """Test that /metrics/vm serves only the selected VM's series"""
+        by_name = self.app.get('/metrics/vm/vm1')
+        by_uuid = self.app.get('/metrics/vm/uuid1')
+
+        self.assertEqual(by_name.status_code, 200)
+        self.assertEqual(by_name.data, by_uuid.data)
+        text = by_name.data.decode()
+        self.assertIn('vm="vm1"', text)
+        self.assertNotIn('vm="vm2"', text)
+        self.assertNotIn('vbox_host_', text)
+
+    def test_host_endpoint(self):
+        """Test that /metrics/host leaves out VM series"""
+        text = self.app.get('/metrics/host').data.decode()
+        self.assertIn('vbox_host_cpu_load_user{host="test-host"} 1.56', text)
+        self.assertNotIn('vm="', text)
+
+    def test_unknown_vm(self):
+        """Test that a VM without series is not found"""
+        self.assertEqual(self.app.get('/metrics/vm/missing').status_code, 404)
+
+    def test_collector_shards_reused(self):
+        """Test that shards come from the collector's snapshot without a new collection"""
+        vboxmanagemetrics.COLLECTOR = vboxmanagemetrics.MetricsCollector(60)
+        vboxmanagemetrics.COLLECTOR.refresh()
+        queries = self.backend.calls["query"]
+
+        first = self.app.get('/metrics/vm/vm2')
+        second = self.app.get('/metrics/vm/vm2', headers={"If-None-Match": first.headers["ETag"]})
+
+        self.assertEqual(self.backend.calls["query"], queries)
+        self.assertIn('vbox_exporter_snapshot_timestamp_seconds', first.data.decode())
+        self.assertIn("Age", first.headers)
+        self.assertEqual(second.status_code, 304)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import multiprocessing
+import signal
+import struct
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+def read_in_worker(shared, connection):
+    """Wait in a forked worker until a snapshot is published and send back what it reads."""
+    while shared.generation < 2:
+        pass
+    snapshot = shared.read()
+    connection.send((shared.generation, snapshot.text, snapshot.etag, snapshot.gzipped))
+
+def run_in_forked_child(function):
+    """Fork, run function in the child with a deadline and return whether it succeeded."""
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            signal.alarm(5)
+            function()
+            status = 0
+        finally:
+            os._exit(status)
+    return os.waitpid(pid, 0)[1] == 0
+
+class TestSharedSnapshot(unittest.TestCase):
+
+    def test_executors_usable_after_fork(self):
+        """Test that pools used before a fork still run work in the child"""
+        executor = vboxmanagemetrics.COMMAND_EXECUTOR
+        self.assertEqual(list(executor.map(abs, [-1, -2])), [1, 2])
+        ok = run_in_forked_child(
+            lambda: vboxmanagemetrics.COMMAND_EXECUTOR.submit(abs, -3).result(timeout=2))
+        self.assertTrue(ok)
+        self.assertIs(vboxmanagemetrics.COMMAND_EXECUTOR, executor)
+
+    def test_history_not_served_from_workers(self):
+        """Test that process-local history is not served in shared mode"""
+        client = vboxmanagemetrics.app.test_client()
+        with patch.object(vboxmanagemetrics, 'HISTORY', vboxmanagemetrics.SeriesHistory(5)), \
+                patch.object(vboxmanagemetrics, 'SHARED_SNAPSHOT', vboxmanagemetrics.SharedSnapshot(4096)):
+            self.assertEqual(client.get('/metrics/history').status_code, 404)
+
+    def test_worker_reads_published_snapshot(self):
+        """Test that a forked worker sees snapshots written after it started"""
+        shared = vboxmanagemetrics.SharedSnapshot(1024 * 1024)
+        context = multiprocessing.get_context("fork")
+        receiver, sender = context.Pipe(duplex=False)
+        worker = context.Process(target=read_in_worker, args=(shared, sender))
+        worker.start()
+
+        snapshot = vboxmanagemetrics.MetricsSnapshot('vbox_info{hostname="h"} 1\n', timestamp=100)
+        self.assertTrue(shared.write(snapshot))
+        self.assertTrue(receiver.poll(10))
+        generation, text, etag, gzipped = receiver.recv()
+        worker.join(10)
+
+        self.assertEqual(generation, 2)
+        self.assertEqual(text, snapshot.text)
+        self.assertEqual(etag, snapshot.etag)
+        self.assertEqual(gzipped, snapshot.gzipped)
+
+    def test_read_cached_per_generation(self):
+        """Test that readers rebuild the snapshot only when the generation changes"""
+        shared = vboxmanagemetrics.SharedSnapshot(1024 * 1024)
+        self.assertIsNone(shared.read())
+
+        shared.write(vboxmanagemetrics.MetricsSnapshot("a 1\n", timestamp=1))
+        first = shared.read()
+        self.assertIs(shared.read(), first)
+        self.assertEqual(first.timestamp, 1)
+
+        shared.write(vboxmanagemetrics.MetricsSnapshot("a 2\n", timestamp=2))
+        second = shared.read()
+        self.assertIsNot(second, first)
+        self.assertEqual(second.text, "a 2\n")
+        self.assertEqual(shared.generation, 4)
+
+    def test_oversized_snapshot_rejected(self):
+        """Test that a snapshot larger than the buffer leaves the previous one in place"""
+        shared = vboxmanagemetrics.SharedSnapshot(256)
+        shared.write(vboxmanagemetrics.MetricsSnapshot("a 1\n"))
+        self.assertFalse(shared.write(vboxmanagemetrics.MetricsSnapshot("b 1\n" * 200)))
+        self.assertEqual(shared.read().text, "a 1\n")
+
+    def test_reader_waits_for_write_in_progress(self):
+        """Test that an odd generation makes readers retry until the write completes"""
+        shared = vboxmanagemetrics.SharedSnapshot(1024)
+        shared.write(vboxmanagemetrics.MetricsSnapshot("a 1\n"))
+        struct.pack_into("<Q", shared._buffer, 0, 3)
+
+        def finish_write(seconds):
+            struct.pack_into("<Q", shared._buffer, 0, 4)
+
+        with patch('time.sleep', side_effect=finish_write) as mock_sleep:
+            snapshot = shared.read()
+        mock_sleep.assert_called_once_with(0)
+        self.assertEqual(snapshot.text, "a 1\n")
+
+    def test_abandoned_write_serves_last_read(self):
+        """Test that a write that never finishes makes readers fall back instead of spinning"""
+        shared = vboxmanagemetrics.SharedSnapshot(1024)
+        shared.write(vboxmanagemetrics.MetricsSnapshot("a 1\n"))
+        last = shared.read()
+        struct.pack_into("<Q", shared._buffer, 0, 3)
+
+        with patch.object(shared, 'READ_TIMEOUT', 0.05):
+            self.assertIs(shared.read(), last)
+            with patch('time.sleep') as mock_sleep:
+                self.assertIs(shared.read(), last)
+        # The abandoned generation is not waited on again
+        mock_sleep.assert_not_called()
+
+class TestSharedSnapshotRoute(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.app.testing = True
+        self.app = vboxmanagemetrics.app.test_client()
+        vboxmanagemetrics.SHARED_SNAPSHOT = vboxmanagemetrics.SharedSnapshot(1024 * 1024)
+        vboxmanagemetrics.COLLECTOR = vboxmanagemetrics.MetricsCollector(60)
+
+    def tearDown(self):
+        vboxmanagemetrics.SHARED_SNAPSHOT = None
+        vboxmanagemetrics.COLLECTOR = None
+
+    def test_served_from_shared_buffer_without_collecting(self):
+        """Test that /metrics serves the shared snapshot and never collects in the worker"""
+        with patch('vboxmanagemetrics.get_metrics') as mock_get_metrics:
+            self.assertEqual(self.app.get('/metrics').status_code, 503)
+            vboxmanagemetrics.SHARED_SNAPSHOT.write(vboxmanagemetrics.MetricsSnapshot('vbox_info{hostname="h"} 1\n'))
+            response = self.app.get('/metrics', headers={"Accept-Encoding": "gzip"})
+        mock_get_metrics.assert_not_called()
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Age", response.headers)
+
+    def test_narrowed_scrape_refused_in_worker(self):
+        """Test that ?vm= and ?metric= scrapes are refused instead of collected in the worker"""
+        vboxmanagemetrics.SHARED_SNAPSHOT.write(vboxmanagemetrics.MetricsSnapshot('vbox_info{hostname="h"} 1\n'))
+        with patch('vboxmanagemetrics.get_metrics') as mock_get_metrics:
+            for query in ("vm=vm1", "metric=CPU/Load/User"):
+                response = self.app.get(f'/metrics?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(b"/metrics/vm/<vm>", response.data)
+        mock_get_metrics.assert_not_called()
+
+    def test_collector_publishes_refresh(self):
+        """Test that collector refreshes are written to the shared buffer"""
+        backend = vboxmanagemetrics.FakeBackend(vm_info={"vm1": "uuid1"})
+        with patch.object(vboxmanagemetrics, 'BACKEND', backend):
+            snapshot = vboxmanagemetrics.COLLECTOR.refresh()
+        self.assertEqual(vboxmanagemetrics.SHARED_SNAPSHOT.read().text, snapshot.text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch, MagicMock
+import io
+import threading
+import time
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+METRICS_OUTPUT = (
+    b"Object      Metric                Value\n"
+    b"host        CPU/Load/User         1.5%\n"
+    b"host        RAM/Usage/Used        4096kB\n"
+    b"vm1         CPU/Load/User         5.0%\n"
+)
+
+def make_process(output, returncode=0):
+    """Build a Popen stand-in whose stdout yields output"""
+    proc = MagicMock()
+    proc.stdout = io.BytesIO(output)
+    proc.wait.return_value = returncode
+    proc.poll.return_value = returncode
+    return proc
+
+class TestStreamingMetrics(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.app.testing = True
+        self.app = vboxmanagemetrics.app.test_client()
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        vboxmanagemetrics.STREAM = True
+
+    def tearDown(self):
+        vboxmanagemetrics.STREAM = False
+
+    @patch('subprocess.check_output')
+    @patch('subprocess.Popen')
+    def test_stream_matches_buffered_output(self, mock_popen, mock_check_output):
+        """Test that streamed output is identical to get_metrics()"""
+        def side_effect(cmd, stderr=None):
+            if cmd[1] == "list":
+                return b'"vm1" {uuid1}'
+            return METRICS_OUTPUT
+
+        mock_check_output.side_effect = side_effect
+        mock_popen.return_value = make_process(METRICS_OUTPUT)
+
+        streamed = ''.join(vboxmanagemetrics.stream_metrics())
+        vboxmanagemetrics.VM_INVENTORY.invalidate()
+        buffered = vboxmanagemetrics.get_metrics()
+
+        # Exporter self-metrics change between collections, so compare the VBox series
+        strip_exporter = lambda text: [line for line in text.splitlines()
+                                       if not line.startswith('vbox_exporter_')]
+        self.assertEqual(strip_exporter(streamed), strip_exporter(buffered))
+        self.assertIn('vm="vm1",vm_uuid="uuid1"', streamed)
+
+    @patch('subprocess.check_output')
+    @patch('subprocess.Popen')
+    def test_stream_yields_in_chunks(self, mock_popen, mock_check_output):
+        """Test that large outputs are sent as several chunks"""
+        mock_check_output.return_value = b'"vm1" {uuid1}'
+        mock_popen.return_value = make_process(METRICS_OUTPUT * 50)
+
+        with patch('vboxmanagemetrics.STREAM_CHUNK_SIZE', 200):
+            chunks = list(vboxmanagemetrics.stream_metrics())
+
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(''.join(chunks).count('vbox_guest_cpu_load_user'), 50)
+
+    @patch('subprocess.check_output')
+    @patch('subprocess.Popen')
+    def test_stream_reports_query_failure(self, mock_popen, mock_check_output):
+        """Test that a failing metrics query ends the stream with an error comment"""
+        mock_check_output.return_value = b'"vm1" {uuid1}'
+        mock_popen.return_value = make_process(b"", returncode=1)
+
+        streamed = ''.join(vboxmanagemetrics.stream_metrics())
+
+        self.assertTrue(streamed.splitlines()[-1].startswith("# Error fetching VBox metrics"))
+
+    @patch('subprocess.check_output')
+    @patch('subprocess.Popen')
+    def test_metrics_route_streams(self, mock_popen, mock_check_output):
+        """Test that /metrics returns a streamed response when enabled"""
+        mock_check_output.return_value = b'"vm1" {uuid1}'
+        mock_popen.return_value = make_process(METRICS_OUTPUT)
+
+        response = self.app.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertIn('vbox_host_cpu_load_user{host="test-host"} 1.5', response.data.decode())
+
+    @patch('subprocess.check_output')
+    @patch('subprocess.Popen')
+    def test_concurrent_streams_share_one_query(self, mock_popen, mock_check_output):
+        """Test that a scrape arriving during a stream gets its text instead of starting another query"""
+        mock_check_output.return_value = b'"vm1" {uuid1}'
+        release = threading.Event()
+
+        class BlockingOutput:
+            def __iter__(self):
+                release.wait(5)
+                yield from io.BytesIO(METRICS_OUTPUT)
+
+            def close(self):
+                pass
+
+        proc = make_process(b"")
+        proc.stdout = BlockingOutput()
+        mock_popen.return_value = proc
+        coalesced = vboxmanagemetrics.SCRAPE_FLIGHT.coalesced
+
+        leader = vboxmanagemetrics.stream_snapshot()
+        first = next(leader)
+        followers = []
+        thread = threading.Thread(target=lambda: followers.append(''.join(vboxmanagemetrics.stream_snapshot())))
+        thread.start()
+        while vboxmanagemetrics.SCRAPE_FLIGHT.coalesced == coalesced:
+            time.sleep(0.01)
+        release.set()
+        streamed = first + ''.join(leader)
+        thread.join(5)
+
+        self.assertEqual(mock_popen.call_count, 1)
+        self.assertEqual(followers, [streamed])
+        self.assertIn('vbox_guest_cpu_load_user', streamed)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import subprocess
+import tempfile
+import threading
+import time
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+def process_alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+class TestCommandTimeouts(unittest.TestCase):
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "needs /proc")
+    def test_timeout_kills_process_group(self):
+        """Test that a hung command and the children it started are all killed"""
+        with tempfile.TemporaryDirectory() as tmp:
+            pid_file = os.path.join(tmp, "child.pid")
+            cmd = ["sh", "-c", f"sleep 30 & echo $! > {pid_file}; wait"]
+            with self.assertRaises(subprocess.TimeoutExpired):
+                vboxmanagemetrics.check_output_group(cmd, 0.5)
+            with open(pid_file) as f:
+                child = int(f.read())
+        deadline = time.time() + 5
+        while process_alive(child) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(process_alive(child))
+
+    def test_check_output_group_errors(self):
+        """Test that output and exit status behave like check_output"""
+        self.assertEqual(vboxmanagemetrics.check_output_group(["sh", "-c", "echo ok"], 5), b"ok\n")
+        with self.assertRaises(subprocess.CalledProcessError):
+            vboxmanagemetrics.check_output_group(["sh", "-c", "exit 3"], 5)
+
+    @patch('vboxmanagemetrics.check_output_group', side_effect=subprocess.TimeoutExpired(["VBoxManage"], 2))
+    def test_runner_timeout_is_collection_error(self, mock_check_output_group):
+        """Test that a timed-out command fails the collection and is counted"""
+        stats = vboxmanagemetrics.ExporterStats()
+        with patch.object(vboxmanagemetrics, 'STATS', stats):
+            with self.assertRaises(vboxmanagemetrics.CollectionError):
+                vboxmanagemetrics.LocalRunner(timeout=2).run("list", "vms")
+        rendered = "\n".join(stats.render())
+        self.assertIn('vbox_exporter_subprocess_timeouts_total{host="', rendered)
+        self.assertIn('command="list"} 1', rendered)
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "needs /proc")
+    def test_streamed_command_times_out(self):
+        """Test that a hung streamed query is killed with its children at the deadline"""
+        with tempfile.TemporaryDirectory() as tmp:
+            pid_file = os.path.join(tmp, "child.pid")
+            cmd = ["sh", "-c", f"echo 'host CPU/Load/User 1%'; sleep 30 & echo $! > {pid_file}; wait"]
+            lines = vboxmanagemetrics.ProcessLines(cmd, "metrics", timeout=0.5)
+            start = time.time()
+            received = []
+            with self.assertRaises(vboxmanagemetrics.CollectionError):
+                for line in lines:
+                    received.append(line)
+            lines.close()
+            self.assertLess(time.time() - start, 5)
+            self.assertEqual(received, [b"host CPU/Load/User 1%\n"])
+            with open(pid_file) as f:
+                child = int(f.read())
+        deadline = time.time() + 5
+        while process_alive(child) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(process_alive(child))
+
+class TestStaleServing(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.app.testing = True
+        self.app = vboxmanagemetrics.app.test_client()
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.backend = vboxmanagemetrics.FakeBackend(vm_info={"vm1": "uuid1"})
+        self.original_backend = vboxmanagemetrics.BACKEND
+        vboxmanagemetrics.BACKEND = self.backend
+
+    def tearDown(self):
+        vboxmanagemetrics.BACKEND = self.original_backend
+        vboxmanagemetrics.SCRAPE_TIMEOUT = 0
+
+    def test_failed_collection_serves_last_good(self):
+        """Test that a failing collection is answered with the previous snapshot"""
+        good = self.app.get('/metrics').data.decode()
+        with patch.object(self.backend, 'query_metrics', side_effect=vboxmanagemetrics.CollectionError("busy")):
+            stale = self.app.get('/metrics').data.decode()
+
+        self.assertTrue(stale.startswith(good))
+        self.assertIn('vbox_exporter_snapshot_stale_seconds{host="test-host"}', stale)
+        self.assertNotIn('# Error fetching', stale)
+
+    def test_slow_collection_serves_last_good(self):
+        """Test that a scrape stops waiting for a slow collection after SCRAPE_TIMEOUT"""
+        self.app.get('/metrics')
+        release = threading.Event()
+        original_query = self.backend.query_metrics
+
+        def slow_query(objects=None, metrics=None):
+            release.wait(5)
+            return original_query(objects, metrics)
+
+        vboxmanagemetrics.SCRAPE_TIMEOUT = 0.1
+        try:
+            with patch.object(self.backend, 'query_metrics', side_effect=slow_query):
+                start = time.perf_counter()
+                text = self.app.get('/metrics').data.decode()
+                elapsed = time.perf_counter() - start
+        finally:
+            release.set()
+        self.assertLess(elapsed, 2)
+        self.assertIn('vbox_exporter_snapshot_stale_seconds', text)
+
+    def test_timed_out_scrapes_share_one_collection(self):
+        """Test that scrapes giving up on a slow collection do not queue collections of their own"""
+        self.app.get('/metrics')
+        release = threading.Event()
+        original_query = self.backend.query_metrics
+        queries = []
+
+        def slow_query(objects=None, metrics=None):
+            queries.append(objects)
+            release.wait(5)
+            return original_query(objects, metrics)
+
+        vboxmanagemetrics.SCRAPE_TIMEOUT = 0.05
+        with patch.object(self.backend, 'query_metrics', side_effect=slow_query):
+            try:
+                for _ in range(6):
+                    self.assertIn('vbox_exporter_snapshot_stale_seconds', self.app.get('/metrics').data.decode())
+            finally:
+                release.set()
+            vboxmanagemetrics.PENDING_COLLECTION.result(timeout=5)
+            time.sleep(0.2)
+        self.assertEqual(len(queries), 1)
+
+    def test_failure_without_good_snapshot_reports_error(self):
+        """Test that the error is served when there is nothing to fall back on"""
+        with patch.object(self.backend, 'query_metrics', side_effect=vboxmanagemetrics.CollectionError("busy")):
+            text = self.app.get('/metrics').data.decode()
+        self.assertTrue(text.startswith('# Error fetching VBox metrics'))
+
+class TestAdaptiveInterval(unittest.TestCase):
+
+    def test_backoff_and_recovery(self):
+        """Test that the refresh interval doubles while slow and returns once fast"""
+        collector = vboxmanagemetrics.MetricsCollector(10, max_interval=40)
+        collector.current_interval = collector.next_interval(8, False)
+        self.assertEqual(collector.current_interval, 20)
+        collector.current_interval = collector.next_interval(0.1, True)
+        self.assertEqual(collector.current_interval, 40)
+        collector.current_interval = collector.next_interval(0.1, True)
+        self.assertEqual(collector.current_interval, 40)
+        collector.current_interval = collector.next_interval(0.1, False)
+        self.assertEqual(collector.current_interval, 20)
+        collector.current_interval = collector.next_interval(0.1, False)
+        self.assertEqual(collector.current_interval, 10)
+        self.assertEqual(collector.next_interval(0.1, False), 10)
+
+    def test_failed_refresh_keeps_last_good(self):
+        """Test that the collector keeps serving the last good data when a refresh fails"""
+        backend = vboxmanagemetrics.FakeBackend(vm_info={"vm1": "uuid1"})
+        with patch.object(vboxmanagemetrics, 'BACKEND', backend):
+            collector = vboxmanagemetrics.MetricsCollector(10)
+            good = collector.refresh()
+            with patch.object(backend, 'query_metrics', side_effect=vboxmanagemetrics.CollectionError("busy")):
+                stale = collector.refresh()
+        self.assertTrue(collector.failed)
+        self.assertEqual(stale.timestamp, good.timestamp)
+        self.assertIn('vbox_exporter_snapshot_stale_seconds', stale.text)
+        self.assertIn('vbox_guest_cpu_load_user', stale.text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+import tempfile
+import sys
+import os
+
+# Add parent directory to path so we can import the module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import vboxmanagemetrics
+
+SHOWVMINFO_OUTPUT = b'''name="web1"
+groups="/prod"
+ostype="Ubuntu (64-bit)"
+UUID="uuid1"
+CfgFile="/vms/web1/web1.vbox"
+memory=2048
+cpus=4
+VMState="running"
+"storagecontrollername0"="SATA"
+'''
+
+class TestMachineReadable(unittest.TestCase):
+
+    def test_vm_details_from_showvminfo(self):
+        """Test extracting enrichment fields from showvminfo output"""
+        info = vboxmanagemetrics.parse_machinereadable(SHOWVMINFO_OUTPUT.decode())
+        self.assertEqual(info["storagecontrollername0"], "SATA")
+        self.assertEqual(vboxmanagemetrics.vm_details_from_info(info), {
+            "state": "running", "os_type": "Ubuntu (64-bit)", "group": "/prod", "cpus": 4,
+            "memory_bytes": 2048 * 1024 * 1024, "config_file": "/vms/web1/web1.vbox"})
+
+    @patch('subprocess.check_output', return_value=SHOWVMINFO_OUTPUT)
+    def test_cli_backend_runs_showvminfo(self, mock_check_output):
+        """Test that the CLI backend reads details from showvminfo --machinereadable"""
+        details = vboxmanagemetrics.CliBackend().vm_details("uuid1")
+        self.assertEqual(details["cpus"], 4)
+        self.assertEqual(mock_check_output.call_args[0][0],
+                         ["VBoxManage", "showvminfo", "uuid1", "--machinereadable"])
+
+class TestVMDetailsCache(unittest.TestCase):
+
+    def setUp(self):
+        vboxmanagemetrics.HOSTNAME = "test-host"
+        self.backend = vboxmanagemetrics.FakeBackend(vm_info={"vm1": "uuid1", "vm2": "uuid2"})
+        self.original_backend = vboxmanagemetrics.BACKEND
+        vboxmanagemetrics.BACKEND = self.backend
+        vboxmanagemetrics.VM_DETAILS = vboxmanagemetrics.VMDetailsCache(ttl=600)
+
+    def tearDown(self):
+        vboxmanagemetrics.BACKEND = self.original_backend
+        vboxmanagemetrics.VM_DETAILS = None
+
+    def test_details_rendered_and_cached(self):
+        """Test that details become series and are fetched once per VM while fresh"""
+        metrics = vboxmanagemetrics.get_metrics()
+        vboxmanagemetrics.get_metrics()
+
+        self.assertIn('vbox_vm_info{host="test-host",vm="vm1",vm_uuid="uuid1",'
+                      'state="running",os_type="Linux_64",group="/"} 1', metrics)
+        self.assertIn('vbox_vm_cpus{host="test-host",vm="vm2",vm_uuid="uuid2"} 2', metrics)
+        self.assertIn('vbox_vm_memory_bytes{host="test-host",vm="vm1",vm_uuid="uuid1"} 2147483648', metrics)
+        self.assertEqual(self.backend.calls["details"], 2)
+
+    def test_ttl_expiry_refetches(self):
+        """Test that expired entries are fetched again"""
+        vboxmanagemetrics.VM_DETAILS.ttl = 0
+        vboxmanagemetrics.VM_DETAILS.get({"vm1": "uuid1"})
+        vboxmanagemetrics.VM_DETAILS.get({"vm1": "uuid1"})
+        self.assertEqual(self.backend.calls["details"], 2)
+
+    def test_settings_file_change_refetches(self):
+        """Test that a modified settings file invalidates the cached entry"""
+        with tempfile.NamedTemporaryFile(suffix=".vbox") as cfg:
+            details = {"state": "poweroff", "os_type": "", "group": "/", "cpus": 1,
+                       "memory_bytes": None, "config_file": cfg.name}
+            with patch.object(self.backend, 'vm_details', return_value=details) as vm_details:
+                cache = vboxmanagemetrics.VM_DETAILS
+                cache.get({"vm1": "uuid1"})
+                cache.get({"vm1": "uuid1"})
+                self.assertEqual(vm_details.call_count, 1)
+
+                stat = os.stat(cfg.name)
+                os.utime(cfg.name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+                cache.get({"vm1": "uuid1"})
+                self.assertEqual(vm_details.call_count, 2)
+
+    def test_detail_labels_are_escaped(self):
+        """Test that free-form settings such as group names cannot break the exposition format"""
+        details = {"state": "running", "os_type": "Linux_64", "group": '/a"b\\c', "cpus": None,
+                   "memory_bytes": None, "config_file": None}
+        with patch.object(self.backend, 'vm_details', return_value=details):
+            metrics = vboxmanagemetrics.get_vm_detail_metrics({"vm1": "uuid1"}, vboxmanagemetrics.MetricsFilter())
+        self.assertEqual(metrics, ['vbox_vm_info{host="test-host",vm="vm1",vm_uuid="uuid1",'
+                                   'state="running",os_type="Linux_64",group="/a\\"b\\\\c"} 1'])
+
+    def test_filtered_scrape_only_covers_selected_vms(self):
+        """Test that narrowed scrapes only include details of the selected VMs"""
+        metrics_filter = vboxmanagemetrics.MetricsFilter(objects=["vm1"])
+        metrics = vboxmanagemetrics.get_metrics(metrics_filter)
+        self.assertIn('vm="vm1"', metrics)
+        self.assertNotIn('vbox_vm_info{host="test-host",vm="vm2"', metrics)
+
+    def test_narrowed_scrapes_keep_other_vms_cached(self):
+        """Test that alternating narrowed and full scrapes fetch each VM's details only once"""
+        for objects in (None, ["vm1"], None, ["vm2"], None):
+            metrics_filter = None if objects is None else vboxmanagemetrics.METRICS_FILTER.narrow(objects)
+            metrics = vboxmanagemetrics.get_metrics(metrics_filter)
+            if objects is None:
+                self.assertIn('vbox_vm_info{host="test-host",vm="vm1"', metrics)
+                self.assertIn('vbox_vm_info{host="test-host",vm="vm2"', metrics)
+        self.assertEqual(self.backend.calls["details"], 2)
+
+    def test_removed_vms_are_dropped(self):
+        """Test that entries of VMs missing from the inventory are pruned"""
+        cache = vboxmanagemetrics.VM_DETAILS
+        cache.get({"vm1": "uuid1", "vm2": "uuid2"})
+        cache.get({"vm1": "uuid1"}, ["vm1"])
+        cache.get({"vm1": "uuid1", "vm2": "uuid2"})
+        self.assertEqual(self.backend.calls["details"], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,78 @@
 #!/usr/bin/env python3
 
-from flask import Flask, Response, jsonify
+from flask import Flask, Response, jsonify, request
 import subprocess
 import socket
 import re
 import argparse
+import signal
+import threading
+import time
+import io
+import collections
+import socketserver
+import sys
+import bisect
+import gzip
+import hashlib
+import http.client
+import urllib.parse
+import fnmatch
+import shlex
+import math
+import mmap
+import struct
+import os
+import tempfile
+from array import array
+from functools import cached_property
+from wsgiref.simple_server import WSGIServer, make_server
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 app = Flask(__name__)
 
 # Get hostname for labels
 HOSTNAME = socket.gethostname()
 
+# Runs independent VBoxManage invocations side by side
+COMMAND_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vboxmanage")
+
+# Runs per-object metrics queries; separate so queries never wait on their own pool
+OBJECT_QUERY_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vboxmanage-query")
+
+# Runs on-demand collections that scrapes wait on for at most SCRAPE_TIMEOUT
+SCRAPE_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vbox-scrape")
+
+# Runs per-VM showvminfo calls for VM detail enrichment
+ENRICHMENT_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="vboxmanage-showvminfo")
+
+# Collects federation targets; bounds the remote connections in use at once
+FEDERATION_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="vboxmanage-target")
+
+def recreate_executors():
+    """Replace the thread pools in a forked child.
+
+    Pools inherited through fork keep their bookkeeping but not their
+    threads, so work submitted to them in the child would never run.
+    """
+    global COMMAND_EXECUTOR, OBJECT_QUERY_EXECUTOR, SCRAPE_EXECUTOR, ENRICHMENT_EXECUTOR
+    global FEDERATION_EXECUTOR, GUEST_PROPERTY_EXECUTOR, PENDING_COLLECTION
+
+    def fresh(executor):
+        return ThreadPoolExecutor(max_workers=executor._max_workers,
+                                  thread_name_prefix=executor._thread_name_prefix)
+
+    COMMAND_EXECUTOR = fresh(COMMAND_EXECUTOR)
+    OBJECT_QUERY_EXECUTOR = fresh(OBJECT_QUERY_EXECUTOR)
+    SCRAPE_EXECUTOR = fresh(SCRAPE_EXECUTOR)
+    ENRICHMENT_EXECUTOR = fresh(ENRICHMENT_EXECUTOR)
+    FEDERATION_EXECUTOR = fresh(FEDERATION_EXECUTOR)
+    GUEST_PROPERTY_EXECUTOR = fresh(GUEST_PROPERTY_EXECUTOR)
+    # A collection pending on the parent's pool never completes here
+    PENDING_COLLECTION = None
+
+os.register_at_fork(after_in_child=recreate_executors)
+
 def normalize_metric_name(metric_name):
     """Convert VBox metric name to Prometheus format"""
     # Replace special characters and convert to lowercase
@@ -48,47 +110,450 @@ def parse_value(value_str):
 def get_info_metric():
     return f'vbox_info{{hostname="{HOSTNAME}"}} 1'
 
-def get_vm_info():
-        # Get VM info for better labels
-        vm_info = {}
-        vms_output = subprocess.check_output(["VBoxManage", "list", "vms"],
-                                          stderr=subprocess.DEVNULL).decode()
-        for line in vms_output.strip().split('\n'):
-            if '"' in line and '{' in line:
-                name = line.split('"')[1]
-                uuid = line.split('{')[1].split('}')[0]
-                vm_info[name] = uuid
-
-        return vm_info
-
-def get_metrics():
+def get_metrics(metrics_filter=None, records=None):
     metrics = []
+    stages = {}
+    start = time.perf_counter()
+    if metrics_filter is None:
+        metrics_filter = METRICS_FILTER
+    if TARGETS:
+        return get_federated_metrics(metrics_filter, records)
 
     try:
         # Add host info metric
         metrics.append(f'vbox_info{{hostname="{HOSTNAME}"}} 1')
 
-        # Fetch VM info for labels
-        vm_info = get_vm_info()
-
-        # Fetch all VBox metrics
-        output = subprocess.check_output(["VBoxManage", "metrics", "query", "*"], 
-                                          stderr=subprocess.DEVNULL).decode()
+        # Fetch VM info for labels and all VBox metrics concurrently,
+        # skipping the VM listing while the cached inventory is fresh
+        if VM_INVENTORY.is_fresh():
+            STATS.inc("vbox_exporter_cache_hits_total", cache="inventory")
+            vm_info = VM_INVENTORY.get()
+            output = query_metrics(metrics_filter)
+            vm_info = VM_INVENTORY.resolve(find_vm_objects(output), vm_info)
+        elif not BACKEND.concurrent:
+            STATS.inc("vbox_exporter_cache_misses_total", cache="inventory")
+            vm_info = VM_INVENTORY.update(get_vm_info())
+            output = query_metrics(metrics_filter)
+        else:
+            STATS.inc("vbox_exporter_cache_misses_total", cache="inventory")
+            vm_info_future = COMMAND_EXECUTOR.submit(get_vm_info)
+            output_future = COMMAND_EXECUTOR.submit(query_metrics, metrics_filter)
+            vm_info = VM_INVENTORY.update(vm_info_future.result())
+            output = output_future.result()
+        stages["collect"] = time.perf_counter() - start
 
         # Process metrics output
-        for line in output.strip().split('\n'):
-            process_metric_line(line, metrics, vm_info)
+        parse_start = time.perf_counter()
+        renders = SERIES_KEYS.renders
+        parsed = parse_metrics_output(output, metrics, vm_info, records=records)
+        SERIES_KEYS.retain(vm_info)
+        stages["parse"] = time.perf_counter() - parse_start
+        record_parse_stats(output, parsed, SERIES_KEYS.renders - renders)
+
+        if VM_DETAILS is not None:
+            enrich_start = time.perf_counter()
+            metrics.extend(get_vm_detail_metrics(vm_info, metrics_filter))
+            stages["enrich"] = time.perf_counter() - enrich_start
+        if GUEST_PROPERTIES is not None:
+            metrics.extend(get_guest_property_metrics(vm_info, metrics_filter))
 
-    except subprocess.CalledProcessError as e:
+    except COLLECTION_ERRORS as e:
+        STATS.observe("vbox_exporter_scrape_duration_seconds", time.perf_counter() - start)
         return f"# Error fetching VBox metrics: {str(e)}\n"
 
-    return '\n'.join(metrics) + '\n'
+    render_start = time.perf_counter()
+    metrics.extend(get_exporter_metrics())
+    text = '\n'.join(metrics) + '\n'
+    stages["render"] = time.perf_counter() - render_start
+    stages["total"] = time.perf_counter() - start
 
-def get_vm_info():
-    """Fetch VM names and UUIDs from VBoxManage."""
+    STATS.observe("vbox_exporter_parse_duration_seconds", stages["parse"])
+    STATS.observe("vbox_exporter_render_duration_seconds", stages["render"])
+    STATS.observe("vbox_exporter_scrape_duration_seconds", stages["total"])
+    if PROFILE_HOOK is not None:
+        PROFILE_HOOK(stages)
+    return text
+
+# metrics query header, separator and blank lines, which carry no values
+NON_DATA_LINE_PATTERN = re.compile(rb'^(?:Object\s|-+(?:\s|$)|[ \t\r]*$)', re.MULTILINE)
+
+def record_parse_stats(output, parsed, renders):
+    """Count parsed and dropped lines and series key cache use for one collection.
+
+    Dropped lines are data lines that produced no series, such as NaN values;
+    a clean collection drops none.
+    """
+    output = output.strip()
+    lines = output.count(b'\n') + 1 - len(NON_DATA_LINE_PATTERN.findall(output)) if output else 0
+    STATS.inc("vbox_exporter_lines_parsed_total", parsed)
+    STATS.inc("vbox_exporter_lines_dropped_total", max(0, lines - parsed))
+    STATS.inc("vbox_exporter_cache_hits_total", max(0, parsed - renders), cache="series_keys")
+    STATS.inc("vbox_exporter_cache_misses_total", renders, cache="series_keys")
+
+def get_exporter_metrics():
+    """Render the exporter's own counters and timing histograms."""
+    return [
+        f'vbox_exporter_collections_total{{host="{HOSTNAME}"}} {SCRAPE_FLIGHT.executions}',
+        f'vbox_exporter_scrapes_coalesced_total{{host="{HOSTNAME}"}} {SCRAPE_FLIGHT.coalesced}',
+    ] + (PUSHER.render() if PUSHER is not None else []) + STATS.render()
+
+def print_stage_profile(stages):
+    """Profiling hook that writes the per-stage breakdown of a scrape to stderr."""
+    breakdown = " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in stages.items())
+    print(f"vboxmanagemetrics scrape: {breakdown}", file=sys.stderr, flush=True)
+
+# Called with a {stage: seconds} breakdown after every collection when set
+PROFILE_HOOK = None
+
+# Upper bounds of the exporter's duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (None,), self.counts):
+            cumulative += count
+            le = "+Inf" if bound is None else str(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+class ExporterStats:
+    """Counters and histograms describing the exporter's own work."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, amount=1, **labels):
+        """Add amount to a counter."""
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram."""
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def counter(self, name, **labels):
+        """Return the current value of a counter."""
+        with self._lock:
+            return self._counters.get((name, tuple(labels.items())), 0)
+
+    def histogram(self, name, **labels):
+        """Return a histogram, or None if nothing has been observed yet."""
+        with self._lock:
+            return self._histograms.get((name, tuple(labels.items())))
+
+    def render(self):
+        """Render every counter and histogram as exposition lines."""
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f'{name}{{{self._labels(labels)}}} {value}')
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                lines.extend(histogram.render(name, self._labels(labels)))
+        return lines
+
+    @staticmethod
+    def _labels(labels):
+        return ",".join([f'host="{HOSTNAME}"'] + [f'{k}="{v}"' for k, v in labels])
+
+# The exporter's own instrumentation
+STATS = ExporterStats()
+
+class CommandRunner:
+    """Runs VBoxManage subcommands on some host and returns their output."""
+
+    # Seconds a command may run before it is killed; None waits indefinitely
+    timeout = None
+
+    def run(self, *args, timeout=None):
+        """Run a VBoxManage subcommand, recording its duration and any failure.
+
+        timeout overrides the runner's own command timeout for this call.
+        """
+        command = args[0]
+        start = time.perf_counter()
+        try:
+            return self.execute(args, timeout)
+        except COLLECTION_ERRORS:
+            STATS.inc("vbox_exporter_subprocess_failures_total", command=command)
+            raise
+        finally:
+            STATS.observe("vbox_exporter_subprocess_duration_seconds", time.perf_counter() - start,
+                          command=command)
+
+    def execute(self, args, timeout=None):
+        """Return the output of VBoxManage run with args, raising on failure."""
+        raise NotImplementedError
+
+    def command(self, args):
+        """Return the argv that runs VBoxManage with args, or None if it cannot be spawned."""
+        return None
+
+class LocalRunner(CommandRunner):
+    """Runs VBoxManage on this host, killing it after timeout seconds if set."""
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    def execute(self, args, timeout=None):
+        timeout = timeout or self.timeout
+        if timeout is None:
+            return subprocess.check_output(self.command(args), stderr=subprocess.DEVNULL)
+        try:
+            return check_output_group(self.command(args), timeout)
+        except subprocess.TimeoutExpired as e:
+            STATS.inc("vbox_exporter_subprocess_timeouts_total", command=args[0])
+            raise CollectionError(f"VBoxManage {args[0]} timed out after {timeout}s") from e
+
+    def command(self, args):
+        return ["VBoxManage", *args]
+
+class SshRunner(CommandRunner):
+    """Runs VBoxManage on a remote host over a multiplexed SSH connection.
+
+    The first command opens a master connection that later commands reuse,
+    so each collection does not pay for a new SSH handshake.
+    """
+
+    def __init__(self, host, timeout=10, control_dir=None, options=()):
+        self.host = host
+        self.timeout = timeout
+        self.control_dir = control_dir or tempfile.gettempdir()
+        self.options = tuple(options)
+
+    def command(self, args):
+        # ssh joins its arguments into one string for the remote shell
+        return ["ssh", "-o", "BatchMode=yes",
+                "-o", "ControlMaster=auto",
+                "-o", f"ControlPath={os.path.join(self.control_dir, 'vboxmetrics-%C')}",
+                "-o", "ControlPersist=600",
+                *self.options, self.host, "VBoxManage", *map(shlex.quote, args)]
+
+    def execute(self, args, timeout=None):
+        timeout = timeout or self.timeout
+        try:
+            return subprocess.check_output(self.command(args), stderr=subprocess.DEVNULL,
+                                           timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            raise CollectionError(f"VBoxManage {args[0]} on {self.host} timed out after {timeout}s") from e
+
+class ReplayRunner(CommandRunner):
+    """Replays recorded VBoxManage output from fixture files instead of running it.
+
+    The output of "VBoxManage list vms" is read from list-vms.txt, that of
+    "metrics query" from metrics-query.txt, and so on. Missing fixtures fail
+    like a non-zero exit.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def execute(self, args, timeout=None):
+        path = os.path.join(self.directory, "-".join(args[:2]) + ".txt")
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise subprocess.CalledProcessError(1, ["VBoxManage", *args]) from None
+
+def check_output_group(cmd, timeout):
+    """Run cmd like subprocess.check_output, killing its whole process group on timeout.
+
+    VBoxManage can leave helper processes behind when it hangs; running it
+    in a new session lets them all be killed together.
+    """
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                          start_new_session=True) as proc:
+        try:
+            output, _ = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            raise
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output)
+    return output
+
+# Runner for VBoxManage on this host
+LOCAL_RUNNER = LocalRunner()
+
+class SingleFlight:
+    """Coalesces concurrent calls so one runs and the others share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, func, key=None):
+        """Run func, or wait for the call with the same key already in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = func()
+            return call["result"]
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+    def stream(self, func, key=None):
+        """Yield the chunks of func(), or the whole text of the call with the
+        same key already in flight once it has finished."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                yield f"# Error fetching VBox metrics: {str(call['error'])}\n"
+            else:
+                yield call["result"]
+            return
+
+        # The sent chunks are kept for scrapes that join while this one is streaming
+        chunks = []
+        try:
+            for chunk in func():
+                chunks.append(chunk)
+                yield chunk
+            call["result"] = ''.join(chunks)
+        except GeneratorExit:
+            call["error"] = CollectionError("the streaming scrape was closed before it finished")
+            raise
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+# Shares one in-flight collection between concurrent scrapes
+SCRAPE_FLIGHT = SingleFlight()
+
+def collect_snapshot(metrics_filter=None):
+    """Collect a snapshot, joining a matching collection that is already in progress."""
+    if metrics_filter is None:
+        return SCRAPE_FLIGHT.do(collect_full_snapshot)
+    return SCRAPE_FLIGHT.do(lambda: MetricsSnapshot(get_metrics(metrics_filter)), key=metrics_filter.key)
+
+def collect_full_snapshot():
+    """Collect an unfiltered snapshot, remembering it if the collection succeeded."""
+    global LAST_GOOD_SNAPSHOT
+    records = []
+    snapshot = MetricsSnapshot(get_metrics(records=records), records=records)
+    if not snapshot.failed:
+        LAST_GOOD_SNAPSHOT = snapshot
+    if HISTORY is not None:
+        HISTORY.record(snapshot.text, snapshot.timestamp)
+    return snapshot
+
+# Latest unfiltered snapshot whose collection succeeded
+LAST_GOOD_SNAPSHOT = None
+
+def stale_snapshot():
+    """The last good snapshot with a gauge of how many seconds old it is."""
+    good = LAST_GOOD_SNAPSHOT
+    text = good.text + f'vbox_exporter_snapshot_stale_seconds{{host="{HOSTNAME}"}} {good.age():.3f}\n'
+    return MetricsSnapshot(text, good.timestamp, good.records)
+
+def serve_snapshot():
+    """Collect a snapshot for a scrape, serving the last good one instead if the
+    collection fails or takes longer than SCRAPE_TIMEOUT seconds."""
+    if LAST_GOOD_SNAPSHOT is None:
+        return collect_snapshot()
+    if SCRAPE_TIMEOUT:
+        future = pending_collection()
+        try:
+            snapshot = future.result(timeout=SCRAPE_TIMEOUT)
+        except FuturesTimeoutError:
+            STATS.inc("vbox_exporter_stale_serves_total", reason="slow")
+            return stale_snapshot()
+    else:
+        snapshot = collect_snapshot()
+    if snapshot.failed:
+        STATS.inc("vbox_exporter_stale_serves_total", reason="failed")
+        return stale_snapshot()
+    return snapshot
+
+# Seconds a scrape waits for a fresh collection before serving the last good snapshot (0 waits)
+SCRAPE_TIMEOUT = 0
+
+# Collection that scrapes waiting at most SCRAPE_TIMEOUT share, while it runs
+PENDING_COLLECTION = None
+PENDING_COLLECTION_LOCK = threading.Lock()
+
+def pending_collection():
+    """Return the running scrape collection, starting one if none is in progress.
+
+    Scrapes that give up waiting leave nothing queued behind them, so a slow
+    VBoxManage never builds up a backlog of collections.
+    """
+    global PENDING_COLLECTION
+    with PENDING_COLLECTION_LOCK:
+        if PENDING_COLLECTION is None or PENDING_COLLECTION.done():
+            PENDING_COLLECTION = SCRAPE_EXECUTOR.submit(collect_snapshot)
+        return PENDING_COLLECTION
+
+class CollectionError(Exception):
+    """Raised by a collection backend when VirtualBox data cannot be fetched."""
+
+# Errors that turn a collection into an "# Error fetching VBox metrics" response
+COLLECTION_ERRORS = (subprocess.CalledProcessError, CollectionError)
+
+def parse_vm_list(vms_output):
+    """Parse VBoxManage list vms output into a VM name to UUID mapping."""
     vm_info = {}
-    vms_output = subprocess.check_output(["VBoxManage", "list", "vms"], 
-                                         stderr=subprocess.DEVNULL).decode()
     for line in vms_output.strip().split('\n'):
         if '"' in line and '{' in line:
             name = line.split('"')[1]
@@ -96,18 +561,899 @@ def get_vm_info():
             vm_info[name] = uuid
     return vm_info
 
-def process_metric_line(line, metrics, vm_info):
-    """Process a single metric line and add it to the metrics list."""
+class CollectionBackend:
+    """Source of VM inventory and metrics query output in VBoxManage format."""
+
+    # Whether list_vms and query_metrics may run on different threads at once
+    concurrent = True
+
+    def list_vms(self):
+        """Return a mapping of VM name to UUID."""
+        raise NotImplementedError
+
+    def lookup_vm_uuid(self, name):
+        """Return the UUID of a single VM, or None if it does not exist."""
+        return self.list_vms().get(name)
+
+    def query_metrics(self, objects=None, metrics=None):
+        """Return metrics query output as bytes in VBoxManage's text format.
+
+        objects and metrics optionally restrict the query to the named objects
+        and metric patterns.
+        """
+        raise NotImplementedError
+
+    def stream_query(self, objects=None, metrics=None):
+        """Return a closeable iterator over the lines of metrics query output."""
+        return io.BytesIO(self.query_metrics(objects, metrics))
+
+    def setup_metrics(self, period, samples, objects=None, metrics=None):
+        """Configure the sampling period and number of retained samples."""
+
+    def vm_details(self, vm):
+        """Return the details of a VM (see vm_details_from_info), or None if unavailable."""
+        return None
+
+    def list_running_vms(self):
+        """Return a mapping of running VM name to UUID."""
+        return self.list_vms()
+
+    def guest_properties(self, vm, timeout=None):
+        """Return a VM's guest properties as a name to value mapping, or None if unavailable."""
+        return None
+
+class ProcessLines:
+    """Closeable iterator over the stdout lines of a running command.
+
+    The command runs in its own session like check_output_group. With a
+    timeout, its whole process group is killed once the deadline passes,
+    which ends the iteration with a CollectionError.
+    """
+
+    def __init__(self, cmd, command=None, timeout=None):
+        self.cmd = cmd
+        self.command = command or cmd[1]
+        self.timeout = timeout
+        self.timed_out = False
+        self.start = time.perf_counter()
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     start_new_session=True)
+        self._timer = None
+        if timeout is not None:
+            self._timer = threading.Timer(timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _expire(self):
+        self.timed_out = True
+        self._kill()
+
+    def _kill(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def __iter__(self):
+        yield from self.proc.stdout
+        returncode = self.proc.wait()
+        if self._timer is not None:
+            self._timer.cancel()
+        STATS.observe("vbox_exporter_subprocess_duration_seconds", time.perf_counter() - self.start,
+                      command=self.command)
+        if self.timed_out:
+            STATS.inc("vbox_exporter_subprocess_timeouts_total", command=self.command)
+            raise CollectionError(f"VBoxManage {self.command} timed out after {self.timeout}s")
+        if returncode != 0:
+            STATS.inc("vbox_exporter_subprocess_failures_total", command=self.command)
+            raise subprocess.CalledProcessError(returncode, self.cmd)
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.proc.poll() is None:
+            self._kill()
+        self.proc.stdout.close()
+        self.proc.wait()
+
+class CliBackend(CollectionBackend):
+    """Collects data by running the VBoxManage command line tool."""
+
+    def __init__(self, runner=None):
+        self.runner = LOCAL_RUNNER if runner is None else runner
+
+    def list_vms(self):
+        """Fetch VM names and UUIDs from VBoxManage."""
+        return parse_vm_list(self.runner.run("list", "vms").decode())
+
+    def lookup_vm_uuid(self, name):
+        """Fetch the UUID of a single VM from VBoxManage showvminfo."""
+        output = self.runner.run("showvminfo", name, "--machinereadable").decode()
+        for line in output.split('\n'):
+            if line.startswith('UUID='):
+                return line.split('=', 1)[1].strip().strip('"')
+        return None
+
+    def list_running_vms(self):
+        """Fetch running VM names and UUIDs from VBoxManage."""
+        return parse_vm_list(self.runner.run("list", "runningvms").decode())
+
+    def guest_properties(self, vm, timeout=None):
+        """Fetch the guest properties published by a VM's Guest Additions."""
+        output = self.runner.run("guestproperty", "enumerate", vm, timeout=timeout).decode()
+        return parse_guest_properties(output)
+
+    def vm_details(self, vm):
+        """Fetch a VM's state and configuration from VBoxManage showvminfo."""
+        output = self.runner.run("showvminfo", vm, "--machinereadable").decode()
+        return vm_details_from_info(parse_machinereadable(output))
+
+    @staticmethod
+    def _query_args(object_name, metrics):
+        return ["metrics", "query", object_name] + ([",".join(metrics)] if metrics else [])
+
+    def query_metrics(self, objects=None, metrics=None):
+        """Fetch the raw metrics query output from VBoxManage as bytes."""
+        if not objects:
+            return self.runner.run(*self._query_args("*", metrics))
+        # metrics query takes a single object, so run one query per object
+        outputs = OBJECT_QUERY_EXECUTOR.map(lambda obj: self.runner.run(*self._query_args(obj, metrics)), objects)
+        return b'\n'.join(output.strip() for output in outputs) + b'\n'
+
+    def setup_metrics(self, period, samples, objects=None, metrics=None):
+        """Run VBoxManage metrics setup for each object, or for all objects."""
+        setup_args = ["metrics", "setup", "--period", str(period), "--samples", str(samples)]
+        metric_list = [",".join(metrics)] if metrics else []
+        for object_name in objects or ["*"]:
+            self.runner.run(*setup_args, object_name, *metric_list)
+
+    def stream_query(self, objects=None, metrics=None):
+        """Start VBoxManage metrics query and return its output lines as they arrive."""
+        object_name = objects[0] if objects else "*"
+        cmd = self.runner.command(self._query_args(object_name, metrics))
+        if cmd is None or (objects and len(objects) > 1):
+            return super().stream_query(objects, metrics)
+        return ProcessLines(cmd, "metrics", self.runner.timeout)
+
+class VirtualBoxApiBackend(CollectionBackend):
+    """Reads the PerformanceCollector through one long-lived VirtualBox API session.
+
+    Requires the VirtualBox SDK Python bindings (vboxapi), which are only
+    imported when this backend is created. XPCOM/COM objects belong to the
+    thread that created them, so the session is opened and every call is
+    made on one dedicated thread. Sampling is left as VBoxSVC has it until
+    setup_metrics is called.
+    """
+
+    # Every API call runs on the session's own thread
+    concurrent = False
+
+    def __init__(self):
+        try:
+            from vboxapi import VirtualBoxManager
+        except ImportError as e:
+            raise CollectionError("The api backend requires the VirtualBox Python bindings (vboxapi)") from e
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vbox-api")
+        self._manager = self._call(VirtualBoxManager, None, None)
+        self._vbox = self._call(self._manager.getVirtualBox)
+        self._perf = self._call(lambda: self._vbox.performanceCollector)
+
+    def _call(self, func, *args):
+        """Run func on the API session's thread and return its result."""
+        return self._executor.submit(func, *args).result()
+
+    def setup_metrics(self, period, samples, objects=None, metrics=None):
+        """Reconfigure the PerformanceCollector sampling."""
+        def setup():
+            targets = []
+            if objects:
+                targets = [machine for machine in self._machines() if machine.name in objects]
+                if "host" in objects:
+                    targets.append(self._vbox.host)
+            self._perf.setupMetrics(list(metrics or ['*']), targets, period, samples)
+        self._call(setup)
+
+    def _machines(self):
+        return self._manager.getArray(self._vbox, 'machines')
+
+    def list_vms(self):
+        """Return VM names and UUIDs from the API session."""
+        def list_vms():
+            try:
+                return {machine.name: machine.id for machine in self._machines()}
+            except Exception as e:
+                raise CollectionError(f"VirtualBox API error: {e}") from e
+        return self._call(list_vms)
+
+    def lookup_vm_uuid(self, name):
+        """Look up a single VM by name through the API session."""
+        def lookup():
+            try:
+                return self._vbox.findMachine(name).id
+            except Exception:
+                return None
+        return self._call(lookup)
+
+    def query_metrics(self, objects=None, metrics=None):
+        """Render the latest PerformanceCollector samples in VBoxManage's format."""
+        def query():
+            try:
+                targets = [("host", self._vbox.host)]
+                targets += [(machine.name, machine) for machine in self._machines()]
+                if objects:
+                    targets = [(name, obj) for name, obj in targets if name in objects]
+                lines = ["Object Metric Value"]
+                for object_name, obj in targets:
+                    values, names, _, units, scales, _, indices, lengths = \
+                        self._perf.queryMetricsData(list(metrics or ['*']), [obj])
+                    for i, metric_name in enumerate(names):
+                        if lengths[i] == 0:
+                            continue
+                        samples = values[indices[i]:indices[i] + lengths[i]]
+                        value = ", ".join(f"{sample / scales[i]}{units[i]}" for sample in samples)
+                        lines.append(f"{object_name} {metric_name} {value}")
+            except Exception as e:
+                raise CollectionError(f"VirtualBox API error: {e}") from e
+            return ('\n'.join(lines) + '\n').encode()
+        return self._call(query)
+
+class FakeBackend(CollectionBackend):
+    """Replays fixed inventory and metrics output so the exporter runs without VirtualBox."""
+
+    def __init__(self, vm_info=None, metrics_output=None):
+        if vm_info is None:
+            vm_info = {f"fake_vm{i}": f"00000000-0000-0000-0000-00000000000{i}" for i in (1, 2)}
+        self.vm_info = dict(vm_info)
+        if metrics_output is None:
+            metrics_output = self._default_output()
+        self.metrics_output = metrics_output.encode() if isinstance(metrics_output, str) else metrics_output
+        self.calls = collections.Counter()
+
+    def _default_output(self):
+        lines = [
+            "Object      Metric                                 Value",
+            "host        CPU/Load/User                          1.56%",
+            "host        CPU/Load/Kernel                        12.98%",
+            "host        RAM/Usage/Total                        263535524 kB",
+            "host        RAM/Usage/Used                         133893824 kB",
+            "host        Net/eth0/Load/Rx                       0.00%",
+            "host        Disk/sda/Usage/Total                   457862 MB",
+            "host        FS/{/}/Usage/Free                      3874 MB",
+        ]
+        for name in self.vm_info:
+            lines.append(f"{name} CPU/Load/User 3.0%")
+            lines.append(f"{name} RAM/Usage/Used 2048000 kB")
+        return '\n'.join(lines) + '\n'
+
+    def list_vms(self):
+        self.calls["list"] += 1
+        return dict(self.vm_info)
+
+    def lookup_vm_uuid(self, name):
+        self.calls["lookup"] += 1
+        return self.vm_info.get(name)
+
+    def setup_metrics(self, period, samples, objects=None, metrics=None):
+        self.calls["setup"] += 1
+
+    def guest_properties(self, vm, timeout=None):
+        self.calls["guestproperty"] += 1
+        return {
+            "/VirtualBox/GuestInfo/OS/Product": "Linux",
+            "/VirtualBox/GuestInfo/OS/Release": "6.1.0-18-amd64",
+            "/VirtualBox/GuestInfo/OS/LoggedInUsers": "1",
+            "/VirtualBox/GuestAdd/Version": "7.0.14",
+            "/VirtualBox/GuestInfo/Net/Count": "1",
+            "/VirtualBox/GuestInfo/Net/0/V4/IP": "10.0.2.15",
+            "/VirtualBox/GuestInfo/Net/0/MAC": "080027AABBCC",
+            "/VirtualBox/GuestInfo/Net/0/Status": "Up",
+        }
+
+    def vm_details(self, vm):
+        self.calls["details"] += 1
+        names = {uuid: name for name, uuid in self.vm_info.items()}
+        if vm not in self.vm_info and vm not in names:
+            return None
+        return {"state": "running", "os_type": "Linux_64", "group": "/", "cpus": 2,
+                "memory_bytes": 2048 * 1024 * 1024, "config_file": None}
+
+    def query_metrics(self, objects=None, metrics=None):
+        self.calls["query"] += 1
+        if not objects and not metrics:
+            return self.metrics_output
+        # Mimic VBoxManage selecting objects and metric patterns
+        return select_lines(self.metrics_output, lambda object_name, metric_name: (
+            (not objects or object_name in objects or self.vm_info.get(object_name) in objects)
+            and (not metrics or matches_any(metric_name.split(':', 1)[0], metrics))))
+
+# Backend used for every collection
+BACKEND = CliBackend()
+
+def get_vm_info():
+    """Fetch VM names and UUIDs from the collection backend."""
+    return BACKEND.list_vms()
+
+def lookup_vm_uuid(name):
+    """Fetch the UUID of a single VM from the collection backend."""
+    return BACKEND.lookup_vm_uuid(name)
+
+OBJECT_NAME_PATTERN = re.compile(rb'^[ \t]*(\S+)', re.MULTILINE)
+
+def find_vm_objects(output):
+    """Return the VM object names referenced by raw metrics query output."""
+    objects = {name.decode() for name in set(OBJECT_NAME_PATTERN.findall(output))}
+    objects.difference_update(("host", "Object"))
+    return objects
+
+class VMInventory:
+    """Cache of VM name to UUID mappings with a TTL and lazy per-VM lookups."""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._vms = {}
+        self._missing = set()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def is_fresh(self):
+        """Whether the cached listing can be used without re-running list vms."""
+        loaded_at = self._loaded_at
+        return loaded_at is not None and self.ttl > 0 and time.time() - loaded_at < self.ttl
+
+    def get(self):
+        """Return a copy of the cached VM name to UUID mapping."""
+        with self._lock:
+            return dict(self._vms)
+
+    def update(self, vm_info):
+        """Replace the cache with a full VM listing and return it."""
+        with self._lock:
+            self._vms = dict(vm_info)
+            self._missing = set()
+            self._loaded_at = time.time()
+        return vm_info
+
+    def invalidate(self):
+        """Force the next scrape to re-list all VMs."""
+        with self._lock:
+            self._vms = {}
+            self._missing = set()
+            self._loaded_at = None
+
+    def resolve(self, object_names, vm_info):
+        """Look up UUIDs for objects missing from vm_info and add them to the cache."""
+        with self._lock:
+            unknown = [name for name in object_names
+                       if name not in vm_info and name not in self._missing]
+        if not unknown:
+            return vm_info
+
+        vm_info = dict(vm_info)
+        for name, uuid in zip(unknown, COMMAND_EXECUTOR.map(self._lookup, unknown)):
+            with self._lock:
+                if uuid is None:
+                    self._missing.add(name)
+                else:
+                    self._vms[name] = uuid
+            if uuid is not None:
+                vm_info[name] = uuid
+        return vm_info
+
+    @staticmethod
+    def _lookup(name):
+        try:
+            return lookup_vm_uuid(name)
+        except COLLECTION_ERRORS:
+            return None
+
+# VM inventory shared across scrapes
+VM_INVENTORY = VMInventory()
+
+def parse_machinereadable(output):
+    """Parse showvminfo --machinereadable output into a key to value mapping."""
+    values = {}
+    for line in output.split('\n'):
+        key, sep, value = line.partition('=')
+        if sep:
+            values[key.strip().strip('"')] = value.strip().strip('"')
+    return values
+
+def vm_details_from_info(info):
+    """Pick the enrichment fields out of parsed showvminfo output."""
+    cpus = info.get("cpus", "")
+    memory = info.get("memory", "")
+    return {
+        "state": info.get("VMState", ""),
+        "os_type": info.get("ostype", ""),
+        "group": info.get("groups", ""),
+        "cpus": int(cpus) if cpus.isdigit() else None,
+        "memory_bytes": int(memory) * 1024 * 1024 if memory.isdigit() else None,
+        "config_file": info.get("CfgFile"),
+    }
+
+def config_mtime(details):
+    """Modification time of a VM's settings file, or None if it cannot be read."""
+    if not details.get("config_file"):
+        return None
+    try:
+        return os.stat(details["config_file"]).st_mtime_ns
+    except OSError:
+        return None
+
+class VMDetailsCache:
+    """Per-UUID cache of showvminfo details.
+
+    An entry is refetched when its TTL expires or when the VM's settings
+    file changes, so steady-state scrapes only stat one file per VM.
+    """
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        # vm uuid -> (details, fetched at, settings file mtime)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _is_stale(self, entry, now):
+        if entry is None:
+            return True
+        details, fetched_at, mtime = entry
+        return now - fetched_at >= self.ttl or (mtime is not None and config_mtime(details) != mtime)
+
+    def get(self, vm_info, names=None):
+        """Return {vm name: details} for the named VMs, fetching only missing or stale entries.
+
+        vm_info is the full inventory, and entries of VMs no longer in it are
+        dropped. names limits the VMs fetched and returned; all by default.
+        """
+        now = time.time()
+        wanted = {name: vm_info[name] for name in (vm_info if names is None else names) if name in vm_info}
+        with self._lock:
+            entries = dict(self._entries)
+        stale = [uuid for uuid in wanted.values() if self._is_stale(entries.get(uuid), now)]
+        STATS.inc("vbox_exporter_cache_hits_total", len(wanted) - len(stale), cache="vm_details")
+        STATS.inc("vbox_exporter_cache_misses_total", len(stale), cache="vm_details")
+        fetched = {}
+        for uuid, details in zip(stale, ENRICHMENT_EXECUTOR.map(self._fetch, stale)):
+            if details is not None:
+                fetched[uuid] = (details, now, config_mtime(details))
+        uuids = set(vm_info.values())
+        with self._lock:
+            entries = {**self._entries, **fetched}
+            self._entries = {uuid: entry for uuid, entry in entries.items() if uuid in uuids}
+        return {name: entries[uuid][0] for name, uuid in wanted.items() if uuid in entries}
+
+    def invalidate(self):
+        """Refetch every VM's details on the next collection."""
+        with self._lock:
+            self._entries = {}
+
+    @staticmethod
+    def _fetch(uuid):
+        try:
+            return BACKEND.vm_details(uuid)
+        except COLLECTION_ERRORS:
+            return None
+
+# showvminfo details per VM; None disables enrichment (--vm-details)
+VM_DETAILS = None
+
+# Runs guestproperty enumerate for several VMs at once
+GUEST_PROPERTY_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="vboxmanage-guestproperty")
+
+# One "Name: ..., value: ..., timestamp: ..." (VirtualBox 6.1 and older) or
+# "/name = 'value' @ time" (VirtualBox 7) line of guestproperty enumerate output
+GUEST_PROPERTY_PATTERNS = (
+    re.compile(r"^Name: (?P<name>[^,]+), value: (?P<value>.*?), timestamp:"),
+    re.compile(r"^(?P<name>/\S+)\s+= '(?P<value>.*?)'(?:\s+@|\s*$)"),
+)
+
+def parse_guest_properties(output):
+    """Parse guestproperty enumerate output into a property name to value mapping."""
+    properties = {}
+    for line in output.split('\n'):
+        line = line.strip()
+        for pattern in GUEST_PROPERTY_PATTERNS:
+            match = pattern.match(line)
+            if match:
+                properties[match.group("name")] = match.group("value")
+                break
+    return properties
+
+def escape_label_value(value):
+    """Escape a free-form label value such as a guest property or VM setting."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class GuestPropertyCache:
+    """Guest properties of running VMs, refreshed in the background.
+
+    Scrapes only read the cache. Once it is older than ttl, a scrape starts
+    one background refresh that lists the running VMs and enumerates their
+    properties on a bounded pool, each call limited to timeout seconds, so
+    scrape latency does not grow with the number of VMs. A VM whose
+    enumeration fails keeps its previous properties until the next refresh.
+    """
+
+    def __init__(self, ttl=60, timeout=10):
+        self.ttl = ttl
+        self.timeout = timeout
+        # vm uuid -> {property name: value}
+        self._properties = {}
+        self._refreshed_at = None
+        self._refresh_thread = None
+        self._lock = threading.Lock()
+
+    def get(self, vm_info, names=None):
+        """Return {vm name: properties} of the named VMs from the cache, starting a refresh if it is stale.
+
+        vm_info is the full inventory, which a refresh covers whatever VMs a
+        scrape asked for. names limits the VMs returned; all by default.
+        """
+        with self._lock:
+            stale = self._refreshed_at is None or time.time() - self._refreshed_at >= self.ttl
+            if stale and (self._refresh_thread is None or not self._refresh_thread.is_alive()):
+                self._refresh_thread = threading.Thread(target=self.refresh, args=(dict(vm_info),),
+                                                        name="vbox-guestproperty", daemon=True)
+                self._refresh_thread.start()
+            properties = self._properties
+        wanted = {name: vm_info[name] for name in (vm_info if names is None else names) if name in vm_info}
+        return {name: properties[uuid] for name, uuid in wanted.items() if uuid in properties}
+
+    def refresh(self, vm_info):
+        """Enumerate the guest properties of every running VM in vm_info."""
+        try:
+            running = BACKEND.list_running_vms()
+        except COLLECTION_ERRORS as e:
+            app.logger.warning("Listing running VMs failed: %s", e)
+            running = {}
+        uuids = [uuid for name, uuid in vm_info.items() if name in running]
+        previous = self._properties
+        properties = {}
+        for uuid, result in zip(uuids, GUEST_PROPERTY_EXECUTOR.map(self._enumerate, uuids)):
+            if result is not None:
+                properties[uuid] = result
+            elif uuid in previous:
+                properties[uuid] = previous[uuid]
+        with self._lock:
+            self._properties = properties
+            self._refreshed_at = time.time()
+
+    def _enumerate(self, uuid):
+        try:
+            return BACKEND.guest_properties(uuid, timeout=self.timeout)
+        except COLLECTION_ERRORS:
+            return None
+
+# Guest properties of running VMs; None disables collection (--guest-properties)
+GUEST_PROPERTIES = None
+
+# Most vbox_guest_net_info series rendered for one VM
+MAX_GUEST_NET_INTERFACES = 64
+
+def get_guest_property_metrics(vm_info, metrics_filter):
+    """Render vbox_guest_* series from the cached guest properties of the VMs a scrape covers."""
+    names = [name for name in vm_info if metrics_filter.allows_object(name)]
+    metrics = []
+    for name, properties in GUEST_PROPERTIES.get(vm_info, names).items():
+        labels = f'host="{HOSTNAME}",vm="{name}",vm_uuid="{vm_info[name]}"'
+
+        def label(key):
+            return escape_label_value(properties.get(key, ""))
+
+        if any(f"/VirtualBox/GuestInfo/OS/{key}" in properties for key in ("Product", "Release", "Version")):
+            metrics.append(f'vbox_guest_os_info{{{labels},product="{label("/VirtualBox/GuestInfo/OS/Product")}",'
+                           f'release="{label("/VirtualBox/GuestInfo/OS/Release")}",'
+                           f'version="{label("/VirtualBox/GuestInfo/OS/Version")}"}} 1')
+        if "/VirtualBox/GuestAdd/Version" in properties:
+            metrics.append(f'vbox_guest_additions_info{{{labels},version="{label("/VirtualBox/GuestAdd/Version")}"}} 1')
+        users = properties.get("/VirtualBox/GuestInfo/OS/LoggedInUsers", "")
+        if users.isdigit():
+            metrics.append(f'vbox_guest_logged_in_users{{{labels}}} {users}')
+        count = properties.get("/VirtualBox/GuestInfo/Net/Count", "")
+        if count.isdigit():
+            metrics.append(f'vbox_guest_net_interfaces{{{labels}}} {count}')
+            # The count is set by the guest; only render interfaces that are present, up to a cap
+            for index in range(min(int(count), MAX_GUEST_NET_INTERFACES)):
+                prefix = f"/VirtualBox/GuestInfo/Net/{index}"
+                if not any(prefix + key in properties for key in ("/V4/IP", "/MAC", "/Status")):
+                    continue
+                metrics.append(f'vbox_guest_net_info{{{labels},interface="{index}",'
+                               f'ip="{label(prefix + "/V4/IP")}",mac="{label(prefix + "/MAC")}",'
+                               f'status="{label(prefix + "/Status")}"}} 1')
+    return metrics
+
+def invalidate_caches(signum=None, frame=None):
+    """Make the next collection re-list VMs and refetch their details (SIGHUP handler)."""
+    VM_INVENTORY.invalidate()
+    if VM_DETAILS is not None:
+        VM_DETAILS.invalidate()
+
+def get_vm_detail_metrics(vm_info, metrics_filter):
+    """Render info, CPU and memory series for the VMs a scrape covers."""
+    names = [name for name in vm_info if metrics_filter.allows_object(name)]
+    metrics = []
+    for name, details in VM_DETAILS.get(vm_info, names).items():
+        labels = f'host="{HOSTNAME}",vm="{name}",vm_uuid="{vm_info[name]}"'
+        metrics.append(f'vbox_vm_info{{{labels},state="{escape_label_value(details["state"])}",'
+                       f'os_type="{escape_label_value(details["os_type"])}",'
+                       f'group="{escape_label_value(details["group"])}"}} 1')
+        if details["cpus"] is not None:
+            metrics.append(f'vbox_vm_cpus{{{labels}}} {details["cpus"]}')
+        if details["memory_bytes"] is not None:
+            metrics.append(f'vbox_vm_memory_bytes{{{labels}}} {details["memory_bytes"]}')
+    return metrics
+
+def query_metrics(metrics_filter=None):
+    """Fetch raw metrics query output from the backend, narrowed by the filter."""
+    if metrics_filter is None:
+        metrics_filter = METRICS_FILTER
+    output = BACKEND.query_metrics(metrics_filter.query_objects(), metrics_filter.query_metrics())
+    return metrics_filter.filter_output(output)
+
+class MetricsFilter:
+    """Objects and metric patterns to collect.
+
+    Include lists are pushed down into the metrics query arguments. Object
+    globs, which VBoxManage cannot resolve, and all excludes are applied to
+    the query output before parsing.
+    """
+
+    def __init__(self, objects=(), metrics=(), exclude_objects=(), exclude_metrics=()):
+        self.objects = tuple(objects)
+        self.metrics = tuple(metrics)
+        self.exclude_objects = tuple(exclude_objects)
+        self.exclude_metrics = tuple(exclude_metrics)
+        # Include lists a request narrowed from; still enforced on the output
+        self.allowed_objects = self.objects
+        self.allowed_metrics = self.metrics
+
+    @property
+    def key(self):
+        return (self.objects, self.metrics, self.exclude_objects, self.exclude_metrics,
+                self.allowed_objects, self.allowed_metrics)
+
+    def narrow(self, objects=(), metrics=()):
+        """Return a filter that collects only the requested objects and metrics."""
+        narrowed = MetricsFilter(objects or self.objects, metrics or self.metrics,
+                                 self.exclude_objects, self.exclude_metrics)
+        narrowed.allowed_objects = self.allowed_objects
+        narrowed.allowed_metrics = self.allowed_metrics
+        return narrowed
+
+    def query_objects(self):
+        """Objects to pass to metrics query, or None to query every object."""
+        if not self.objects or any(is_glob(pattern) for pattern in self.objects):
+            return None
+        return list(self.objects)
+
+    def query_metrics(self):
+        """Metric patterns to pass to metrics query, or None for all metrics."""
+        return list(self.metrics) or None
+
+    def needs_output_filter(self):
+        """Whether query output can contain lines this filter must drop."""
+        return bool(self.exclude_objects or self.exclude_metrics
+                    or self.query_objects() is None and self.objects
+                    or self.allowed_objects != self.objects
+                    or self.allowed_metrics != self.metrics)
+
+    def allows(self, object_name, metric_name):
+        """Whether a line for this object and metric should be kept."""
+        base_metric = metric_name.split(':', 1)[0]
+        checks = [(self.allowed_objects, object_name), (self.allowed_metrics, base_metric)]
+        if self.query_objects() is None:
+            checks.append((self.objects, object_name))
+        for include, name in checks:
+            if include and not matches_any(name, include):
+                return False
+        return not (matches_any(object_name, self.exclude_objects)
+                    or matches_any(base_metric, self.exclude_metrics))
+
+    def allows_object(self, object_name):
+        """Whether series for this object should be kept, whatever the metric."""
+        for include in (self.allowed_objects, self.objects):
+            if include and not matches_any(object_name, include):
+                return False
+        return not matches_any(object_name, self.exclude_objects)
+
+    def filter_output(self, output):
+        """Drop query output lines this filter does not allow."""
+        if not self.needs_output_filter():
+            return output
+        return select_lines(output, self.allows)
+
+def select_lines(output, allows):
+    """Keep the header and the metrics query output lines allows(object, metric) accepts."""
+    kept = []
+    for line in output.split(b'\n'):
+        parts = line.split(None, 2)
+        if len(parts) == 3 and parts[0] != b"Object" and not allows(parts[0].decode(), parts[1].decode()):
+            continue
+        kept.append(line)
+    return b'\n'.join(kept)
+
+def is_glob(pattern):
+    return any(char in pattern for char in "*?[")
+
+def matches_any(name, patterns):
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+# Objects and metrics collected on every scrape
+METRICS_FILTER = MetricsFilter()
+
+def parse_metrics_output(output, metrics, vm_info, series_keys=None, records=None):
+    """Parse raw metrics query output with the configured parser engine.
+
+    Returns the number of input lines that produced series. If records is a
+    list, one (series details, latest value) pair is added to it per parsed
+    line, where the details are (object, metric, labels, unit).
+    """
+    if PARSER == "bulk":
+        return parse_metrics_bulk(output, metrics, vm_info, series_keys, records)
+    return parse_metrics_lines(output, metrics, vm_info, series_keys, records)
+
+def parse_metrics_lines(output, metrics, vm_info, series_keys=None, records=None):
+    """Parse raw metrics query output one line at a time, returning the lines parsed."""
+    parsed = 0
+    for line in output.decode().strip().split('\n'):
+        if process_metric_line(line, metrics, vm_info, series_keys, records):
+            parsed += 1
+    return parsed
+
+# Multipliers applied to values by unit suffix, mirroring parse_value
+UNIT_MULTIPLIERS = {
+    b'': None,
+    b'%': None,
+    b'kB': 1024,
+    b'MB': 1024 * 1024,
+    b'B/s': None,
+    b'mbit/s': None,
+    b'MHz': None,
+}
+
+# Matches well-formed lines in full, or captures any other line for parse_value
+BULK_LINE_PATTERN = re.compile(
+    rb'^([!-~]+[ \t]+[!-~]+)[ \t]+(-?[0-9]+(?:\.[0-9]+)?)[ \t]*(%|kB|MB|B/s|mbit/s|MHz|)$'
+    rb'|^(.+)$',
+    re.MULTILINE)
+
+def parse_metrics_bulk(output, metrics, vm_info, series_keys=None, records=None):
+    """Parse raw metrics query output in a single regex pass over the bytes.
+
+    Produces exactly the same lines as parse_metrics_lines. Series keys are
+    memoized on the raw "object metric" bytes so well-formed lines are never
+    decoded; any other line falls back to process_metric_line. Returns the
+    number of lines that produced series.
+    """
+    if series_keys is None:
+        series_keys = SERIES_KEYS
+    append = metrics.append
+    raw_keys = series_keys.raw_keys(vm_info)
+    matches = BULK_LINE_PATTERN.findall(output.strip())
+    # Lines that fell back to process_metric_line and did not produce series
+    skipped = 0
+    for prefix, number, unit, other in matches:
+        if other:
+            if not process_metric_line(other.decode(), metrics, vm_info, series_keys, records):
+                skipped += 1
+            continue
+        series = raw_keys.get(prefix)
+        if series is None:
+            object_name, metric_name = prefix.decode().split()
+            series = series_keys.get_series(object_name, metric_name, vm_info, unit.decode())
+            series_keys.remember_raw(raw_keys, prefix, series)
+        multiplier = UNIT_MULTIPLIERS[unit]
+        value = float(number) if multiplier is None else float(number) * multiplier
+        append(f'{series[0]} {value}')
+        if records is not None:
+            records.append((series[1], value))
+    return len(matches) - skipped
+
+# Metrics parser engine: "bulk" (single regex pass) or "lines" (per-line split)
+PARSER = "bulk"
+
+def process_metric_line(line, metrics, vm_info, series_keys=None, records=None):
+    """Process a single metric line and add it to the metrics list.
+
+    Returns whether the line produced any series.
+    """
     parts = line.split(None, 2)  # Split into max 3 parts
     if len(parts) != 3:
-        return
+        return False
 
     object_name, metric_name, value_str = parts
+    if series_keys is None:
+        series_keys = SERIES_KEYS
+    if ',' in value_str:
+        return process_samples(object_name, metric_name, value_str, metrics, vm_info, series_keys, records)
+
     value = parse_value(value_str)
     if value is None:
-        return
+        return False
+
+    key, details = series_keys.get_series(object_name, metric_name, vm_info, value_str)
+    metrics.append(f'{key} {value}')
+    if records is not None:
+        records.append((details, value))
+    return True
+
+def parse_samples(value_str):
+    """Parse a comma-separated sample list such as "1.00%, 2.50%" or "10, 20 kB"."""
+    items = [item.strip() for item in value_str.split(',')]
+    unit = SAMPLE_UNIT_PATTERN.match(items[-1])
+    unit = unit.group(1) if unit else ''
+    samples = []
+    for item in items:
+        # VBoxManage may print the unit once after the last sample only
+        value = parse_value(item if not item or not item[-1].isdigit() else item + unit)
+        if value is not None:
+            samples.append(value)
+    return samples
+
+SAMPLE_UNIT_PATTERN = re.compile(r'^-?[0-9.]+\s*(\D*)$')
+
+def process_samples(object_name, metric_name, value_str, metrics, vm_info, series_keys=None, records=None):
+    """Add the series for a multi-sample metric line according to SAMPLE_MODE.
+
+    Returns whether the line had any samples.
+    """
+    samples = parse_samples(value_str)
+    if not samples:
+        return False
+    key, details = (SERIES_KEYS if series_keys is None else series_keys).get_series(
+        object_name, metric_name, vm_info, value_str)
+    if records is not None:
+        records.append((details, samples[-1]))
+
+    if SAMPLE_MODE == "timestamps":
+        # The newest sample belongs to the current period; older ones step back by one period each.
+        # Samples are written oldest first, as Prometheus drops out-of-order samples within a scrape.
+        period_ms = SAMPLE_PERIOD * 1000
+        newest = int(time.time() * 1000) // period_ms * period_ms
+        oldest = newest - (len(samples) - 1) * period_ms
+        for index, value in enumerate(samples):
+            metrics.append(f'{key} {value} {oldest + index * period_ms}')
+    elif SAMPLE_MODE == "rollup":
+        labels = key[:-1] + ("," if key[-2] != "{" else "")
+        metrics.append(f'{key} {samples[-1]}')
+        metrics.append(f'{labels}stat="min"}} {min(samples)}')
+        metrics.append(f'{labels}stat="max"}} {max(samples)}')
+        metrics.append(f'{labels}stat="avg"}} {sum(samples) / len(samples)}')
+    else:
+        metrics.append(f'{key} {samples[-1]}')
+    return True
+
+# How multi-sample lines are exposed: "last", "timestamps" or "rollup"
+SAMPLE_MODE = "last"
+
+# Seconds between samples configured with metrics setup
+SAMPLE_PERIOD = 1
+
+# Unit names for VBoxManage value suffixes; kB and MB values are exported in bytes
+VALUE_UNITS = (
+    ('%', 'percent'),
+    ('mbit/s', 'megabits_per_second'),
+    ('B/s', 'bytes_per_second'),
+    ('kB', 'bytes'),
+    ('MB', 'bytes'),
+    ('MHz', 'megahertz'),
+)
+
+def value_unit(value_str):
+    """Name the unit of a raw VBoxManage value such as "12.5%" or "10, 20 kB"."""
+    value_str = value_str.rstrip()
+    for suffix, unit in VALUE_UNITS:
+        if value_str.endswith(suffix):
+            return unit
+    return ''
+
+def format_series_key(metric_name, labels):
+    """Build the Prometheus name{labels} prefix of a series."""
+    labels_str = ",".join([f'{k}="{v}"' for k, v in labels.items()])
+    return f'{metric_name}{{{labels_str}}}'
 
-    labels = {"host": HOSTNAME}
+def series_name_and_labels(object_name, metric_name, vm_info, host=None):
+    """Return the Prometheus metric name and labels for a VBox object and metric."""
+    labels = {"host": host or HOSTNAME}
     metric_prefix = "vbox_"
 
     if object_name == "host":
@@ -116,9 +1462,7 @@ def process_metric_line(line, metrics, vm_info):
     else:
         labels = process_vm_metric(object_name, labels, vm_info)
         metric_name = f"{metric_prefix}guest_{normalize_metric_name(metric_name)}"
-
-    labels_str = ",".join([f'{k}="{v}"' for k, v in labels.items()])
-    metrics.append(f'{metric_name}{{{labels_str}}} {value}')
+    return metric_name, labels
 
 def process_host_metric(metric_name, labels):
     """Handle special cases for host metrics."""
@@ -143,6 +1487,853 @@ def process_vm_metric(object_name, labels, vm_info):
         labels["vm_uuid"] = vm_info[object_name]
     return labels
 
+class SeriesKeyCache:
+    """Bounded memo of rendered series keys keyed on (object name, metric name).
+
+    Each key is cached together with the series details the JSON API
+    serves: (object name, metric name, labels, unit).
+    """
+
+    def __init__(self, max_entries=100000, host=None):
+        self.max_entries = max_entries
+        # host label value, or None for the local HOSTNAME
+        self.host = host
+        # object name -> ((hostname, vm uuid), {metric name: (series key, details)})
+        self._objects = {}
+        self._size = 0
+        # Raw "object metric" bytes -> (series key, details), valid for one (hostname, vm_info)
+        self._raw = {}
+        self._raw_identity = None
+        # Number of keys rendered because they were not cached
+        self.renders = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def get(self, object_name, metric_name, vm_info, value_str=None):
+        """Return the series key for a line, rendering and caching it on a miss."""
+        return self.get_series(object_name, metric_name, vm_info, value_str)[0]
+
+    def get_series(self, object_name, metric_name, vm_info, value_str=None):
+        """Return (series key, details) for a line, rendering and caching them on a miss.
+
+        value_str is the raw value the unit in the details is taken from.
+        """
+        identity = (self.host or HOSTNAME, vm_info.get(object_name))
+        entry = self._objects.get(object_name)
+        if entry is not None and entry[0] == identity:
+            series = entry[1].get(metric_name)
+            if series is not None:
+                return series
+
+        name, labels = series_name_and_labels(object_name, metric_name, vm_info, self.host)
+        unit = value_unit(value_str) if value_str is not None else ''
+        series = (format_series_key(name, labels), (object_name, name, labels, unit))
+        with self._lock:
+            self.renders += 1
+            entry = self._objects.get(object_name)
+            if entry is None or entry[0] != identity:
+                if entry is not None:
+                    self._size -= len(entry[1])
+                entry = (identity, {})
+                self._objects[object_name] = entry
+            if self._size >= self.max_entries:
+                self._objects = {object_name: entry}
+                self._size = len(entry[1])
+            if metric_name not in entry[1]:
+                entry[1][metric_name] = series
+                self._size += 1
+        return series
+
+    def raw_keys(self, vm_info):
+        """Return the raw-bytes key memo used by the bulk parser for vm_info."""
+        with self._lock:
+            host = self.host or HOSTNAME
+            if self._raw_identity != (host, vm_info):
+                self._raw = {}
+                self._raw_identity = (host, dict(vm_info))
+            return self._raw
+
+    def remember_raw(self, raw_keys, prefix, series):
+        """Add a raw-bytes memo entry, keeping the memo within max_entries."""
+        with self._lock:
+            if len(raw_keys) >= self.max_entries:
+                raw_keys.clear()
+            raw_keys[prefix] = series
+
+    def retain(self, vm_info):
+        """Evict cached series for VMs no longer present in vm_info."""
+        with self._lock:
+            for object_name in list(self._objects):
+                if object_name != "host" and object_name not in vm_info:
+                    self._size -= len(self._objects.pop(object_name)[1])
+                    self._raw = {}
+                    self._raw_identity = None
+
+    def clear(self):
+        """Drop every cached series key."""
+        with self._lock:
+            self._objects = {}
+            self._size = 0
+            self._raw = {}
+            self._raw_identity = None
+
+# Rendered series keys shared across scrapes
+SERIES_KEYS = SeriesKeyCache()
+
+# Bytes of exposition text buffered before each streamed chunk is sent
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def stream_metrics(metrics_filter=None):
+    """Yield exposition text while metrics query output is still being read."""
+    yield f'vbox_info{{hostname="{HOSTNAME}"}} 1\n'
+    if metrics_filter is None:
+        metrics_filter = METRICS_FILTER
+
+    try:
+        lines = BACKEND.stream_query(metrics_filter.query_objects(), metrics_filter.query_metrics())
+    except COLLECTION_ERRORS as e:
+        yield f"# Error fetching VBox metrics: {str(e)}\n"
+        return
+
+    metrics = []
+    try:
+        # The VM listing runs while metrics query starts producing output
+        fresh = VM_INVENTORY.is_fresh()
+        vm_info = VM_INVENTORY.get() if fresh else VM_INVENTORY.update(get_vm_info())
+
+        size = 0
+        filter_lines = metrics_filter.needs_output_filter()
+        for raw_line in lines:
+            if filter_lines and not metrics_filter.filter_output(raw_line).strip():
+                continue
+            line = raw_line.decode().rstrip('\n')
+            if fresh:
+                object_name = line.split(None, 1)[:1]
+                if object_name and object_name[0] not in vm_info and object_name[0] not in ("host", "Object"):
+                    vm_info = VM_INVENTORY.resolve(object_name, vm_info)
+            count = len(metrics)
+            process_metric_line(line, metrics, vm_info)
+            if len(metrics) != count:
+                size += len(metrics[-1]) + 1
+                if size >= STREAM_CHUNK_SIZE:
+                    yield '\n'.join(metrics) + '\n'
+                    metrics = []
+                    size = 0
+        if VM_DETAILS is not None:
+            metrics.extend(get_vm_detail_metrics(vm_info, metrics_filter))
+        if GUEST_PROPERTIES is not None:
+            metrics.extend(get_guest_property_metrics(vm_info, metrics_filter))
+        metrics.extend(get_exporter_metrics())
+        yield '\n'.join(metrics) + '\n'
+        SERIES_KEYS.retain(vm_info)
+    except COLLECTION_ERRORS as e:
+        if metrics:
+            yield '\n'.join(metrics) + '\n'
+        yield f"# Error fetching VBox metrics: {str(e)}\n"
+    finally:
+        lines.close()
+
+# Stream /metrics straight from VBoxManage output instead of buffering it
+STREAM = False
+
+def stream_snapshot(metrics_filter=None):
+    """Stream metrics for a scrape, joining a matching stream that is already in progress."""
+    key = ("stream", None if metrics_filter is None else metrics_filter.key)
+    return SCRAPE_FLIGHT.stream(lambda: stream_metrics(metrics_filter), key=key)
+
+class FederationTarget:
+    """A VirtualBox host collected through its own command runner."""
+
+    def __init__(self, host, runner):
+        self.host = host
+        self.backend = CliBackend(runner)
+        self.series_keys = SeriesKeyCache(host=host)
+        # Seconds the whole collection of this host may take; None waits indefinitely
+        self.timeout = runner.timeout
+
+def collect_target(target, metrics_filter, records=None):
+    """Collect and render the metrics of one federation target."""
+    metrics = [f'vbox_info{{hostname="{target.host}"}} 1']
+    vm_info = target.backend.list_vms()
+    output = target.backend.query_metrics(metrics_filter.query_objects(), metrics_filter.query_metrics())
+    parse_metrics_output(metrics_filter.filter_output(output), metrics, vm_info, target.series_keys, records)
+    target.series_keys.retain(vm_info)
+    return metrics
+
+def get_federated_metrics(metrics_filter, records=None):
+    """Collect every target concurrently and merge them into one exposition.
+
+    A failing target, or one not collected within its timeout of the scrape
+    starting, is reported with an error comment and vbox_exporter_target_up 0
+    without affecting the others.
+    """
+    start = time.perf_counter()
+    futures = []
+    for target in TARGETS:
+        target_records = []
+        futures.append((target, target_records,
+                        FEDERATION_EXECUTOR.submit(collect_target, target, metrics_filter, target_records)))
+    metrics = []
+    for target, target_records, future in futures:
+        timeout = None
+        if target.timeout is not None:
+            timeout = max(0.0, start + target.timeout - time.perf_counter())
+        try:
+            metrics.extend(future.result(timeout=timeout))
+            if records is not None:
+                records.extend(target_records)
+            up = 1
+        except FuturesTimeoutError:
+            future.cancel()
+            metrics.append(f"# Error fetching VBox metrics from {target.host}: "
+                           f"collection timed out after {target.timeout}s")
+            up = 0
+        except COLLECTION_ERRORS as e:
+            metrics.append(f"# Error fetching VBox metrics from {target.host}: {str(e)}")
+            up = 0
+        metrics.append(f'vbox_exporter_target_up{{host="{target.host}"}} {up}')
+    STATS.observe("vbox_exporter_scrape_duration_seconds", time.perf_counter() - start)
+    metrics.extend(get_exporter_metrics())
+    return '\n'.join(metrics) + '\n'
+
+# Remote hosts to collect instead of the local one; empty for local collection
+TARGETS = []
+
+# vm and vm_uuid labels of a VM series
+VM_LABELS_PATTERN = re.compile(r'[{,]vm="([^"]*)"(?:,vm_uuid="([^"]*)")?')
+
+class MetricsSnapshot:
+    """Rendered exposition text together with the time it was collected."""
+
+    def __init__(self, text, timestamp=None, records=None):
+        self.text = text
+        self.body = text.encode()
+        self.timestamp = time.time() if timestamp is None else timestamp
+        # (series details, value) pairs kept by the parser for /api/metrics, if any
+        self.records = records
+
+    def age(self):
+        """Seconds elapsed since the snapshot was collected."""
+        return max(0.0, time.time() - self.timestamp)
+
+    @cached_property
+    def failed(self):
+        """Whether the collection failed and the text is only an error comment."""
+        return self.text.startswith("# Error fetching VBox metrics")
+
+    @cached_property
+    def shards(self):
+        """Per-object snapshots: "host" for host and exporter series, and each VM by name and UUID.
+
+        Built once per snapshot so per-object endpoints never re-filter the full text.
+        Snapshot timestamp and staleness series are repeated in every shard.
+        """
+        host, common, vms, uuids = [], [], {}, {}
+        for line in self.text.splitlines():
+            if not line or line[0] == '#':
+                continue
+            if line.startswith("vbox_exporter_snapshot_"):
+                common.append(line)
+                continue
+            match = VM_LABELS_PATTERN.search(line, 0, line.rfind('}') + 1)
+            if match is None:
+                host.append(line)
+            else:
+                vms.setdefault(match.group(1), []).append(line)
+                if match.group(2):
+                    uuids[match.group(2)] = match.group(1)
+        shards = {"host": MetricsSnapshot('\n'.join(host + common) + '\n', self.timestamp)}
+        vm_shards = {name: MetricsSnapshot('\n'.join(lines + common) + '\n', self.timestamp)
+                     for name, lines in vms.items()}
+        shards["vms"] = {**{uuid: vm_shards[name] for uuid, name in uuids.items()}, **vm_shards}
+        return shards
+
+    @cached_property
+    def columns(self):
+        """Parsed metrics query series as per-object columns for /api/metrics.
+
+        Maps "objects" to {object: {"metric", "labels", "value", "unit" lists}}
+        where the object is "host" or a VM name, and "uuids" to {vm uuid: name}.
+        Built from the parser's records, or in a --shared-snapshot worker from
+        the JSON body the collector process published with the snapshot.
+        """
+        if self.records is not None:
+            rows = ((details[0], details[1], details[2], value, details[3]) for details, value in self.records)
+        elif "api_body" in self.__dict__:
+            data = app.json.loads(self.api_body)
+            rows = zip(data["object"], data["metric"], data["labels"], data["value"], data["unit"])
+        else:
+            rows = ()
+        objects, uuids = {}, {}
+        for name, metric, labels, value, unit in rows:
+            if "vm_uuid" in labels:
+                uuids[labels["vm_uuid"]] = name
+            columns = objects.get(name)
+            if columns is None:
+                columns = objects[name] = {"metric": [], "labels": [], "value": [], "unit": []}
+            columns["metric"].append(metric)
+            columns["labels"].append(labels)
+            columns["value"].append(value)
+            columns["unit"].append(unit)
+        return {"objects": objects, "uuids": uuids}
+
+    def api_json(self, objects=None):
+        """Columnar JSON of the series for the given objects (VM names, UUIDs or
+        globs, and "host"), or of every object."""
+        if objects is None:
+            return self.api_body
+        parsed = self.columns
+        names = [name for name in parsed["objects"] if matches_any(name, objects)]
+        names += [name for uuid, name in parsed["uuids"].items()
+                  if name not in names and matches_any(uuid, objects)]
+        return self.render_api_json(names)
+
+    @cached_property
+    def api_body(self):
+        """Columnar JSON of every object, rendered once per snapshot."""
+        return self.render_api_json(list(self.columns["objects"]))
+
+    def render_api_json(self, names):
+        objects = self.columns["objects"]
+        columns = {"object": [], "metric": [], "labels": [], "value": [], "unit": []}
+        for name in names:
+            series = objects[name]
+            columns["object"].extend([name] * len(series["metric"]))
+            for column, values in series.items():
+                columns[column].extend(values)
+        return (app.json.dumps({"timestamp": self.timestamp, **columns}) + "\n").encode()
+
+    @cached_property
+    def gzipped(self):
+        """Gzip-compressed body, computed once per snapshot."""
+        return gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+
+    @cached_property
+    def etag(self):
+        """Entity tag identifying the body."""
+        return hashlib.blake2b(self.body, digest_size=16).hexdigest()
+
+# Compression level for gzip-encoded /metrics responses
+GZIP_LEVEL = 6
+
+class SeriesHistory:
+    """Fixed-size ring buffers of recent values for every exported series.
+
+    Values live in one flat array of doubles with capacity slots per series
+    and all series share one ring of collection timestamps, so memory is
+    bounded by max_series * capacity * 8 bytes plus the series keys. A
+    series not seen for a full window is evicted and its slot reused.
+    """
+
+    def __init__(self, capacity=60, max_series=10000):
+        self.capacity = capacity
+        self.max_series = max_series
+        # series key -> slot number
+        self._slots = {}
+        self._free = []
+        self._values = array('d')
+        self._last_seen = array('q')
+        self._timestamps = array('d', [math.nan]) * capacity
+        # Number of collections recorded so far
+        self._round = 0
+        # Series not stored because max_series was reached
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    @staticmethod
+    def parse_exposition(text):
+        """Return {series key: value} for the samples in exposition text.
+
+        Exporter self-metrics and comments are skipped; when a series appears
+        more than once (multi-sample timestamps, oldest first) the last, newest value wins.
+        """
+        values = {}
+        for line in text.splitlines():
+            if not line or line[0] == '#' or line.startswith('vbox_exporter_'):
+                continue
+            end = line.rfind('}') + 1
+            if end:
+                key, rest = line[:end], line[end:].split()
+            else:
+                key, *rest = line.split()
+            if rest:
+                try:
+                    values[key] = float(rest[0])
+                except ValueError:
+                    pass
+        return values
+
+    def record(self, text, timestamp=None):
+        """Add the values of one collection to the history."""
+        values = self.parse_exposition(text)
+        capacity = self.capacity
+        with self._lock:
+            current = self._round
+            position = current % capacity
+            self._timestamps[position] = time.time() if timestamp is None else timestamp
+            # Evict series absent for a full window before placing new ones
+            for key, slot in list(self._slots.items()):
+                if key in values:
+                    continue
+                if current - self._last_seen[slot] >= capacity:
+                    del self._slots[key]
+                    self._free.append(slot)
+                else:
+                    self._values[slot * capacity + position] = math.nan
+            for key, value in values.items():
+                slot = self._slots.get(key)
+                if slot is None:
+                    slot = self._allocate(key)
+                    if slot is None:
+                        self.dropped += 1
+                        continue
+                self._values[slot * capacity + position] = value
+                self._last_seen[slot] = current
+            self._round = current + 1
+
+    def _allocate(self, key):
+        if self._free:
+            slot = self._free.pop()
+            start = slot * self.capacity
+            self._values[start:start + self.capacity] = array('d', [math.nan]) * self.capacity
+        elif len(self._last_seen) < self.max_series:
+            slot = len(self._last_seen)
+            self._values.extend(array('d', [math.nan]) * self.capacity)
+            self._last_seen.append(0)
+        else:
+            return None
+        self._slots[key] = slot
+        return slot
+
+    def window(self, names=(), samples=None):
+        """Return (timestamps, {series key: values}) for the most recent samples, oldest first.
+
+        names optionally restricts the series to metric names matching any of
+        the given glob patterns. Missing samples are NaN.
+        """
+        capacity = self.capacity
+        with self._lock:
+            count = min(self._round, capacity, samples or capacity)
+            positions = [(self._round - count + i) % capacity for i in range(count)]
+            timestamps = [self._timestamps[position] for position in positions]
+            series = {}
+            for key, slot in self._slots.items():
+                if names and not matches_any(key.split('{', 1)[0], names):
+                    continue
+                start = slot * capacity
+                series[key] = [self._values[start + position] for position in positions]
+        return timestamps, series
+
+# Recent values per series; None disables history (--history)
+HISTORY = None
+
+def snapshot_response(snapshot, headers=None):
+    """Build a /metrics response for a snapshot, honouring ETags and gzip."""
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    gzipped = request.accept_encodings.quality("gzip") > 0
+    # The gzip and identity bodies are different representations, so each gets its own tag
+    gzip_etag = f"{snapshot.etag}-gzip"
+    headers["ETag"] = f'"{gzip_etag if gzipped else snapshot.etag}"'
+    if request.if_none_match.contains(snapshot.etag) or request.if_none_match.contains(gzip_etag):
+        return Response(status=304, headers=headers)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return Response(snapshot.gzipped, mimetype='text/plain', headers=headers)
+    return Response(snapshot.body, mimetype='text/plain', headers=headers)
+
+class MetricsCollector:
+    """Background worker that keeps a pre-rendered metrics snapshot fresh."""
+
+    def __init__(self, interval, max_interval=None):
+        self.interval = interval
+        self.max_interval = max_interval or interval * 8
+        # Wait before the next refresh, stretched while collections fail or are slow
+        self.current_interval = interval
+        # Whether the latest refresh failed to collect
+        self.failed = False
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def running(self):
+        """Whether the collector thread is running in this process."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def refresh(self):
+        """Collect metrics now and replace the cached snapshot.
+
+        A failed collection keeps serving the last good snapshot, marked stale.
+        """
+        with self._lock:
+            snapshot = collect_snapshot()
+            self.failed = snapshot.failed
+            if snapshot.failed and LAST_GOOD_SNAPSHOT is not None:
+                snapshot = stale_snapshot()
+            text = snapshot.text
+            text += f'vbox_exporter_snapshot_timestamp_seconds{{host="{HOSTNAME}"}} {snapshot.timestamp}\n'
+            text += f'vbox_exporter_collect_interval_seconds{{host="{HOSTNAME}"}} {self.current_interval}\n'
+            self._snapshot = MetricsSnapshot(text, snapshot.timestamp, snapshot.records)
+            if SHARED_SNAPSHOT is not None and not SHARED_SNAPSHOT.write(self._snapshot):
+                app.logger.error("Snapshot of %d bytes does not fit in the shared buffer", len(self._snapshot.body))
+            return self._snapshot
+
+    def next_interval(self, duration, failed):
+        """Double the wait while collections fail or use over half of it; halve it back once they are fast."""
+        if failed or duration > self.current_interval / 2:
+            return min(self.current_interval * 2, self.max_interval)
+        return max(self.interval, self.current_interval / 2)
+
+    def get_snapshot(self):
+        """Return the latest snapshot, collecting one first if none exists yet."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshot
+            if snapshot is None:
+                snapshot = self.refresh()
+        return snapshot
+
+    def _run(self):
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            try:
+                self.refresh()
+                failed = self.failed
+            except Exception as e:
+                app.logger.error("Background metrics collection failed: %s", e)
+                failed = True
+            self.current_interval = self.next_interval(time.perf_counter() - start, failed)
+            self._stop.wait(self.current_interval)
+
+    def start(self):
+        """Start the collector thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="vbox-collector", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the collector thread and wait for it to exit."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+# Background collector; None means metrics are collected on every scrape
+COLLECTOR = None
+
+class SharedSnapshot:
+    """Rendered snapshot published through anonymous shared memory.
+
+    Created before the collector process and the server's workers are
+    forked, so the collector process writes and every worker reads the
+    same buffer. A generation counter at
+    the start works as a seqlock: it is odd while a write is in progress and
+    readers retry until they see the same even value before and after
+    copying, for at most READ_TIMEOUT seconds; a write that never finishes,
+    because the collector process died during it, leaves readers with the
+    snapshot they read last. Each worker copies the body, its gzip encoding and the
+    /api/metrics JSON once per generation, never per request, and never
+    compresses, renders or collects itself.
+    """
+
+    # generation, collection timestamp, body length, gzip length, JSON length, ETag
+    HEADER = struct.Struct("<QdQQQ32s")
+
+    # Seconds a reader waits for a write in progress to finish
+    READ_TIMEOUT = 1.0
+
+    def __init__(self, size):
+        self._buffer = mmap.mmap(-1, size)
+        self._lock = threading.Lock()
+        # (generation, MetricsSnapshot) last read by this process
+        self._cached = None
+        # Odd generation whose write did not finish within READ_TIMEOUT
+        self._abandoned = None
+
+    @property
+    def generation(self):
+        return struct.unpack_from("<Q", self._buffer, 0)[0]
+
+    def write(self, snapshot):
+        """Publish a snapshot; returns False if it does not fit in the buffer."""
+        body, gzipped, api_body = snapshot.body, snapshot.gzipped, snapshot.api_body
+        start = self.HEADER.size
+        gzip_start = start + len(body)
+        api_start = gzip_start + len(gzipped)
+        if api_start + len(api_body) > len(self._buffer):
+            return False
+        with self._lock:
+            generation = self.generation
+            struct.pack_into("<Q", self._buffer, 0, generation + 1)
+            self._buffer[start:gzip_start] = body
+            self._buffer[gzip_start:api_start] = gzipped
+            self._buffer[api_start:api_start + len(api_body)] = api_body
+            self.HEADER.pack_into(self._buffer, 0, generation + 1, snapshot.timestamp, len(body),
+                                  len(gzipped), len(api_body), snapshot.etag.encode())
+            struct.pack_into("<Q", self._buffer, 0, generation + 2)
+        return True
+
+    def read(self):
+        """Return the published snapshot, or None if nothing has been written yet."""
+        cached = self._cached
+        if cached is not None and cached[0] == self.generation:
+            return cached[1]
+        start = self.HEADER.size
+        deadline = time.monotonic() + self.READ_TIMEOUT
+        while True:
+            generation, timestamp, body_length, gzip_length, api_length, etag = \
+                self.HEADER.unpack_from(self._buffer, 0)
+            if generation == 0:
+                return None
+            if generation % 2:
+                if generation != self._abandoned and time.monotonic() < deadline:
+                    time.sleep(0)
+                    continue
+                if generation != self._abandoned:
+                    app.logger.warning("Shared snapshot write %d did not finish; serving the last read", generation)
+                    self._abandoned = generation
+                return None if cached is None else cached[1]
+            gzip_start = start + body_length
+            api_start = gzip_start + gzip_length
+            body = self._buffer[start:gzip_start]
+            gzipped = self._buffer[gzip_start:api_start]
+            api_body = self._buffer[api_start:api_start + api_length]
+            if self.generation == generation:
+                break
+        snapshot = MetricsSnapshot(body.decode(), timestamp)
+        # Reuse the writer's encodings instead of recomputing them per worker
+        snapshot.__dict__["gzipped"] = gzipped
+        snapshot.__dict__["etag"] = etag.decode()
+        snapshot.__dict__["api_body"] = api_body
+        self._cached = (generation, snapshot)
+        return snapshot
+
+# Shared snapshot buffer of a --shared-snapshot deployment; None otherwise
+SHARED_SNAPSHOT = None
+
+def fork_background_process(start):
+    """Fork a child that runs start() and then lives as long as this process.
+
+    Keeps the background collector and pusher threads out of a preforking
+    server's master: a process forked while other threads run inherits
+    their locks in whatever state they were, without the threads. Returns
+    the child's pid.
+    """
+    parent = os.getpid()
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 1
+    try:
+        start()
+        while os.getppid() == parent:
+            time.sleep(1)
+        status = 0
+    except Exception:
+        app.logger.exception("Background process failed")
+    finally:
+        os._exit(status)
+
+def run_background_workers():
+    """Start the shared collector and the pusher in the background process."""
+    if SHARED_SNAPSHOT is not None:
+        COLLECTOR.start()
+    if PUSHER is not None:
+        PUSHER.start()
+
+def collector_snapshot():
+    """Latest background snapshot, from shared memory when workers share one collector."""
+    if SHARED_SNAPSHOT is not None:
+        return SHARED_SNAPSHOT.read()
+    return COLLECTOR.get_snapshot()
+
+class PushError(Exception):
+    """Raised when a push could not be delivered and may be retried."""
+
+class PushRejected(PushError):
+    """Raised when the receiver refused a push; retrying the same body will not help."""
+
+class PushClient:
+    """Sends snapshots to a Pushgateway-compatible endpoint over one keep-alive connection.
+
+    Each push replaces the /metrics/job/<job>/instance/<instance> group.
+    """
+
+    def __init__(self, url, job="vbox", instance=None, timeout=10):
+        parts = urllib.parse.urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.netloc = parts.netloc
+        self.timeout = timeout
+        self.path = (f"{parts.path.rstrip('/')}/metrics/job/{urllib.parse.quote(job, safe='')}"
+                     f"/instance/{urllib.parse.quote(instance or HOSTNAME, safe='')}")
+        self._connection = None
+
+    def push(self, snapshot):
+        """PUT a snapshot, reconnecting only if the previous connection was closed."""
+        if self._connection is None:
+            connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self._connection = connection_class(self.netloc, timeout=self.timeout)
+        try:
+            self._connection.request("PUT", self.path, body=snapshot.body,
+                                     headers={"Content-Type": "text/plain; version=0.0.4"})
+            response = self._connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.close()
+            raise PushError(f"push to {self.netloc} failed: {e}") from e
+        if response.will_close:
+            self.close()
+        if 400 <= response.status < 500:
+            raise PushRejected(f"push to {self.netloc} rejected with HTTP {response.status}")
+        if response.status >= 300:
+            raise PushError(f"push to {self.netloc} failed with HTTP {response.status}")
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+class Pusher:
+    """Collects on an interval and delivers snapshots through a bounded queue.
+
+    When the background collector runs in this process, its snapshots are
+    pushed instead, each at most once, so pushing adds no collections.
+
+    When the receiver is down, snapshots wait in the queue (the oldest are
+    dropped once it is full) and delivery is retried with exponential
+    backoff. After an outage, up to batch_size queued snapshots are sent
+    back to back on the same connection.
+    """
+
+    def __init__(self, client, interval, queue_size=10, batch_size=5, max_backoff=60):
+        self.client = client
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.queue = collections.deque(maxlen=queue_size)
+        self.pushed = 0
+        self.failures = 0
+        self.dropped = 0
+        # Last collector snapshot queued, so it is not pushed twice
+        self._last = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def enqueue(self, snapshot):
+        """Queue a snapshot for delivery, dropping the oldest if the queue is full."""
+        with self._cond:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(snapshot)
+            self._cond.notify()
+
+    def deliver(self):
+        """Send up to batch_size queued snapshots, oldest first.
+
+        Returns False if the receiver could not be reached and delivery
+        should be retried later.
+        """
+        for _ in range(self.batch_size):
+            with self._cond:
+                if not self.queue:
+                    return True
+                snapshot = self.queue[0]
+            try:
+                self.client.push(snapshot)
+                self.pushed += 1
+            except PushRejected as e:
+                app.logger.error("Dropping rejected push: %s", e)
+                self.dropped += 1
+            except PushError as e:
+                app.logger.warning("%s", e)
+                self.failures += 1
+                return False
+            with self._cond:
+                if self.queue and self.queue[0] is snapshot:
+                    self.queue.popleft()
+        return True
+
+    def next_backoff(self, backoff):
+        """Seconds to wait before retrying after another failed delivery."""
+        return min(max(backoff * 2, 1), self.max_backoff)
+
+    def render(self):
+        """Render the push counters as exporter self-metrics."""
+        return [
+            f'vbox_exporter_pushes_total{{host="{HOSTNAME}"}} {self.pushed}',
+            f'vbox_exporter_push_failures_total{{host="{HOSTNAME}"}} {self.failures}',
+            f'vbox_exporter_push_dropped_total{{host="{HOSTNAME}"}} {self.dropped}',
+            f'vbox_exporter_push_queue_length{{host="{HOSTNAME}"}} {len(self.queue)}',
+        ]
+
+    def next_snapshot(self):
+        """Return the next snapshot to push, or None if there is nothing new."""
+        if COLLECTOR is None or not COLLECTOR.running:
+            return collect_snapshot()
+        snapshot = COLLECTOR.snapshot
+        if snapshot is self._last or COLLECTOR.failed:
+            return None
+        return snapshot
+
+    def _collect_loop(self):
+        while not self._stop.is_set():
+            try:
+                snapshot = self.next_snapshot()
+                if snapshot is not None and not snapshot.failed:
+                    self._last = snapshot
+                    self.enqueue(snapshot)
+            except Exception as e:
+                app.logger.error("Metrics collection for push failed: %s", e)
+            self._stop.wait(self.interval)
+
+    def _send_loop(self):
+        backoff = 0
+        while not self._stop.is_set():
+            with self._cond:
+                while not self.queue and not self._stop.is_set():
+                    self._cond.wait()
+            if self.deliver():
+                backoff = 0
+            else:
+                backoff = self.next_backoff(backoff)
+                self._stop.wait(backoff)
+
+    def start(self):
+        """Start the collection and delivery threads."""
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._collect_loop, name="vbox-push-collect", daemon=True),
+                         threading.Thread(target=self._send_loop, name="vbox-push-send", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop both threads, wait for them and close the connection."""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.client.close()
+
+# Push mode worker; None unless --push-url is given
+PUSHER = None
+
 @app.route('/')
 def index():
     response = {
@@ -161,11 +2352,335 @@ def index():
 
 @app.route('/metrics')
 def metrics():
-    return Response(get_metrics(), mimetype='text/plain')
+    objects = split_params(request.args.getlist('vm'))
+    metric_patterns = split_params(request.args.getlist('metric'))
+    invalid = [name for name in objects + metric_patterns if not valid_query_name(name)]
+    if invalid:
+        return Response(f"# Invalid VM or metric name: {invalid[0]!r}\n", status=400, mimetype='text/plain')
+    if objects or metric_patterns:
+        if SHARED_SNAPSHOT is not None:
+            # Workers never collect; one object's series are served from the shared snapshot instead
+            return Response("# vm and metric parameters are not supported with --shared-snapshot; "
+                            "use /metrics/host or /metrics/vm/<vm>\n", status=400, mimetype='text/plain')
+        # Narrowed scrapes are collected on demand with the filter pushed down
+        metrics_filter = METRICS_FILTER.narrow(objects, metric_patterns)
+        if STREAM and COLLECTOR is None and not TARGETS:
+            return Response(stream_snapshot(metrics_filter), mimetype='text/plain')
+        return snapshot_response(collect_snapshot(metrics_filter))
+
+    if COLLECTOR is None:
+        if STREAM and not TARGETS:
+            return Response(stream_snapshot(), mimetype='text/plain')
+        return snapshot_response(serve_snapshot())
+
+    snapshot = collector_snapshot()
+    if snapshot is None:
+        return Response("# No metrics collected yet\n", status=503, mimetype='text/plain')
+    age = snapshot.age()
+    return snapshot_response(snapshot, {"Age": str(int(age)), "X-Metrics-Age": f"{age:.3f}"})
+
+@app.route('/metrics/history')
+def metrics_history():
+    if HISTORY is None:
+        return jsonify({"error": "history is disabled; start with --history N"}), 404
+    if SHARED_SNAPSHOT is not None:
+        # History is recorded by the collector process, not by the workers serving requests
+        return jsonify({"error": "history is not served with --shared-snapshot"}), 404
+    try:
+        samples = int(request.args.get('samples', 0)) or None
+    except ValueError:
+        return jsonify({"error": "samples must be an integer"}), 400
+    timestamps, series = HISTORY.window(split_params(request.args.getlist('name')), samples)
+    return jsonify({
+        "timestamps": timestamps,
+        "series": [{"series": key, "values": [None if math.isnan(v) else v for v in values],
+                    **window_change(timestamps, values)}
+                   for key, values in series.items()],
+    })
+
+def window_change(timestamps, values):
+    """Delta and per-second rate between the first and last values of a window."""
+    present = [(t, v) for t, v in zip(timestamps, values) if not math.isnan(v)]
+    if len(present) < 2:
+        return {"delta": None, "rate": None}
+    (first_time, first), (last_time, last) = present[0], present[-1]
+    delta = last - first
+    return {"delta": delta, "rate": delta / (last_time - first_time) if last_time > first_time else None}
+
+@app.route('/metrics/host')
+def host_metrics():
+    return shard_response("host")
+
+@app.route('/metrics/vm/<vm>')
+def vm_metrics(vm):
+    return shard_response("vms", vm)
+
+def shard_response(kind, name=None):
+    """Serve one object's shard of the current unfiltered snapshot."""
+    snapshot = serve_snapshot() if COLLECTOR is None else collector_snapshot()
+    if snapshot is None:
+        return Response("# No metrics collected yet\n", status=503, mimetype='text/plain')
+    if snapshot.failed:
+        return snapshot_response(snapshot)
+    shard = snapshot.shards[kind] if name is None else snapshot.shards[kind].get(name)
+    if shard is None:
+        return Response(f"# No metrics for VM {name}\n", status=404, mimetype='text/plain')
+    if COLLECTOR is None:
+        return snapshot_response(shard)
+    age = shard.age()
+    return snapshot_response(shard, {"Age": str(int(age)), "X-Metrics-Age": f"{age:.3f}"})
+
+@app.route('/api/metrics')
+def api_metrics():
+    snapshot = serve_snapshot() if COLLECTOR is None else collector_snapshot()
+    if snapshot is None:
+        return jsonify({"error": "no metrics collected yet"}), 503
+    if snapshot.failed:
+        return jsonify({"error": snapshot.text.splitlines()[0].lstrip("# ")}), 503
+    objects = split_params(request.args.getlist('vm'))
+    headers = {}
+    if COLLECTOR is not None:
+        age = snapshot.age()
+        headers = {"Age": str(int(age)), "X-Metrics-Age": f"{age:.3f}"}
+    return Response(snapshot.api_json(objects or None), mimetype='application/json', headers=headers)
+
+def split_params(values):
+    """Flatten repeated and comma-separated query parameter values."""
+    return [item for value in values for item in value.split(',') if item]
+
+# Characters a requested VM or metric name may not contain
+UNSAFE_NAME_PATTERN = re.compile(r'[;&|$`<>\\\'"\n\r\x00]')
+
+def valid_query_name(name):
+    """Whether a requested VM or metric name is safe to pass to VBoxManage.
+
+    Names become VBoxManage arguments, run through a shell on federated hosts,
+    so options and shell metacharacters are refused.
+    """
+    return not name.startswith('-') and UNSAFE_NAME_PATTERN.search(name) is None
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    """Standard library WSGI server handling each request on its own thread."""
+    daemon_threads = True
+
+def make_stdlib_server(host, port):
+    """Create a standard-library-only threaded HTTP server for the app."""
+    return make_server(host, port, app, server_class=ThreadingWSGIServer)
+
+def run_gunicorn(host, port, workers, threads, keepalive, post_fork=None):
+    """Serve the app with gunicorn's prefork (gthread) workers."""
+    from gunicorn.app.base import BaseApplication
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread",
+        "keepalive": keepalive,
+    }
+    if post_fork is not None:
+        options["post_fork"] = post_fork
+
+    class ExporterApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    ExporterApplication().run()
+
+def run_server(server, host, port, workers=2, threads=8, keepalive=5, post_fork=None):
+    """Serve the app with the selected HTTP server until interrupted."""
+    if server == 'stdlib':
+        make_stdlib_server(host, port).serve_forever()
+    elif server == 'waitress':
+        import waitress
+        waitress.serve(app, host=host, port=port, threads=threads, channel_timeout=keepalive)
+    elif server == 'gunicorn':
+        run_gunicorn(host, port, workers, threads, keepalive, post_fork)
+    else:
+        app.run(host=host, port=port, threaded=True)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='VirtualBox Prometheus Exporter')
     parser.add_argument('--port', type=int, default=9200, help='Port to serve metrics on')
+    parser.add_argument('--collect-interval', type=float, default=0,
+                        help='Refresh metrics in the background every N seconds (0 collects on each scrape)')
+    parser.add_argument('--max-collect-interval', type=float, default=0,
+                        help='Longest wait between background refreshes while VBoxManage is slow or failing '
+                             '(default 8 times --collect-interval)')
+    parser.add_argument('--command-timeout', type=float, default=30,
+                        help='Kill a local VBoxManage command and its children after N seconds (0 never)')
+    parser.add_argument('--scrape-timeout', type=float, default=0,
+                        help='Serve the last good snapshot when a collection takes longer than N seconds (0 waits)')
+    parser.add_argument('--push-url', metavar='URL',
+                        help='Also push metrics to this Pushgateway-compatible endpoint, e.g. http://pushgateway:9091')
+    parser.add_argument('--push-interval', type=float, default=15, help='Seconds between pushes')
+    parser.add_argument('--push-job', default='vbox', help='Job name of the pushed group')
+    parser.add_argument('--push-queue', type=int, default=10,
+                        help='Snapshots kept for delivery while the receiver is down')
+    parser.add_argument('--push-batch', type=int, default=5,
+                        help='Queued snapshots sent back to back once the receiver is reachable again')
+    parser.add_argument('--shared-snapshot', action='store_true',
+                        help='Collect in one process and serve every worker from a shared-memory snapshot '
+                             '(requires --collect-interval)')
+    parser.add_argument('--shared-snapshot-size', type=float, default=64,
+                        help='Size of the shared snapshot buffer in MiB')
+    parser.add_argument('--backend', choices=['cli', 'api', 'fake'], default='cli',
+                        help='Collect through VBoxManage (cli), the VirtualBox API (api) or canned data (fake)')
+    parser.add_argument('--include-vm', action='append', default=[], metavar='NAME',
+                        help='Only collect these objects (VM name, UUID, "host" or glob); repeatable')
+    parser.add_argument('--exclude-vm', action='append', default=[], metavar='PATTERN',
+                        help='Never collect objects matching this glob; repeatable')
+    parser.add_argument('--include-metric', action='append', default=[], metavar='PATTERN',
+                        help='Only collect VBox metrics matching this pattern, e.g. "CPU/Load/*"; repeatable')
+    parser.add_argument('--exclude-metric', action='append', default=[], metavar='PATTERN',
+                        help='Never collect VBox metrics matching this glob; repeatable')
+    parser.add_argument('--target', action='append', default=[], metavar='HOST',
+                        help='Collect this remote host instead of the local one (repeatable)')
+    parser.add_argument('--runner', choices=['ssh', 'replay'], default='ssh',
+                        help='How --target hosts are reached: ssh, or replay of recorded output for testing')
+    parser.add_argument('--target-timeout', type=float, default=10,
+                        help='Seconds a --target host may take to collect, and each of its VBoxManage commands may run')
+    parser.add_argument('--target-workers', type=int, default=8,
+                        help='Maximum --target hosts collected at once')
+    parser.add_argument('--ssh-option', action='append', default=[], metavar='OPTION',
+                        help='Extra ssh -o option for --runner ssh, e.g. User=vbox (repeatable)')
+    parser.add_argument('--replay-dir', default='fixtures',
+                        help='Directory holding one fixture directory per host for --runner replay')
+    parser.add_argument('--samples', type=int, default=0,
+                        help='Configure VirtualBox to keep N samples per metric at startup (0 leaves it unchanged)')
+    parser.add_argument('--sample-period', type=int, default=1,
+                        help='Whole seconds between samples when --samples is set')
+    parser.add_argument('--sample-mode', choices=['last', 'timestamps', 'rollup'], default='last',
+                        help='Expose multi-sample metrics as the latest value, every sample with its '
+                             'timestamp, or the latest value plus min/max/avg')
+    parser.add_argument('--vm-details', action='store_true',
+                        help='Add state, OS type, CPU, memory and group series from VBoxManage showvminfo')
+    parser.add_argument('--vm-details-ttl', type=float, default=600,
+                        help='Seconds to cache showvminfo details unless the VM settings file changes')
+    parser.add_argument('--guest-properties', action='store_true',
+                        help='Add vbox_guest_* series from the guest properties of running VMs')
+    parser.add_argument('--guest-properties-ttl', type=float, default=60,
+                        help='Seconds between background refreshes of guest properties')
+    parser.add_argument('--guest-properties-timeout', type=float, default=10,
+                        help='Seconds guestproperty enumerate may run for one VM')
+    parser.add_argument('--history', type=int, default=0, metavar='N',
+                        help='Keep the last N collected values of every series for /metrics/history (0 disables)')
+    parser.add_argument('--history-max-series', type=int, default=10000,
+                        help='Maximum series kept by --history')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream /metrics while VBoxManage output is read (ignored with --collect-interval)')
+    parser.add_argument('--parser', choices=['bulk', 'lines'], default='bulk',
+                        help='Engine used to parse VBoxManage metrics output')
+    parser.add_argument('--inventory-ttl', type=float, default=300,
+                        help='Seconds to cache the VM list between full refreshes (0 disables caching)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print a per-stage timing breakdown of every collection to stderr')
+    parser.add_argument('--server', choices=['dev', 'stdlib', 'waitress', 'gunicorn'], default='dev',
+                        help='HTTP server: Flask development server, standard library threaded server, '
+                             'waitress (threaded) or gunicorn (prefork)')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes for --server gunicorn')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='Request threads per worker for --server waitress and gunicorn')
+    parser.add_argument('--keepalive', type=int, default=5,
+                        help='Seconds to keep idle connections open for --server waitress and gunicorn')
     args = parser.parse_args()
 
-    app.run(host='0.0.0.0', port=args.port)
+    if args.backend == 'api':
+        try:
+            BACKEND = VirtualBoxApiBackend()
+        except CollectionError as e:
+            parser.error(str(e))
+    elif args.backend == 'fake':
+        BACKEND = FakeBackend()
+
+    VM_INVENTORY.ttl = args.inventory_ttl
+    LOCAL_RUNNER.timeout = args.command_timeout or None
+    SCRAPE_TIMEOUT = args.scrape_timeout
+    if args.vm_details:
+        VM_DETAILS = VMDetailsCache(args.vm_details_ttl)
+    if args.guest_properties:
+        GUEST_PROPERTIES = GuestPropertyCache(args.guest_properties_ttl, args.guest_properties_timeout)
+    for host in args.target:
+        if args.runner == 'replay':
+            runner = ReplayRunner(os.path.join(args.replay_dir, host))
+        else:
+            options = [arg for option in args.ssh_option for arg in ("-o", option)]
+            runner = SshRunner(host, timeout=args.target_timeout, options=options)
+        TARGETS.append(FederationTarget(host, runner))
+    FEDERATION_EXECUTOR = ThreadPoolExecutor(max_workers=args.target_workers,
+                                             thread_name_prefix="vboxmanage-target")
+    METRICS_FILTER = MetricsFilter(args.include_vm, args.include_metric,
+                                   args.exclude_vm, args.exclude_metric)
+    SAMPLE_MODE = args.sample_mode
+    if args.sample_period < 1:
+        parser.error("--sample-period must be at least 1")
+    SAMPLE_PERIOD = args.sample_period
+    if args.samples > 0:
+        try:
+            BACKEND.setup_metrics(args.sample_period, args.samples,
+                                  METRICS_FILTER.query_objects(), METRICS_FILTER.query_metrics())
+        except COLLECTION_ERRORS as e:
+            parser.error(f"metrics setup failed: {e}")
+    PARSER = args.parser
+    if args.history > 0:
+        HISTORY = SeriesHistory(args.history, args.history_max_series)
+    STREAM = args.stream
+    if args.profile:
+        PROFILE_HOOK = print_stage_profile
+    # SIGHUP forces a full VM re-list on the next collection
+    signal.signal(signal.SIGHUP, invalidate_caches)
+
+    post_fork = None
+    if args.shared_snapshot:
+        if args.collect_interval <= 0:
+            parser.error("--shared-snapshot requires --collect-interval")
+        SHARED_SNAPSHOT = SharedSnapshot(int(args.shared_snapshot_size * 1024 * 1024))
+        # Collects in a separate process; workers only read the shared buffer
+        COLLECTOR = MetricsCollector(args.collect_interval, args.max_collect_interval)
+    elif args.collect_interval > 0:
+        COLLECTOR = MetricsCollector(args.collect_interval, args.max_collect_interval)
+        if args.server == 'gunicorn':
+            # Threads do not survive fork, so each worker starts its own collector
+            post_fork = lambda server, worker: COLLECTOR.start()
+        else:
+            COLLECTOR.start()
+
+    if args.push_url:
+        if args.sample_mode == 'timestamps':
+            # Pushgateway rejects pushed samples that carry timestamps
+            parser.error("--push-url cannot be combined with --sample-mode timestamps")
+        if args.server == 'gunicorn' and args.collect_interval > 0 and not args.shared_snapshot:
+            # The pusher runs outside the workers, so only a shared collector's snapshots can reach it
+            parser.error("--push-url with --server gunicorn and --collect-interval requires --shared-snapshot")
+        PUSHER = Pusher(PushClient(args.push_url, job=args.push_job), args.push_interval,
+                        queue_size=args.push_queue, batch_size=args.push_batch)
+
+    background_pid = None
+    if SHARED_SNAPSHOT is not None or (PUSHER is not None and args.server == 'gunicorn'):
+        # Fork before this process starts any thread, so gunicorn never forks workers from a threaded master
+        background_pid = fork_background_process(run_background_workers)
+        if SHARED_SNAPSHOT is not None:
+            # Wait for the first snapshot so workers do not start out answering 503
+            deadline = time.time() + 60
+            while SHARED_SNAPSHOT.generation == 0 and time.time() < deadline:
+                if os.waitpid(background_pid, os.WNOHANG)[0]:
+                    parser.error("the background collector process exited")
+                time.sleep(0.05)
+    elif PUSHER is not None:
+        PUSHER.start()
+
+    try:
+        run_server(args.server, '0.0.0.0', args.port, workers=args.workers,
+                   threads=args.threads, keepalive=args.keepalive, post_fork=post_fork)
+    except ImportError as e:
+        parser.error(f"--server {args.server} requires the {e.name} package")
+    finally:
+        if background_pid is not None:
+            try:
+                os.kill(background_pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
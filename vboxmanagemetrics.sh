@@ -6,4 +6,4 @@ cd /home/ian/Documents/src/vboxmanagemetrics
 
 source ./vboxmanagemetrics_env/bin/activate
 
-./vboxmanagemetrics.py
+./vboxmanagemetrics.py --server waitress